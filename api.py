@@ -1,25 +1,54 @@
 # backend/api.py
 
-from fastapi import FastAPI, HTTPException, Header, UploadFile, File
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-import os
+from fastapi import FastAPI, HTTPException, Header, UploadFile, File, Query, Request, Response
+from pydantic import BaseModel, EmailStr, field_validator
+from typing import Optional, List, Dict, Union, Literal
+from contextlib import asynccontextmanager
+from datetime import datetime
 from dotenv import load_dotenv
 from db_connection import (
     create_connection,
+    create_read_connection,
+    initialize_settori,
+    initialize_venditori,
+    initialize_modifiche,
+    initialize_idempotenza,
+    get_modifiche,
     add_venditore,
     add_settore,
     get_settori,
     search_venditori,
+    get_venditore,
+    colonne_proiezione,
+    COLONNE_RIEPILOGO,
     delete_venditore,
     update_venditore,
+    update_venditore_campi,
+    get_versione_venditore,
+    ConflittoVersione,
+    ValoriNonAmmessi,
+    VENDITORE_NON_TROVATO,
+    EMAIL_DUPLICATA,
+    delete_venditori,
+    update_venditori,
     verifica_note,
     backup_database_python,
-    restore_database_python
+    restore_database_python,
+    restore_dump_sql,
+    annulla_ripristino,
+    NESSUN_RIPRISTINO,
+    VERSIONE_SCHEMA
 )
 import logging
-from fastapi.responses import StreamingResponse
+import time
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from io import BytesIO
+from metrics import registro, RICHIESTE_HTTP, DURATA_HTTP
+from auth import autenticazione
+from idempotenza import idempotenza
+from coda_inserimenti import coda, valida_venditore
+from compressione_backup import risolvi_codec
+from verifica_backup import verifica_archivio
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,7 +56,47 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Crea le tabelle mancanti, incluso il registro modifiche alimentato da tutte le scritture
+    connection = create_connection()
+    if connection:
+        initialize_settori(connection)
+        initialize_venditori(connection)
+        initialize_modifiche(connection)
+        initialize_idempotenza(connection)
+        connection.close()
+    else:
+        logger.error("Impossibile connettersi al database all'avvio.")
+    # Coda degli inserimenti asincroni: riprende quelli rimasti nel giornale
+    coda.avvia()
+    yield
+    coda.ferma()
+
+app = FastAPI(lifespan=lifespan)
+
+# Idempotency-Key sulle scritture (vedi idempotenza.py): registrato per primo, quindi eseguito
+# dopo l'autenticazione, che fornisce il token a cui sono legate le chiavi
+app.middleware("http")(idempotenza)
+
+# Token e limiti per token (vedi auth.py); registrato prima delle metriche, che lo avvolgono
+# e contano anche le richieste rifiutate
+app.middleware("http")(autenticazione)
+
+@app.middleware("http")
+async def metriche_richieste(request: Request, call_next):
+    inizio = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Il template del percorso (es. /venditori/{venditore_id}) tiene bassa la cardinalità
+        route = request.scope.get("route")
+        percorso = route.path if route is not None else "non_trovata"
+        DURATA_HTTP.osserva(time.perf_counter() - inizio, request.method, percorso)
+        RICHIESTE_HTTP.inc(request.method, percorso, str(status))
 
 class Venditore(BaseModel):
     nome_cognome: str
@@ -42,25 +111,127 @@ class Venditore(BaseModel):
     cv: Optional[str] = None
     note: Optional[str] = None
 
+def _non_nullo(valore):
+    # Colonne NOT NULL nei corpi delle modifiche parziali, dove gli altri campi possono essere null
+    if valore is None:
+        raise ValueError("il campo è obbligatorio e non può essere null")
+    return valore
+
+# Corpo di PATCH /venditori/{id}: solo i campi da modificare
+class ModificaVenditore(BaseModel):
+    nome_cognome: Optional[str] = None
+    email: Optional[EmailStr] = None
+    telefono: Optional[str] = None
+    citta: Optional[str] = None
+    esperienza_vendita: Optional[int] = None
+    anno_nascita: Optional[int] = None
+    settore_esperienza: Optional[str] = None
+    partita_iva: Optional[Literal['Sì', 'No']] = None
+    agente_isenarco: Optional[Literal['Sì', 'No']] = None
+    cv: Optional[str] = None
+    note: Optional[str] = None
+
+    # Campi omessi = invariati; null esplicito solo per le colonne che lo ammettono
+    non_nullo = field_validator('nome_cognome', 'email', 'partita_iva')(_non_nullo)
+
+# Venditore restituito dalle letture: contiene solo i campi richiesti con 'fields'
+class VenditoreCampi(BaseModel):
+    id: Optional[int] = None
+    nome_cognome: Optional[str] = None
+    email: Optional[str] = None
+    telefono: Optional[str] = None
+    citta: Optional[str] = None
+    esperienza_vendita: Optional[int] = None
+    anno_nascita: Optional[int] = None
+    settore_esperienza: Optional[str] = None
+    partita_iva: Optional[str] = None
+    agente_isenarco: Optional[str] = None
+    cv: Optional[str] = None
+    note: Optional[str] = None
+    data_creazione: Optional[datetime] = None
+
+# Campi restituiti da GET /venditori senza 'fields' (quelli del modello Venditore)
+CAMPI_PREDEFINITI = tuple(Venditore.model_fields)
+
+class ConteggioFacetta(BaseModel):
+    valore: Optional[str] = None
+    conteggio: int
+
+# Risposta di GET /venditori con facets=true: risultati più conteggi per citta, settore, ecc.
+class VenditoriConFacette(BaseModel):
+    venditori: List[VenditoreCampi]
+    facette: Dict[str, List[ConteggioFacetta]]
+
+# Filtri per selezionare i venditori di una scrittura in blocco (gli stessi di GET /venditori)
+class FiltriVenditori(BaseModel):
+    nome: Optional[str] = None
+    citta: Optional[List[str]] = None
+    settore: Optional[List[str]] = None
+    partita_iva: Optional[str] = None
+    agente_isenarco: Optional[str] = None
+    esperienza_min: Optional[int] = None
+    esperienza_max: Optional[int] = None
+    anno_nascita_min: Optional[int] = None
+    anno_nascita_max: Optional[int] = None
+    data_creazione_da: Optional[datetime] = None
+    data_creazione_a: Optional[datetime] = None
+
+# Selezione di DELETE /venditori: ID, filtri o entrambi (i filtri restringono gli ID)
+class SelezioneVenditori(BaseModel):
+    ids: Optional[List[int]] = None
+    filtri: Optional[FiltriVenditori] = None
+
+# Valori assegnati da PATCH /venditori a tutti i venditori selezionati
+class ValoriVenditori(BaseModel):
+    telefono: Optional[str] = None
+    citta: Optional[str] = None
+    esperienza_vendita: Optional[int] = None
+    anno_nascita: Optional[int] = None
+    settore_esperienza: Optional[str] = None
+    partita_iva: Optional[Literal['Sì', 'No']] = None
+    agente_isenarco: Optional[Literal['Sì', 'No']] = None
+    cv: Optional[str] = None
+    note: Optional[str] = None
+
+    non_nullo = field_validator('partita_iva')(_non_nullo)
+
+class AggiornamentoVenditori(SelezioneVenditori):
+    valori: ValoriVenditori
+
 class Settore(BaseModel):
     nome: str
 
+class Modifica(BaseModel):
+    seq: int
+    operazione: str
+    venditore_id: Optional[int] = None
+    email: Optional[str] = None
+    data_modifica: datetime
+    venditore: Optional[Venditore] = None
+
+class Modifiche(BaseModel):
+    modifiche: List[Modifica]
+    ultimo_seq: int
+    altre: bool
+
 @app.get("/test")
 def test_endpoint():
     return {"status": "API is working!"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(registro.esporta(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+class InserimentoAccodato(BaseModel):
+    id: str
+    stato: str
+    messaggio: Optional[str] = None
+
 @app.post("/inserisci_venditore")
-def inserisci_venditore(venditore: Venditore, authorization: str = Header(None)):
-    # Autenticazione
-    expected_token = os.getenv('API_TOKEN')
-    if not expected_token:
-        logger.error("API_TOKEN non configurato.")
-        raise HTTPException(status_code=500, detail="API_TOKEN non configurato.")
-    
-    if not authorization or authorization != f"Bearer {expected_token}":
-        logger.warning(f"Tentativo di accesso non autorizzato con token: {authorization}")
-        raise HTTPException(status_code=403, detail="Accesso negato.")
-    
+def inserisci_venditore(venditore: Venditore, response: Response, prefer: Optional[str] = Header(None, description="'respond-async' per accodare l'inserimento e ricevere subito 202 con l'ID di tracciamento.")):
+    if prefer and "respond-async" in prefer.lower():
+        return _accoda_venditore(venditore, response)
+
     # Connessione al database
     connection = create_connection()
     if not connection:
@@ -101,18 +272,44 @@ def inserisci_venditore(venditore: Venditore, authorization: str = Header(None))
         logger.error(f"Errore nell'inserimento del venditore '{venditore.email}'.")
         raise HTTPException(status_code=500, detail="Errore nell'inserimento del venditore.")
 
+def _accoda_venditore(venditore, response):
+    """
+    Modalità asincrona di /inserisci_venditore: valida, scrive nel giornale della coda e conferma
+    con 202; l'inserimento avviene a blocchi in background (vedi coda_inserimenti.py).
+    """
+    venditore_data, errore = valida_venditore((
+        venditore.nome_cognome,
+        venditore.email,
+        venditore.telefono,
+        venditore.citta,
+        venditore.esperienza_vendita,
+        venditore.anno_nascita,
+        venditore.settore_esperienza,
+        venditore.partita_iva,
+        venditore.agente_isenarco,
+        venditore.cv if venditore.cv else "",
+        venditore.note.strip() if venditore.note else ""
+    ))
+    if errore:
+        raise HTTPException(status_code=400, detail=errore)
+    try:
+        id_inserimento = coda.accoda(venditore_data)
+    except (OSError, RuntimeError) as e:
+        logger.error(f"Impossibile accodare il venditore '{venditore.email}': {e}")
+        raise HTTPException(status_code=503, detail="Coda degli inserimenti non disponibile.")
+    response.status_code = 202
+    response.headers["Location"] = f"/inserimenti/{id_inserimento}"
+    return {"id": id_inserimento, "stato": "in_coda", "message": "Venditore accodato per l'inserimento."}
+
+@app.get("/inserimenti/{id_inserimento}", response_model=InserimentoAccodato)
+def stato_inserimento_endpoint(id_inserimento: str):
+    esito = coda.stato(id_inserimento)
+    if esito is None:
+        raise HTTPException(status_code=404, detail="Inserimento sconosciuto.")
+    return InserimentoAccodato(id=id_inserimento, **esito)
+
 @app.post("/aggiungi_settore")
-def aggiungi_settore_endpoint(settore: Settore, authorization: str = Header(None)):
-    # Autenticazione
-    expected_token = os.getenv('API_TOKEN')
-    if not expected_token:
-        logger.error("API_TOKEN non configurato.")
-        raise HTTPException(status_code=500, detail="API_TOKEN non configurato.")
-    
-    if not authorization or authorization != f"Bearer {expected_token}":
-        logger.warning(f"Tentativo di accesso non autorizzato con token: {authorization}")
-        raise HTTPException(status_code=403, detail="Accesso negato.")
-    
+def aggiungi_settore_endpoint(settore: Settore):
     # Connessione al database
     connection = create_connection()
     if not connection:
@@ -130,18 +327,9 @@ def aggiungi_settore_endpoint(settore: Settore, authorization: str = Header(None
         raise HTTPException(status_code=400, detail=f"Settore '{settore.nome}' già esistente.")
 
 @app.get("/settori", response_model=List[str])
-def get_settori_endpoint(authorization: str = Header(None)):
-    # Autenticazione
-    expected_token = os.getenv('API_TOKEN')
-    if not expected_token:
-        logger.error("API_TOKEN non configurato.")
-        raise HTTPException(status_code=500, detail="API_TOKEN non configurato.")
-    
-    if not authorization or authorization != f"Bearer {expected_token}":
-        logger.warning(f"Tentativo di accesso non autorizzato con token: {authorization}")
-        raise HTTPException(status_code=403, detail="Accesso negato.")
-    
-    connection = create_connection()
+def get_settori_endpoint(x_read_your_writes: bool = Header(False)):
+    # Sola lettura: replica, oppure primario se il client chiede di leggere le proprie scritture
+    connection = create_read_connection(read_your_writes=x_read_your_writes)
     if not connection:
         logger.error("Impossibile connettersi al database.")
         raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
@@ -150,54 +338,148 @@ def get_settori_endpoint(authorization: str = Header(None)):
     connection.close()
     return settori
 
-@app.get("/venditori", response_model=List[Venditore])
-def get_venditori_endpoint(nome: Optional[str] = None, citta: Optional[str] = None, settore: Optional[str] = None, partita_iva: Optional[str] = None, agente_isenarco: Optional[str] = None, authorization: str = Header(None)):
-    # Autenticazione
-    expected_token = os.getenv('API_TOKEN')
-    if not expected_token:
-        logger.error("API_TOKEN non configurato.")
-        raise HTTPException(status_code=500, detail="API_TOKEN non configurato.")
-    
-    if not authorization or authorization != f"Bearer {expected_token}":
-        logger.warning(f"Tentativo di accesso non autorizzato con token: {authorization}")
-        raise HTTPException(status_code=403, detail="Accesso negato.")
-    
-    connection = create_connection()
+def _campi_richiesti(fields, predefiniti):
+    """
+    Converte il parametro 'fields' (campi separati da virgola, oppure 'riepilogo') in una proiezione.
+    """
+    if not fields:
+        return predefiniti
+    if fields.strip() == "riepilogo":
+        return COLONNE_RIEPILOGO
+    try:
+        return colonne_proiezione(campo.strip() for campo in fields.split(",") if campo.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/venditori", response_model=Union[List[VenditoreCampi], VenditoriConFacette], response_model_exclude_unset=True)
+def get_venditori_endpoint(
+    nome: Optional[str] = None,
+    citta: Optional[List[str]] = Query(None, description="Una o più città (parametro ripetibile)."),
+    settore: Optional[List[str]] = Query(None, description="Uno o più settori (parametro ripetibile)."),
+    partita_iva: Optional[str] = None,
+    agente_isenarco: Optional[str] = None,
+    esperienza_min: Optional[int] = Query(None, ge=0),
+    esperienza_max: Optional[int] = Query(None, ge=0),
+    anno_nascita_min: Optional[int] = None,
+    anno_nascita_max: Optional[int] = None,
+    data_creazione_da: Optional[datetime] = None,
+    data_creazione_a: Optional[datetime] = None,
+    sort: Optional[str] = Query(None, description="Colonne di ordinamento separate da virgola, con '-' per l'ordine decrescente (es. '-data_creazione'). Predefinito: id."),
+    limit: Optional[int] = Query(None, ge=1, description="Numero massimo di venditori restituiti."),
+    fields: Optional[str] = Query(None, description="Campi da restituire separati da virgola, oppure 'riepilogo' (id, nome_cognome, citta, settore_esperienza)."),
+    facets: bool = Query(False, description="Se true restituisce {venditori, facette} con i conteggi per citta, settore_esperienza, partita_iva e agente_isenarco."),
+    x_read_your_writes: bool = Header(False)
+):
+    campi = _campi_richiesti(fields, CAMPI_PREDEFINITI)
+    ordina = [colonna.strip() for colonna in sort.split(",") if colonna.strip()] if sort else None
+
+    # Sola lettura: replica, oppure primario se il client chiede di leggere le proprie scritture
+    connection = create_read_connection(read_your_writes=x_read_your_writes)
     if not connection:
         logger.error("Impossibile connettersi al database.")
         raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
     
-    records = search_venditori(connection, nome, citta, settore, partita_iva, agente_isenarco)
+    try:
+        risultato = search_venditori(
+            connection, nome, citta, settore, partita_iva, agente_isenarco,
+            campi=campi, facette=facets, ordina=ordina, limite=limit,
+            esperienza_min=esperienza_min, esperienza_max=esperienza_max,
+            anno_nascita_min=anno_nascita_min, anno_nascita_max=anno_nascita_max,
+            data_creazione_da=data_creazione_da, data_creazione_a=data_creazione_a
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        connection.close()
+    records, facette = risultato if facets else (risultato, None)
+    venditori = [VenditoreCampi(**dict(zip(campi, record))) for record in records]
+    if not facets:
+        return venditori
+    return VenditoriConFacette(
+        venditori=venditori,
+        facette={
+            facetta: [ConteggioFacetta(valore=valore, conteggio=conteggio) for valore, conteggio in valori]
+            for facetta, valori in facette.items()
+        }
+    )
+
+def _etag(versione):
+    return f'"{versione}"'
+
+def _versione_da_etag(if_match):
+    """
+    Converte l'header If-Match (l'ETag di GET /venditori/{id}) nella versione attesa.
+    """
+    if if_match is None:
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match non valido: usare l'ETag restituito da GET /venditori/{id}.")
+
+@app.get("/venditori/{venditore_id}", response_model=VenditoreCampi, response_model_exclude_unset=True)
+def get_venditore_endpoint(venditore_id: int, response: Response, fields: Optional[str] = Query(None, description="Campi da restituire separati da virgola (predefinito: tutti)."), x_read_your_writes: bool = Header(False)):
+    campi = _campi_richiesti(fields, None)
+
+    # Sola lettura: replica, oppure primario se il client chiede di leggere le proprie scritture
+    connection = create_read_connection(read_your_writes=x_read_your_writes)
+    if not connection:
+        logger.error("Impossibile connettersi al database.")
+        raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
+
+    # Prima la versione, poi i dati: se nel mezzo arriva una scrittura l'ETag risulta vecchio
+    # e il PATCH successivo viene rifiutato, invece di sovrascrivere una modifica mai vista
+    versione = get_versione_venditore(connection, venditore_id)
+    record = get_venditore(connection, venditore_id, campi=campi)
     connection.close()
-    venditori = []
-    for record in records:
-        venditori.append(Venditore(
-            nome_cognome=record[1],
-            email=record[2],
-            telefono=record[3],
-            citta=record[4],
-            esperienza_vendita=record[5],
-            anno_nascita=record[6],
-            settore_esperienza=record[7],
-            partita_iva=record[8],
-            agente_isenarco=record[9],
-            cv=record[10],
-            note=record[11]
-        ))
-    return venditori
+    if record is None:
+        raise HTTPException(status_code=404, detail=VENDITORE_NON_TROVATO)
+    if versione is not None:
+        response.headers["ETag"] = _etag(versione)
+    return VenditoreCampi(**dict(zip(colonne_proiezione(campi), record)))
+
+@app.patch("/venditori/{venditore_id}", response_model=VenditoreCampi)
+def patch_venditore_endpoint(venditore_id: int, modifica: ModificaVenditore, response: Response, if_match: Optional[str] = Header(None)):
+    valori = modifica.model_dump(exclude_unset=True)
+    versione = _versione_da_etag(if_match)
+    connection = create_connection()
+    if not connection:
+        logger.error("Impossibile connettersi al database.")
+        raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
+
+    # Aggiungi settore se non esiste
+    settore = valori.get('settore_esperienza')
+    if settore and settore not in get_settori(connection):
+        if not add_settore(connection, settore):
+            logger.error(f"Errore nell'aggiungere il settore '{settore}'.")
+            connection.close()
+            raise HTTPException(status_code=500, detail=f"Errore nell'aggiungere il settore '{settore}'.")
+
+    try:
+        success, risultato = update_venditore_campi(connection, venditore_id, valori, versione=versione)
+    except ValoriNonAmmessi as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConflittoVersione as e:
+        logger.warning(f"Modifica del venditore ID {venditore_id} rifiutata: {e}")
+        raise HTTPException(status_code=412, detail=str(e), headers={"ETag": _etag(e.versione)})
+    finally:
+        connection.close()
+    if not success:
+        if risultato == VENDITORE_NON_TROVATO:
+            raise HTTPException(status_code=404, detail=risultato)
+        if risultato == EMAIL_DUPLICATA:
+            raise HTTPException(status_code=409, detail=risultato)
+        logger.error(f"Errore nell'aggiornare il venditore ID {venditore_id}: {risultato}")
+        raise HTTPException(status_code=500, detail=risultato)
+    riga, nuova_versione = risultato
+    logger.info(f"Venditore ID {venditore_id} aggiornato ({', '.join(valori)}).")
+    response.headers["ETag"] = _etag(nuova_versione)
+    return VenditoreCampi(**dict(zip(colonne_proiezione(), riga)))
 
 @app.delete("/venditori/{venditore_id}")
-def delete_venditore_endpoint(venditore_id: int, authorization: str = Header(None)):
-    # Autenticazione
-    expected_token = os.getenv('API_TOKEN')
-    if not expected_token:
-        logger.error("API_TOKEN non configurato.")
-        raise HTTPException(status_code=500, detail="API_TOKEN non configurato.")
-    
-    if not authorization or authorization != f"Bearer {expected_token}":
-        logger.warning(f"Tentativo di accesso non autorizzato con token: {authorization}")
-        raise HTTPException(status_code=403, detail="Accesso negato.")
-    
+def delete_venditore_endpoint(venditore_id: int):
     connection = create_connection()
     if not connection:
         logger.error("Impossibile connettersi al database.")
@@ -212,18 +494,66 @@ def delete_venditore_endpoint(venditore_id: int, authorization: str = Header(Non
         logger.error(f"Errore nell'eliminare il venditore ID {venditore_id}: {message}")
         raise HTTPException(status_code=500, detail=message)
 
+def _selezione(selezione):
+    """
+    ID e filtri di una scrittura in blocco, nel formato di delete_venditori/update_venditori.
+    """
+    filtri = selezione.filtri.model_dump(exclude_none=True) if selezione.filtri else None
+    return selezione.ids, filtri
+
+@app.delete("/venditori")
+def delete_venditori_endpoint(selezione: SelezioneVenditori):
+    ids, filtri = _selezione(selezione)
+    connection = create_connection()
+    if not connection:
+        logger.error("Impossibile connettersi al database.")
+        raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
+
+    try:
+        success, risultato = delete_venditori(connection, ids=ids, filtri=filtri)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        connection.close()
+    if success:
+        logger.info(f"{risultato} venditori eliminati in blocco.")
+        return {"eliminati": risultato}
+    else:
+        logger.error(f"Errore nell'eliminazione in blocco: {risultato}")
+        raise HTTPException(status_code=500, detail=risultato)
+
+@app.patch("/venditori")
+def update_venditori_endpoint(aggiornamento: AggiornamentoVenditori):
+    ids, filtri = _selezione(aggiornamento)
+    valori = aggiornamento.valori.model_dump(exclude_unset=True)
+    connection = create_connection()
+    if not connection:
+        logger.error("Impossibile connettersi al database.")
+        raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
+
+    # Aggiungi settore se non esiste
+    settore = valori.get('settore_esperienza')
+    if settore and settore not in get_settori(connection):
+        if not add_settore(connection, settore):
+            logger.error(f"Errore nell'aggiungere il settore '{settore}'.")
+            connection.close()
+            raise HTTPException(status_code=500, detail=f"Errore nell'aggiungere il settore '{settore}'.")
+
+    try:
+        success, risultato = update_venditori(connection, valori, ids=ids, filtri=filtri)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        connection.close()
+    if success:
+        logger.info(f"{risultato} venditori aggiornati in blocco.")
+        return {"aggiornati": risultato}
+    else:
+        logger.error(f"Errore nell'aggiornamento in blocco: {risultato}")
+        raise HTTPException(status_code=500, detail=risultato)
+
 @app.put("/venditori/{venditore_id}")
-def update_venditore_endpoint(venditore_id: int, venditore: Venditore, authorization: str = Header(None)):
-    # Autenticazione
-    expected_token = os.getenv('API_TOKEN')
-    if not expected_token:
-        logger.error("API_TOKEN non configurato.")
-        raise HTTPException(status_code=500, detail="API_TOKEN non configurato.")
-    
-    if not authorization or authorization != f"Bearer {expected_token}":
-        logger.warning(f"Tentativo di accesso non autorizzato con token: {authorization}")
-        raise HTTPException(status_code=403, detail="Accesso negato.")
-    
+def update_venditore_endpoint(venditore_id: int, venditore: Venditore):
     connection = create_connection()
     if not connection:
         logger.error("Impossibile connettersi al database.")
@@ -263,23 +593,24 @@ def update_venditore_endpoint(venditore_id: int, venditore: Venditore, authoriza
         raise HTTPException(status_code=500, detail=message)
 
 @app.post("/backup")
-def backup_database_endpoint(authorization: str = Header(None)):
-    # Autenticazione
-    expected_token = os.getenv('API_TOKEN')
-    if not expected_token:
-        logger.error("API_TOKEN non configurato.")
-        raise HTTPException(status_code=500, detail="API_TOKEN non configurato.")
-    
-    if not authorization or authorization != f"Bearer {expected_token}":
-        logger.warning(f"Tentativo di accesso non autorizzato con token: {authorization}")
-        raise HTTPException(status_code=403, detail="Accesso negato.")
-    
-    connection = create_connection()
+def backup_database_endpoint(codec: Optional[str] = Query(None), x_read_your_writes: bool = Header(False)):
+    # Codec non valido o pacchetto mancante: errore del client, prima di leggere il database
+    try:
+        risolvi_codec(codec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Sola lettura: replica, oppure primario se il client chiede di leggere le proprie scritture
+    connection = create_read_connection(read_your_writes=x_read_your_writes)
     if not connection:
         logger.error("Impossibile connettersi al database.")
         raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
     
-    success, backup_data = backup_database_python(connection)
+    success, backup_data = backup_database_python(
+        connection,
+        codec=codec,
+        crea_connessione=lambda: create_read_connection(read_your_writes=x_read_your_writes)
+    )
     connection.close()
     if success:
         backup_io = BytesIO(backup_data)
@@ -290,21 +621,25 @@ def backup_database_endpoint(authorization: str = Header(None)):
         logger.error(f"Errore durante il backup: {backup_data}")
         raise HTTPException(status_code=500, detail=f"Errore durante il backup: {backup_data}")
 
+@app.post("/backup/verify")
+def verify_backup_endpoint(file: UploadFile = File(...)):
+    # Nessun accesso al database: l'archivio viene letto a flusso dal file caricato
+    valido, rapporto = verifica_archivio(file.file, versione_schema=VERSIONE_SCHEMA)
+    if not valido:
+        logger.warning(f"Archivio di backup '{file.filename}' non valido: {rapporto['errori']}")
+    return {"valido": valido, **rapporto}
+
 @app.post("/restore")
-def restore_database_endpoint(file: UploadFile = File(...), authorization: str = Header(None)):
-    # Autenticazione
-    expected_token = os.getenv('API_TOKEN')
-    if not expected_token:
-        logger.error("API_TOKEN non configurato.")
-        raise HTTPException(status_code=500, detail="API_TOKEN non configurato.")
-    
-    if not authorization or authorization != f"Bearer {expected_token}":
-        logger.warning(f"Tentativo di accesso non autorizzato con token: {authorization}")
-        raise HTTPException(status_code=403, detail="Accesso negato.")
-    
+def restore_database_endpoint(file: UploadFile = File(...)):
     if not file.filename.endswith('.zip'):
         raise HTTPException(status_code=400, detail="Il file caricato deve essere un ZIP.")
-    
+
+    # Verifica prima di aprire la connessione: un archivio non valido non tocca il database
+    valido, rapporto = verifica_archivio(file.file, richiedi_manifest=False, versione_schema=VERSIONE_SCHEMA)
+    if not valido:
+        raise HTTPException(status_code=422, detail=f"Archivio di backup non valido: {' '.join(rapporto['errori'])}")
+    file.file.seek(0)
+
     connection = create_connection()
     if not connection:
         logger.error("Impossibile connettersi al database.")
@@ -312,7 +647,7 @@ def restore_database_endpoint(file: UploadFile = File(...), authorization: str =
     
     try:
         contents = file.file.read()
-        success, message = restore_database_python(connection, contents)
+        success, message = restore_database_python(connection, contents, verifica=False, crea_connessione=create_connection)
         connection.close()
         if success:
             return {"message": "Database ripristinato con successo."}
@@ -322,3 +657,81 @@ def restore_database_endpoint(file: UploadFile = File(...), authorization: str =
         logger.error(f"Errore durante il ripristino: {e}")
         connection.close()
         raise HTTPException(status_code=500, detail=f"Errore durante il ripristino: {e}")
+
+@app.post("/restore/sql")
+def restore_dump_endpoint(file: UploadFile = File(...)):
+    if not file.filename.endswith(('.sql', '.sql.gz')):
+        raise HTTPException(status_code=400, detail="Il file caricato deve essere un dump SQL (.sql o .sql.gz).")
+
+    connection = create_connection()
+    if not connection:
+        logger.error("Impossibile connettersi al database.")
+        raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
+
+    def progresso(byte_letti, istruzioni):
+        logger.info(f"Ripristino di {file.filename}: {byte_letti / 2 ** 20:.1f} MiB letti, {istruzioni} istruzioni eseguite.")
+
+    try:
+        # Il file caricato viene letto a flusso, senza copiarlo in memoria
+        success, message = restore_dump_sql(connection, file.file, progresso=progresso)
+    finally:
+        connection.close()
+    if not success:
+        raise HTTPException(status_code=500, detail=message)
+    logger.info(message)
+    return {"message": message}
+
+@app.post("/restore/rollback")
+def rollback_restore_endpoint():
+    connection = create_connection()
+    if not connection:
+        logger.error("Impossibile connettersi al database.")
+        raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
+    try:
+        success, message = annulla_ripristino(connection)
+    finally:
+        connection.close()
+    if not success:
+        raise HTTPException(status_code=409 if message == NESSUN_RIPRISTINO else 500, detail=message)
+    logger.info(message)
+    return {"message": message}
+
+@app.get("/changes", response_model=Modifiche)
+def get_changes_endpoint(since: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000), x_read_your_writes: bool = Header(False)):
+    # Sola lettura: replica, oppure primario se il client chiede di leggere le proprie scritture
+    connection = create_read_connection(read_your_writes=x_read_your_writes)
+    if not connection:
+        logger.error("Impossibile connettersi al database.")
+        raise HTTPException(status_code=500, detail="Impossibile connettersi al database.")
+    
+    # Una riga in più per sapere se il consumatore deve continuare a leggere
+    records = get_modifiche(connection, since, limit + 1)
+    connection.close()
+    altre = len(records) > limit
+    modifiche = []
+    for record in records[:limit]:
+        venditore = None
+        if record[5] is not None:
+            venditore = Venditore(
+                nome_cognome=record[5],
+                email=record[6],
+                telefono=record[7],
+                citta=record[8],
+                esperienza_vendita=record[9],
+                anno_nascita=record[10],
+                settore_esperienza=record[11],
+                partita_iva=record[12],
+                agente_isenarco=record[13],
+                cv=record[14],
+                note=record[15]
+            )
+        modifiche.append(Modifica(
+            seq=record[0],
+            operazione=record[1],
+            venditore_id=record[2],
+            email=record[3],
+            data_modifica=record[4],
+            venditore=venditore
+        ))
+    ultimo_seq = modifiche[-1].seq if modifiche else since
+    return Modifiche(modifiche=modifiche, ultimo_seq=ultimo_seq, altre=altre)
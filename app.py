@@ -3,35 +3,123 @@
 import streamlit as st
 from db_connection import (
     create_connection, 
+    create_read_connection,
+    get_repliche,
     add_venditore, 
     search_venditori, 
+    get_venditore,
+    get_venditori_per_id,
+    COLONNE_RIEPILOGO,
     add_settore, 
     get_settori, 
     get_available_cities,  
-    update_venditore,
+    update_venditore_campi,
+    get_versione_venditore,
+    ConflittoVersione,
+    COLONNE_MODIFICABILI,
     delete_venditore,
-    verifica_note,
+    update_venditori,
+    delete_venditori,
+    get_versione_dati,
     initialize_settori,
+    initialize_venditori,
+    initialize_modifiche,
     backup_database_python,  # Import della nuova funzione di backup
     restore_database_python, # Import della nuova funzione di ripristino
     add_venditori_bulk,
-    get_existing_emails
+    get_existing_emails,
+    restore_dump_sql,
+    annulla_ripristino,
+    VERSIONE_SCHEMA
 )
+from import_venditori import importa_venditori, leggi_blocchi_csv, leggi_blocchi_excel
+from cache_risultati import cerca_venditori, facette_venditori, aggiorna_dopo_scrittura
+from pool_connessioni import PoolConnessioni
+from compressione_backup import codec_disponibili
+from verifica_backup import verifica_archivio
 import pandas as pd
 import os
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import plotly.express as px  # Import di Plotly per grafici avanzati
 import base64  # Importato per il download del CV
 from io import BytesIO
 
-# Funzione per creare e memorizzare la connessione nel cache
-@st.cache_resource
-def get_connection():
+def crea_connessione():
+    """
+    Apre una connessione al primario e crea le tabelle mancanti.
+    """
     connection = create_connection()
     if connection:
         initialize_settori(connection)
+        initialize_venditori(connection)
+        initialize_modifiche(connection)
     return connection
 
+# Pool di connessioni al primario condiviso dalle sessioni: ogni rerun ne preleva una sua
+@st.cache_resource
+def get_pool():
+    return PoolConnessioni(crea_connessione)
+
+# Secondi dopo una scrittura in cui la sessione legge dal primario invece che dalle repliche
+SECONDI_READ_YOUR_WRITES = int(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 10))
+
+# Ordinamenti proposti nella ricerca (etichetta -> colonne per search_venditori)
+ORDINAMENTI_RICERCA = {
+    "Inserimento (meno recenti)": None,
+    "Inserimento (più recenti)": ['-data_creazione'],
+    "Nome (A-Z)": ['nome_cognome'],
+    "Città": ['citta', 'nome_cognome'],
+    "Esperienza (più anni)": ['-esperienza_vendita'],
+    "Anno di nascita (più giovani)": ['-anno_nascita'],
+}
+
+# Pool di connessioni alle repliche di sola lettura (None se non sono configurate)
+@st.cache_resource
+def get_read_pool():
+    if not get_repliche():
+        return None
+    return PoolConnessioni(create_read_connection)
+
+@contextmanager
+def connessioni_rerun():
+    """
+    Preleva dai pool le connessioni per un rerun e le restituisce alla fine, anche se lo
+    script viene interrotto (st.stop, st.rerun).
+    La connessione di lettura è una replica, oppure il primario se non ci sono repliche
+    o se la sessione ha scritto da poco (read-your-writes).
+    :return: Tuple (connessione al primario o None, connessione per le letture o None).
+    """
+    pool = get_pool()
+    read_pool = get_read_pool()
+    connection = pool.preleva()
+    read_connection = None
+    try:
+        ultima_scrittura = st.session_state.get('ultima_scrittura')
+        scrittura_recente = ultima_scrittura and time.time() - ultima_scrittura < SECONDI_READ_YOUR_WRITES
+        if read_pool and not scrittura_recente:
+            read_connection = read_pool.preleva()
+        yield connection, read_connection or connection
+    finally:
+        if read_connection is not None:
+            read_pool.restituisci(read_connection)
+        if connection is not None:
+            pool.restituisci(connection)
+
+def segna_scrittura():
+    """
+    Registra che la sessione ha appena scritto, per leggere dal primario nei secondi successivi.
+    """
+    st.session_state.ultima_scrittura = time.time()
+
+def crea_connessione_lettura(connection, read_connection):
+    """
+    Funzione che apre connessioni come read_connection, per le letture parallele del backup:
+    sul primario se il rerun legge dal primario (read-your-writes), altrimenti sulle repliche.
+    """
+    return create_connection if read_connection is connection else create_read_connection
+
 # Funzione per caricare tutte le città dal CSV
 @st.cache_data
 def load_all_cities():
@@ -102,6 +190,19 @@ def automatic_backup(connection):
         else:
             st.sidebar.error(f"Backup automatico fallito: {risultato}")
 
+def formato_con_conteggio(conteggi):
+    """
+    Restituisce una format_func per i selectbox che affianca a ogni valore il numero di venditori.
+    :param conteggi: Lista di tuple (valore, conteggio) di una facetta.
+    """
+    conteggi = dict(conteggi)
+
+    def formato(valore):
+        if valore in ("Tutti", "Tutte", "Carica prima i settori"):
+            return valore
+        return f"{valore} ({conteggi.get(valore, 0)})"
+    return formato
+
 def anno_nascita_index(anno):
     """
     Calcola l'indice dell'anno di nascita per il selectbox.
@@ -112,7 +213,7 @@ def anno_nascita_index(anno):
     else:
         return 0  # Default a 1900 se l'anno non è trovato
 
-def main():
+def main(connection, read_connection):
     # Configura la pagina Streamlit con un tema chiaro
     st.set_page_config(page_title="Gestione Venditori", layout="wide", initial_sidebar_state="expanded", page_icon="📈")
 
@@ -124,8 +225,11 @@ def main():
         st.warning("Logo aziendale non trovato. Assicurati che 'logo.svg' sia nella directory corrente.")
 
     # Inizializza tutte le variabili necessarie nella session_state
-    if 'venditori_data' not in st.session_state:
-        st.session_state.venditori_data = []
+    # Filtri dell'ultima ricerca (None se nessuna): le righe sono nella cache condivisa del processo
+    if 'ricerca_filtri' not in st.session_state:
+        st.session_state.ricerca_filtri = None
+    if 'ricerca_ordina' not in st.session_state:
+        st.session_state.ricerca_ordina = None
     if 'active_tab' not in st.session_state:
         st.session_state.active_tab = 'Inserisci Venditore'
     if 'delete_confirm_id' not in st.session_state:
@@ -136,13 +240,14 @@ def main():
     # Rimuovi il titolo principale
     # st.title("📈 Gestione dei Venditori")  # Rimosso come richiesto
 
-    # Ottieni la connessione al database
-    connection = get_connection()
-
+    # Connessione al database prelevata dal pool per questo rerun
     if not connection:
         st.error("Impossibile connettersi al database.")
         st.stop()
 
+    # Letture pesanti (ricerche, dashboard, esportazioni, backup) sulle repliche se configurate:
+    # 'read_connection' è una replica oppure il primario stesso
+
     # Caricamento automatizzato del file CSV delle città italiane
     all_cities = load_all_cities()
     if not all_cities:
@@ -168,7 +273,7 @@ def main():
     )
 
     # Esegui il backup automatico all'avvio
-    automatic_backup(connection)
+    automatic_backup(read_connection)
 
     # Funzione per gestire l'eliminazione
     def handle_delete(venditore_id):
@@ -176,11 +281,12 @@ def main():
 
     # Funzione per confermare l'eliminazione
     def confirm_delete(venditore_id):
+        versione = get_versione_dati(connection)
         successo, messaggio = delete_venditore(connection, venditore_id)
         if successo:
+            segna_scrittura()
+            aggiorna_dopo_scrittura(connection, versione, venditore_id)
             st.success(messaggio)
-            # Rimuovi il venditore dai dati visualizzati
-            st.session_state.venditori_data = [v for v in st.session_state.venditori_data if v[0] != venditore_id]
         else:
             st.error(messaggio)
         st.session_state.delete_confirm_id = None
@@ -213,7 +319,7 @@ def main():
                 )
             
             with col3:
-                settori = get_settori(connection)
+                settori = get_settori(read_connection)
                 if settori:
                     settore_esperienza = st.selectbox(
                         "Settore di Esperienza", 
@@ -272,11 +378,13 @@ def main():
                         cv_path,  # Campo 'cv'
                         note.strip()  # Campo 'note'
                     )
-                    successo = add_venditore(connection, venditore)
-                    if successo:
+                    versione = get_versione_dati(connection)
+                    riga = add_venditore(connection, venditore, restituisci_riga=True)
+                    if riga:
+                        segna_scrittura()
                         st.success("Venditore aggiunto con successo!")
-                        # Aggiorna lo stato dei venditori
-                        st.session_state.venditori_data = search_venditori(connection)
+                        # Aggiunge il nuovo venditore alle ricerche in cache, senza rileggerle
+                        aggiorna_dopo_scrittura(connection, versione, riga[0], riga)
                     else:
                         st.error("Si è verificato un errore durante l'inserimento del venditore.")
                 else:
@@ -285,62 +393,93 @@ def main():
     # Scheda 2: Cerca Venditori
     elif st.session_state.active_tab == "Cerca Venditori":
         st.header("🔍 Cerca Venditori")
+        # Numero di venditori per ogni opzione, dati i filtri dell'ultima ricerca (una sola query, in cache)
+        facette = facette_venditori(read_connection, **(st.session_state.ricerca_filtri or {}))
         with st.form("form_cerca_venditori"):
             # Miglioramento del layout del form usando colonne
             col1, col2, col3 = st.columns(3)
             
             with col1:
                 nome_cerca = st.text_input("Nome e Cognome", placeholder="Inserisci il nome da cercare")
-                partita_iva_cerca = st.selectbox("Partita IVA", ["Tutti", "Sì", "No"])
+                partita_iva_cerca = st.selectbox(
+                    "Partita IVA", ["Tutti", "Sì", "No"],
+                    format_func=formato_con_conteggio(facette.get('partita_iva', []))
+                )
             
             with col2:
-                available_cities = get_available_cities(connection)
-                citta_cerca = st.selectbox("Città", ["Tutte"] + available_cities)
+                available_cities = get_available_cities(read_connection)
+                citta_cerca = st.multiselect(
+                    "Città", available_cities, placeholder="Tutte",
+                    format_func=formato_con_conteggio(facette.get('citta', []))
+                )
                 agente_isenarco_cerca = st.selectbox(
                     "Agente Iscritto Enasarco", 
-                    options=["Tutti", "Sì", "No"]
+                    options=["Tutti", "Sì", "No"],
+                    format_func=formato_con_conteggio(facette.get('agente_isenarco', []))
                 )
             
             with col3:
-                settori = get_settori(connection)
-                if settori:
-                    settore_cerca = st.selectbox("Settore di Esperienza", ["Tutti"] + settori)
-                else:
-                    settore_cerca = st.selectbox("Settore di Esperienza", ["Carica prima i settori"])
+                settori = get_settori(read_connection)
+                settore_cerca = st.multiselect(
+                    "Settore di Esperienza", settori, placeholder="Tutti" if settori else "Carica prima i settori",
+                    format_func=formato_con_conteggio(facette.get('settore_esperienza', []))
+                )
+
+            # Filtri per intervallo e ordinamento
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                esperienza_cerca = st.slider("Anni di Esperienza", 0, 50, (0, 50))
+            with col2:
+                anno_nascita_cerca = st.slider("Anno di Nascita", 1900, 2024, (1900, 2024))
+            with col3:
+                data_creazione_cerca = st.date_input("Inserito tra", value=(), format="DD/MM/YYYY")
+            with col4:
+                ordina_cerca = st.selectbox("Ordina per", list(ORDINAMENTI_RICERCA))
             
             cerca_button = st.form_submit_button("Cerca")
         
         if cerca_button:
-            # Mappatura dei valori "Tutti" a None
+            # Mappatura dei valori "Tutti" (e degli intervalli completi) a None
             nome_param = nome_cerca if nome_cerca else None
-            citta_param = citta_cerca if citta_cerca != "Tutte" else None
-            settore_param = settore_cerca if settore_cerca != "Tutti" else None
             partita_iva_param = partita_iva_cerca if partita_iva_cerca != "Tutti" else None
             agente_isenarco_param = agente_isenarco_cerca if agente_isenarco_cerca != "Tutti" else None
-
-            records = search_venditori(
-                connection, 
-                nome=nome_param, 
-                citta=citta_param, 
-                settore=settore_param, 
-                partita_iva=partita_iva_param,
-                agente_isenarco=agente_isenarco_param
-            )
-            st.session_state.venditori_data = records  # Aggiorna lo stato con i risultati della ricerca
+            data_da, data_a = (list(data_creazione_cerca) + [None, None])[:2]
+
+            st.session_state.ricerca_filtri = {
+                'nome': nome_param,
+                'citta': citta_cerca,
+                'settore': settore_cerca,
+                'partita_iva': partita_iva_param,
+                'agente_isenarco': agente_isenarco_param,
+                'esperienza_min': esperienza_cerca[0] if esperienza_cerca[0] > 0 else None,
+                'esperienza_max': esperienza_cerca[1] if esperienza_cerca[1] < 50 else None,
+                'anno_nascita_min': anno_nascita_cerca[0] if anno_nascita_cerca[0] > 1900 else None,
+                'anno_nascita_max': anno_nascita_cerca[1] if anno_nascita_cerca[1] < 2024 else None,
+                'data_creazione_da': datetime.combine(data_da, datetime.min.time()) if data_da else None,
+                'data_creazione_a': datetime.combine(data_a or data_da, datetime.max.time().replace(microsecond=0)) if data_da else None,
+            }
+            st.session_state.ricerca_ordina = ORDINAMENTI_RICERCA[ordina_cerca]
             st.session_state.display_count = 10  # Reset della visualizzazione
 
-        else:
-            if 'venditori_data' not in st.session_state:
-                st.session_state.venditori_data = []  # Reset dei dati se non si è cliccato "Cerca"
-
         st.markdown("---")
 
+        # Elenco riepilogativo dalla cache condivisa: ricalcolato solo se i dati sono cambiati
+        # dall'ultima ricerca identica
+        venditori_data = []
+        if st.session_state.ricerca_filtri is not None:
+            venditori_data = cerca_venditori(
+                read_connection, campi=COLONNE_RIEPILOGO, ordina=st.session_state.ricerca_ordina,
+                **st.session_state.ricerca_filtri
+            )
+
         # Visualizza i venditori solo se ci sono risultati
-        if st.session_state.venditori_data:
-            st.subheader(f"Risultati della Ricerca: {len(st.session_state.venditori_data)} Venditori Trovati")
+        if venditori_data:
+            st.subheader(f"Risultati della Ricerca: {len(venditori_data)} Venditori Trovati")
             
-            # Mostra solo i primi 'display_count' venditori
-            venditori_display = st.session_state.venditori_data[:st.session_state.display_count]
+            # Dettagli completi solo per i primi 'display_count' venditori mostrati
+            venditori_display = get_venditori_per_id(
+                read_connection, [riepilogo[0] for riepilogo in venditori_data[:st.session_state.display_count]]
+            )
 
             for record in venditori_display:
                 with st.expander(f"📌 {record[1]}"):
@@ -391,12 +530,60 @@ def main():
                             handle_delete(record[0])
 
             # Pulsante "Carica Altro" per lo scroll infinito
-            if st.session_state.display_count < len(st.session_state.venditori_data):
+            if st.session_state.display_count < len(venditori_data):
                 if st.button("Carica Altro", key="load_more"):
                     st.session_state.display_count += 10  # Incrementa di 10 venditori
             else:
                 st.info("Hai visualizzato tutti i venditori.")
 
+            # Azioni in blocco sui venditori selezionati (o su tutti i risultati della ricerca)
+            with st.expander("🧰 Azioni in blocco"):
+                nomi_risultati = {riepilogo[0]: riepilogo[1] for riepilogo in venditori_data}
+                with st.form("form_azioni_blocco"):
+                    tutti_risultati = st.checkbox(f"Tutti i {len(venditori_data)} risultati della ricerca")
+                    selezionati = st.multiselect(
+                        "Venditori", list(nomi_risultati),
+                        format_func=lambda venditore_id: f"{nomi_risultati[venditore_id]} (ID {venditore_id})"
+                    )
+                    azione = st.selectbox("Azione", ["Assegna settore", "Assegna città", "Imposta Partita IVA", "Imposta Agente Enasarco", "Elimina"])
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        settore_blocco = st.selectbox("Settore", settori)
+                        citta_blocco = st.selectbox("Città", available_cities)
+                    with col2:
+                        partita_iva_blocco = st.selectbox("Partita IVA", ["Sì", "No"])
+                        agente_isenarco_blocco = st.selectbox("Agente Iscritto Enasarco", ["Sì", "No"])
+                    conferma_blocco = st.checkbox("Confermo l'operazione sui venditori selezionati")
+                    esegui_blocco = st.form_submit_button("Esegui")
+
+                if esegui_blocco:
+                    ids_blocco = list(nomi_risultati) if tutti_risultati else selezionati
+                    valori_blocco = {
+                        "Assegna settore": {'settore_esperienza': settore_blocco},
+                        "Assegna città": {'citta': citta_blocco},
+                        "Imposta Partita IVA": {'partita_iva': partita_iva_blocco},
+                        "Imposta Agente Enasarco": {'agente_isenarco': agente_isenarco_blocco},
+                    }.get(azione)
+                    if not ids_blocco:
+                        st.warning("Seleziona almeno un venditore.")
+                    elif valori_blocco is not None and None in valori_blocco.values():
+                        st.warning("Scegli il valore da assegnare.")
+                    elif not conferma_blocco:
+                        st.warning("Conferma l'operazione prima di eseguirla.")
+                    else:
+                        with st.spinner("Operazione in corso..."):
+                            if valori_blocco is None:
+                                successo, risultato = delete_venditori(connection, ids=ids_blocco)
+                                messaggio = f"{risultato} venditori eliminati."
+                            else:
+                                successo, risultato = update_venditori(connection, valori_blocco, ids=ids_blocco)
+                                messaggio = f"{risultato} venditori aggiornati."
+                        if successo:
+                            segna_scrittura()
+                            st.success(messaggio)
+                        else:
+                            st.error(risultato)
+
         else:
             st.info("Nessun venditore trovato.")
 
@@ -423,7 +610,7 @@ def main():
         with col1:
             # 1. Numero Totale di Venditori
             try:
-                cursor = connection.cursor()
+                cursor = read_connection.cursor()
                 query_totale = "SELECT COUNT(*) as totale FROM venditori"
                 cursor.execute(query_totale)
                 df_totale = cursor.fetchone()
@@ -436,7 +623,7 @@ def main():
         with col2:
             # 2. Numero di Venditori per Settore
             try:
-                cursor = connection.cursor()
+                cursor = read_connection.cursor()
                 query_settori = "SELECT settore_esperienza, COUNT(*) as totale FROM venditori GROUP BY settore_esperienza"
                 cursor.execute(query_settori)
                 records_settori = cursor.fetchall()
@@ -458,7 +645,7 @@ def main():
         with col3:
             # 3. Distribuzione delle Esperienze nella Vendita
             try:
-                cursor = connection.cursor()
+                cursor = read_connection.cursor()
                 query_esperienza = "SELECT esperienza_vendita, COUNT(*) as totale FROM venditori GROUP BY esperienza_vendita ORDER BY esperienza_vendita"
                 cursor.execute(query_esperienza)
                 records_esperienza = cursor.fetchall()
@@ -475,7 +662,7 @@ def main():
         with col4:
             # 4. Città con più Venditori
             try:
-                cursor = connection.cursor()
+                cursor = read_connection.cursor()
                 query_citta = "SELECT citta, COUNT(*) as totale FROM venditori GROUP BY citta ORDER BY totale DESC LIMIT 10"
                 cursor.execute(query_citta)
                 records_citta = cursor.fetchall()
@@ -504,6 +691,7 @@ def main():
                 if nuovo_settore.strip():
                     successo = add_settore(connection, nuovo_settore.strip())
                     if successo:
+                        segna_scrittura()
                         st.success(f"Settore **'{nuovo_settore}'** aggiunto con successo!")
                         # Aggiorna manualmente le informazioni
                         settori = get_settori(connection)
@@ -532,21 +720,25 @@ def main():
             nome_param = nome_cerca_modifica if nome_cerca_modifica else None
             citta_param = citta_cerca_modifica if citta_cerca_modifica != "Tutte" else None
 
+            # Per la scelta bastano ID e nome; il dettaglio si carica solo per il venditore selezionato
             records_modifica = search_venditori(
-                connection, 
+                read_connection, 
                 nome=nome_param, 
                 citta=citta_param, 
                 settore=None,  
                 partita_iva=None,
-                agente_isenarco=None
+                agente_isenarco=None,
+                campi=('id', 'nome_cognome')
             )
             if records_modifica:
                 # Creiamo una lista di venditori da selezionare
-                venditori_list = {f"{record[1]} (ID: {record[0]})": record for record in records_modifica}
+                venditori_list = {f"{record[1]} (ID: {record[0]})": record[0] for record in records_modifica}
                 venditore_selezionato = st.selectbox("Seleziona il Venditore da Modificare", list(venditori_list.keys()))
                 
                 if venditore_selezionato:
-                    venditore_record = venditori_list[venditore_selezionato]
+                    # Versione letta prima dei dati: serve a non sovrascrivere modifiche altrui
+                    st.session_state.versione_selezionato_tab4 = get_versione_venditore(read_connection, venditori_list[venditore_selezionato])
+                    venditore_record = get_venditore(read_connection, venditori_list[venditore_selezionato])
                     st.session_state.venditore_selezionato_tab4 = venditore_record
                     st.success(f"Venditore selezionato: **{venditore_selezionato}**")
             else:
@@ -608,7 +800,7 @@ def main():
                     )
                 
                 with col3:
-                    settori = get_settori(connection)
+                    settori = get_settori(read_connection)
                     if settori:
                         if venditore[7] in settori:
                             index_settore = settori.index(venditore[7])
@@ -664,45 +856,42 @@ def main():
                         except Exception as e:
                             st.error(f"Errore nel salvataggio del CV: {e}")
                     
-                    # Aggiorna tutti i campi
-                    successo, messaggio = update_venditore(
-                        connection, 
-                        venditore_id=venditore[0],
-                        nome_cognome=nome_cognome_mod,
-                        email=email_mod,
-                        telefono=telefono_mod,
-                        citta=citta_mod,
-                        esperienza_vendita=esperienza_vendita_mod,
-                        anno_nascita=anno_nascita_mod,
-                        settore_esperienza=settore_esperienza_mod,
-                        partita_iva=partita_iva_mod,
-                        agente_isenarco=agente_isenarco_mod,
-                        cv_path=cv_path_mod,
-                        note=note_mod.strip()
-                    )
-                    
-                    if successo:
-                        st.success(messaggio)
-                        note_aggiornate = verifica_note(connection, venditore[0])
-                        st.info(f"Note aggiornate: {note_aggiornate}")
-                        # Aggiorna lo stato dei venditori
-                        st.session_state.venditori_data = search_venditori(connection)
-                        # Aggiorna i dati del venditore selezionato con i dati più recenti
-                        updated_records = search_venditori(
-                            connection, 
-                            nome=nome_cognome_mod, 
-                            citta=citta_mod, 
-                            settore=settore_esperienza_mod, 
-                            partita_iva=partita_iva_mod,
-                            agente_isenarco=agente_isenarco_mod
+                    # Scrive solo i campi cambiati, se nessun altro ha modificato il venditore nel frattempo
+                    modifiche = {
+                        colonna: nuovo
+                        for colonna, nuovo, attuale in zip(
+                            COLONNE_MODIFICABILI,
+                            (nome_cognome_mod, email_mod, telefono_mod, citta_mod, esperienza_vendita_mod,
+                             anno_nascita_mod, settore_esperienza_mod, partita_iva_mod, agente_isenarco_mod,
+                             cv_path_mod, note_mod.strip()),
+                            venditore[1:12]
                         )
-                        # Trova il venditore aggiornato
-                        if updated_records:
-                            st.session_state.venditore_selezionato_tab4 = updated_records[0]
-                        else:
-                            st.session_state.venditore_selezionato_tab4 = None
+                        if nuovo != attuale
+                    }
+                    if not modifiche:
+                        st.info("Nessuna modifica da salvare.")
                     else:
-                        st.error(messaggio)
+                        versione = get_versione_dati(connection)
+                        try:
+                            successo, risultato = update_venditore_campi(
+                                connection, venditore[0], modifiche,
+                                versione=st.session_state.get('versione_selezionato_tab4')
+                            )
+                        except ConflittoVersione:
+                            successo, risultato = False, "Il venditore è stato modificato da un altro utente: cercalo di nuovo per vedere i dati aggiornati."
+                        except ValueError as e:
+                            successo, risultato = False, str(e)
+                        
+                        if successo:
+                            riga, st.session_state.versione_selezionato_tab4 = risultato
+                            segna_scrittura()
+                            st.success("Venditore aggiornato con successo.")
+                            st.info(f"Note aggiornate: {riga[11]}")
+                            # Aggiorna le ricerche in cache e il venditore selezionato con la riga salvata
+                            aggiorna_dopo_scrittura(connection, versione, venditore[0], riga)
+                            st.session_state.venditore_selezionato_tab4 = riga
+                        else:
+                            st.error(risultato)
 
     # Scheda 5: Backup e Ripristino
     elif st.session_state.active_tab == "Backup e Ripristino":
@@ -711,9 +900,20 @@ def main():
 
         # Sezione Backup Manuale
         st.markdown("### 📦 Esegui Backup Manuale del Database")
+        # 'deflate' è il formato ZIP standard; zstd e lz4 compaiono solo se i pacchetti sono installati
+        codec_backup = st.selectbox(
+            "Compressione",
+            codec_disponibili(),
+            index=codec_disponibili().index("deflate"),
+            help="deflate-1: più veloce, deflate-9: più compatto. zstd e lz4 sono più rapidi ma richiedono questa applicazione per il ripristino."
+        )
         if st.button("Crea Backup Manuale"):
             with st.spinner("Eseguendo il backup..."):
-                successo, risultato = backup_database_python(connection)  # Utilizza la nuova funzione
+                successo, risultato = backup_database_python(
+                    read_connection,
+                    codec=codec_backup,
+                    crea_connessione=crea_connessione_lettura(connection, read_connection)
+                )
                 if successo:
                     # Crea un nome file con data e ora
                     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -741,15 +941,32 @@ def main():
         st.markdown("### 🔄 Ripristina il Database da un Backup")
         with st.form("form_ripristino"):
             backup_file = st.file_uploader("Carica il file di backup ZIP contenente i CSV delle tabelle", type=["zip"])
+            verifica_button = st.form_submit_button("Verifica Archivio")
             ripristina_button = st.form_submit_button("Ripristina Database")
 
+            # Verifica dell'archivio rispetto al suo manifest, senza toccare il database
+            if verifica_button and backup_file is not None:
+                valido, rapporto = verifica_archivio(backup_file, versione_schema=VERSIONE_SCHEMA)
+                if valido:
+                    st.success(f"Archivio valido (creato il {rapporto['manifest'].get('creato')}).")
+                else:
+                    st.error("Archivio non valido:\n\n" + "\n".join(f"- {errore}" for errore in rapporto["errori"]))
+                if rapporto["tabelle"]:
+                    st.table(pd.DataFrame(
+                        [(tabella, esito["righe"], "✅" if esito["valida"] else "❌") for tabella, esito in rapporto["tabelle"].items()],
+                        columns=["Tabella", "Righe", "Esito"]
+                    ))
+            elif verifica_button:
+                st.error("🔴 Devi caricare un file di backup valido.")
+
             if ripristina_button:
                 if backup_file is not None:
                     try:
-                        backup_zip_bytes = backup_file.read()
+                        backup_zip_bytes = backup_file.getvalue()
                         with st.spinner("Ripristinando il database..."):
-                            successo, messaggio = restore_database_python(connection, backup_zip_bytes)  # Utilizza la nuova funzione
+                            successo, messaggio = restore_database_python(connection, backup_zip_bytes, crea_connessione=create_connection)
                             if successo:
+                                segna_scrittura()
                                 st.success(messaggio)
                                 # Aggiorna l'ultimo backup
                                 current_time = datetime.now()
@@ -762,6 +979,37 @@ def main():
                 else:
                     st.error("🔴 Devi caricare un file di backup valido.")
 
+        # Ripristino da un dump SQL di mysqldump (backup_*.sql), letto a flusso
+        with st.form("form_ripristino_sql"):
+            dump_file = st.file_uploader("Carica un dump SQL (.sql o .sql.gz)", type=["sql", "gz"])
+            ripristina_dump_button = st.form_submit_button("Ripristina da Dump SQL")
+
+            if ripristina_dump_button:
+                if dump_file is not None:
+                    barra = st.progress(0.0, text="Ripristinando il dump SQL...")
+
+                    def progresso(byte_letti, istruzioni):
+                        barra.progress(min(byte_letti / max(dump_file.size, 1), 1.0), text=f"{istruzioni} istruzioni eseguite")
+                    successo, messaggio = restore_dump_sql(connection, dump_file, progresso=progresso)
+                    barra.empty()
+                    if successo:
+                        segna_scrittura()
+                        st.success(messaggio)
+                    else:
+                        st.error(messaggio)
+                else:
+                    st.error("🔴 Devi caricare un dump SQL valido.")
+
+        # I dati sostituiti dall'ultimo ripristino restano disponibili fino al ripristino successivo
+        if st.button("Annulla Ultimo Ripristino"):
+            with st.spinner("Ripristinando i dati precedenti..."):
+                successo, messaggio = annulla_ripristino(connection)
+            if successo:
+                segna_scrittura()
+                st.success(messaggio)
+            else:
+                st.error(messaggio)
+
     # Scheda 6: Esporta/Importa Venditori
     elif st.session_state.active_tab == "Esporta/Importa Venditori":
         st.header("📤 Esporta e 📥 Importa Venditori")
@@ -780,7 +1028,7 @@ def main():
         # Pulsante per esportare tutti i venditori
         if st.button("Esporta Tutti i Venditori"):
             with st.spinner("Eseguendo l'esportazione..."):
-                records = search_venditori(connection)
+                records = cerca_venditori(read_connection)
                 if records:
                     # Converti i record in DataFrame
                     df_export = pd.DataFrame(records, columns=[
@@ -824,43 +1072,61 @@ def main():
             ["CSV", "Excel"],
             key="formato_import"
         )
-        import_file = st.file_uploader("Carica il file ZIP contenente i CSV delle tabelle", type=["zip"])
+        estensioni_import = ["csv"] if formato_import == "CSV" else ["xlsx"]
+        import_file = st.file_uploader(
+            f"Carica il file {formato_import} dei venditori (stesse colonne dell'esportazione)",
+            type=estensioni_import
+        )
+        overwrite_import = st.checkbox(
+            "Aggiorna i venditori già presenti (stessa email)",
+            value=False,
+            key="overwrite_import"
+        )
 
         if import_file is not None:
             try:
-                backup_zip = zipfile.ZipFile(BytesIO(import_file.read()), 'r')
-                table_files = [file for file in backup_zip.namelist() if file.endswith('.csv')]
-
-                if not table_files:
-                    st.error("Il file ZIP non contiene file CSV validi.")
-                else:
-                    st.write(f"Totale tabelle da importare: {len(table_files)}")
-                    
-                    # Mostra una preview dei dati
-                    for file in table_files[:1]:  # Mostra solo la preview della prima tabella
-                        with backup_zip.open(file) as f:
-                            df_preview = pd.read_csv(f)
-                            st.write(f"Preview del file `{file}`:")
-                            st.dataframe(df_preview.head())
-
-                    if st.button("Importa Database"):
-                        with st.spinner("Importando il database..."):
-                            try:
-                                # Leggi tutti i CSV dal ZIP
-                                backup_zip_bytes = import_file.read()
-                                successo, messaggio = restore_database_python(connection, backup_zip_bytes)
-                                if successo:
-                                    st.success(messaggio)
-                                    # Aggiorna i dati visualizzati
-                                    st.session_state.venditori_data = search_venditori(connection)
-                                else:
-                                    st.error(messaggio)
-                            except Exception as e:
-                                st.error(f"Errore durante l'importazione: {e}")
-            except zipfile.BadZipFile:
-                st.error("Il file caricato non è un file ZIP valido.")
+                # Mostra una preview delle prime righe senza leggere tutto il file
+                blocchi_preview = leggi_blocchi_excel if formato_import == "Excel" else leggi_blocchi_csv
+                df_preview = next(blocchi_preview(import_file, 5), None)
+                import_file.seek(0)
+                if df_preview is not None:
+                    st.write(f"Preview del file `{import_file.name}`:")
+                    st.dataframe(df_preview)
+
+                if st.button("Importa Venditori"):
+                    stato_import = st.empty()
+                    with st.spinner("Importando i venditori..."):
+                        successo, risultato = importa_venditori(
+                            connection,
+                            import_file,
+                            formato=formato_import,
+                            overwrite=overwrite_import,
+                            citta_valide=set(all_cities) if all_cities else None,
+                            progresso=lambda righe: stato_import.text(f"Righe elaborate: {righe}")
+                        )
+                    if successo:
+                        segna_scrittura()
+                        azione_esistenti = "aggiornati" if overwrite_import else "ignorati"
+                        st.success(
+                            f"Importazione completata: {risultato['inserite']} venditori inseriti, "
+                            f"{risultato['esistenti']} già presenti ({azione_esistenti}), "
+                            f"{risultato['righe_scartate']} righe scartate su {risultato['righe_lette']}."
+                        )
+                        errori = risultato['errori']
+                        if not errori.empty:
+                            st.warning(f"{len(errori)} errori di validazione trovati.")
+                            st.dataframe(errori.head(1000))
+                            st.download_button(
+                                label="📥 Scarica Report Errori",
+                                data=errori.to_csv(index=False, sep=';').encode('utf-8'),
+                                file_name='venditori_import_errori.csv',
+                                mime='text/csv'
+                            )
+                    else:
+                        st.error(risultato)
             except Exception as e:
-                st.error(f"Errore durante la lettura del file ZIP: {e}")
+                st.error(f"Errore durante la lettura del file: {e}")
 
 if __name__ == "__main__":
-    main()
+    with connessioni_rerun() as (connection, read_connection):
+        main(connection, read_connection)
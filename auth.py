@@ -0,0 +1,220 @@
+# auth.py
+#
+# Autenticazione dell'API con token nominativi e limiti per token:
+# - API_TOKENS="nome:token,nome2:token2" (oppure il vecchio API_TOKEN, con nome 'default');
+#   un token può avere limiti propri: "nome:token:richieste_al_secondo:concorrenza".
+# - ogni token ha un secchio (token bucket) di API_RATE_LIMIT richieste/s con raffica
+#   API_RATE_BURST e al massimo API_MAX_CONCURRENT richieste contemporanee;
+# - le rotte onerose (backup, ripristino e scritture in blocco) hanno un budget separato e più stretto.
+# I limiti valgono per processo: con più worker uvicorn vanno divisi per il numero di worker.
+
+import hmac
+import logging
+import math
+import os
+import threading
+import time
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from metrics import RICHIESTE_RIFIUTATE
+
+logger = logging.getLogger(__name__)
+
+# Rotte raggiungibili senza token
+PERCORSI_PUBBLICI = {"/test", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"}
+# Rotte che impegnano il database per molto tempo: budget separato. Non /backup/verify, che
+# controlla il file caricato senza toccare il database e segue i limiti ordinari del token
+PERCORSI_ONEROSI = {"/backup", "/restore", "/restore/sql", "/restore/rollback"}
+# Scritture in blocco, onerose come backup e ripristino (metodo, percorso)
+OPERAZIONI_ONEROSE = {("DELETE", "/venditori"), ("PATCH", "/venditori")}
+
+class Limiti:
+    def __init__(self, richieste_al_secondo, raffica, concorrenza):
+        self.richieste_al_secondo = richieste_al_secondo
+        self.raffica = raffica
+        self.concorrenza = concorrenza
+
+class Token:
+    def __init__(self, nome, valore, limiti):
+        self.nome = nome
+        self.valore = valore
+        self.limiti = limiti
+
+def _limiti_predefiniti():
+    return Limiti(
+        float(os.getenv('API_RATE_LIMIT', 10)),
+        int(os.getenv('API_RATE_BURST', 20)),
+        int(os.getenv('API_MAX_CONCURRENT', 4))
+    )
+
+def _limiti_onerosi():
+    return Limiti(
+        float(os.getenv('API_HEAVY_RATE_PER_MINUTE', 2)) / 60,
+        int(os.getenv('API_HEAVY_BURST', 2)),
+        int(os.getenv('API_HEAVY_MAX_CONCURRENT', 1))
+    )
+
+def leggi_token():
+    """
+    Legge i token configurati in API_TOKENS (o API_TOKEN).
+    :return: Lista di Token.
+    """
+    predefiniti = _limiti_predefiniti()
+    tokens = []
+    for voce in os.getenv('API_TOKENS', '').split(','):
+        if not voce.strip():
+            continue
+        parti = [parte.strip() for parte in voce.split(':')]
+        if len(parti) < 2 or not parti[0] or not parti[1]:
+            raise ValueError(f"Voce di API_TOKENS non valida (atteso 'nome:token'): '{parti[0]}'")
+        limiti = Limiti(predefiniti.richieste_al_secondo, predefiniti.raffica, predefiniti.concorrenza)
+        if len(parti) > 2 and parti[2]:
+            limiti.richieste_al_secondo = float(parti[2])
+            limiti.raffica = max(1, math.ceil(limiti.richieste_al_secondo * 2))
+        if len(parti) > 3 and parti[3]:
+            limiti.concorrenza = int(parti[3])
+        tokens.append(Token(parti[0], parti[1], limiti))
+    if not tokens and os.getenv('API_TOKEN'):
+        tokens.append(Token('default', os.getenv('API_TOKEN'), predefiniti))
+    return tokens
+
+class Secchio:
+    """
+    Token bucket: si ricarica di 'ricarica' gettoni al secondo fino a 'capacita'.
+    """
+
+    def __init__(self, ricarica, capacita):
+        self.ricarica = ricarica
+        self.capacita = capacita
+        self.gettoni = float(capacita)
+        self.aggiornato = time.monotonic()
+
+    def preleva(self):
+        """
+        Preleva un gettone se disponibile.
+        :return: 0 se concesso, altrimenti i secondi di attesa per il prossimo gettone.
+        """
+        adesso = time.monotonic()
+        self.gettoni = min(self.capacita, self.gettoni + (adesso - self.aggiornato) * self.ricarica)
+        self.aggiornato = adesso
+        if self.gettoni >= 1:
+            self.gettoni -= 1
+            return 0
+        if self.ricarica <= 0:
+            return 60
+        return (1 - self.gettoni) / self.ricarica
+
+class Budget:
+    """
+    Limite di frequenza e di concorrenza di un token su un gruppo di rotte.
+    """
+
+    def __init__(self, limiti):
+        self.limiti = limiti
+        self.secchio = Secchio(limiti.richieste_al_secondo, limiti.raffica)
+        self.in_corso = 0
+
+    def acquisisci(self):
+        """
+        :return: Tuple (motivo, secondi) se la richiesta va rifiutata, altrimenti None.
+        """
+        if self.in_corso >= self.limiti.concorrenza:
+            return "concorrenza", 1
+        attesa = self.secchio.preleva()
+        if attesa:
+            return "frequenza", attesa
+        self.in_corso += 1
+        return None
+
+    def rilascia(self):
+        self.in_corso -= 1
+
+class Autenticatore:
+    """
+    Verifica i token (confronto a tempo costante) e applica i budget per token.
+    """
+
+    def __init__(self, tokens, limiti_onerosi):
+        self.tokens = tokens
+        self._budget = {}
+        for token in tokens:
+            self._budget[(token.nome, False)] = Budget(token.limiti)
+            self._budget[(token.nome, True)] = Budget(limiti_onerosi)
+        self._lock = threading.Lock()
+
+    def identifica(self, authorization):
+        """
+        :return: Il Token corrispondente all'header Authorization, o None.
+        """
+        if not authorization or not authorization.startswith("Bearer "):
+            return None
+        ricevuto = authorization[len("Bearer "):].encode()
+        trovato = None
+        # Confronta con tutti i token, senza fermarsi al primo, per non rivelare quale combacia
+        for token in self.tokens:
+            if hmac.compare_digest(ricevuto, token.valore.encode()):
+                trovato = token
+        return trovato
+
+    def acquisisci(self, token, onerosa):
+        with self._lock:
+            return self._budget[(token.nome, onerosa)].acquisisci()
+
+    def rilascia(self, token, onerosa):
+        with self._lock:
+            self._budget[(token.nome, onerosa)].rilascia()
+
+_autenticatore = None
+_lock_autenticatore = threading.Lock()
+
+def get_autenticatore():
+    """
+    Restituisce l'autenticatore del processo, creato alla prima richiesta con i token configurati.
+    """
+    global _autenticatore
+    with _lock_autenticatore:
+        if _autenticatore is None:
+            _autenticatore = Autenticatore(leggi_token(), _limiti_onerosi())
+        return _autenticatore
+
+def _errore(status, detail, headers=None):
+    return JSONResponse(status_code=status, content={"detail": detail}, headers=headers)
+
+async def autenticazione(request: Request, call_next):
+    """
+    Middleware HTTP: autentica il token e applica i limiti prima di raggiungere le rotte.
+    Il nome del token è disponibile nelle rotte come request.state.token.
+    """
+    percorso = request.url.path
+    if percorso in PERCORSI_PUBBLICI:
+        return await call_next(request)
+
+    autenticatore = get_autenticatore()
+    if not autenticatore.tokens:
+        logger.error("API_TOKEN non configurato.")
+        return _errore(500, "API_TOKEN non configurato.")
+
+    token = autenticatore.identifica(request.headers.get("authorization"))
+    if token is None:
+        host = request.client.host if request.client else "sconosciuto"
+        logger.warning(f"Tentativo di accesso non autorizzato da {host} su {percorso}.")
+        RICHIESTE_RIFIUTATE.inc("nessuno", "autenticazione")
+        return _errore(403, "Accesso negato.")
+
+    onerosa = percorso in PERCORSI_ONEROSI or (request.method, percorso) in OPERAZIONI_ONEROSE
+    rifiuto = autenticatore.acquisisci(token, onerosa)
+    if rifiuto:
+        motivo, attesa = rifiuto
+        RICHIESTE_RIFIUTATE.inc(token.nome, motivo)
+        logger.warning(f"Limite di {motivo} superato dal token '{token.nome}' su {percorso}.")
+        return _errore(
+            429,
+            "Troppe richieste contemporanee." if motivo == "concorrenza" else "Troppe richieste, riprova più tardi.",
+            {"Retry-After": str(max(1, math.ceil(attesa)))}
+        )
+
+    request.state.token = token.nome
+    try:
+        return await call_next(request)
+    finally:
+        autenticatore.rilascia(token, onerosa)
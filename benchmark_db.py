@@ -0,0 +1,340 @@
+# benchmark_db.py
+#
+# Benchmark del livello di accesso ai dati (db_connection.py) su un'istanza MySQL locale.
+# Usa un database dedicato (BENCH_DB_DATABASE, default 'venditori_bench') che viene
+# svuotato e ripopolato: non puntarlo mai al database di produzione.
+# Con DB_BACKEND=sqlite gira senza server, sul file '<database>.db'.
+#
+# Esempi:
+#   python benchmark_db.py --output risultati.json
+#   python benchmark_db.py --scenari search,bulk --baseline baseline.json --tolleranza 0.2
+#   python benchmark_db.py --salva-baseline baseline.json
+#   DB_BACKEND=sqlite python benchmark_db.py --scenari search,bulk
+#   python benchmark_db.py --scenari compressione --codec deflate-1,deflate,zstd,lz4 --workers 8
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from db_connection import (
+    create_connection,
+    get_backend,
+    initialize_settori,
+    initialize_venditori,
+    initialize_modifiche,
+    add_settore,
+    add_venditore,
+    add_venditori_bulk,
+    search_venditori,
+    get_existing_emails,
+    backup_database_python,
+    restore_database_python,
+    TABELLA_MODIFICHE
+)
+from genera_venditori import GeneratoreVenditori, SETTORI, per_inserimento
+
+# Combinazioni di filtri di search_venditori misurate dallo scenario 'search'
+FILTRI_RICERCA = {
+    "nessun_filtro": {},
+    "nome": {"nome": "Rossi"},
+    "citta": {"citta": "Milano"},
+    "settore": {"settore": "Automotive"},
+    "citta_settore": {"citta": "Milano", "settore": "Automotive"},
+    "partita_iva_agente": {"partita_iva": "Sì", "agente_isenarco": "No"},
+    "tutti": {"nome": "Rossi", "citta": "Milano", "settore": "Automotive", "partita_iva": "Sì", "agente_isenarco": "No"},
+}
+
+def genera_venditori(n, seed=42):
+    """
+    Genera n venditori deterministici come tuple per add_venditore/add_venditori_bulk.
+    """
+    return [per_inserimento(riga) for riga in GeneratoreVenditori(seed).righe(n)]
+
+def statistiche(tempi):
+    """
+    Riassume una serie di tempi (in secondi).
+    """
+    ordinati = sorted(tempi)
+    return {
+        "ripetizioni": len(ordinati),
+        "min_s": ordinati[0],
+        "mediana_s": statistics.median(ordinati),
+        "p95_s": ordinati[min(len(ordinati) - 1, int(round(0.95 * (len(ordinati) - 1))))],
+        "max_s": ordinati[-1],
+    }
+
+def misura(funzione, ripetizioni=5, prepara=None):
+    """
+    Esegue la funzione più volte e restituisce le statistiche dei tempi.
+    :param prepara: Funzione opzionale eseguita prima di ogni ripetizione, esclusa dalla misura.
+    """
+    tempi = []
+    for _ in range(ripetizioni):
+        if prepara:
+            prepara()
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append(time.perf_counter() - inizio)
+    return statistiche(tempi)
+
+class Benchmark:
+    def __init__(self, database, ripetizioni, seed):
+        self.database = database
+        self.ripetizioni = ripetizioni
+        self.seed = seed
+        self.connection = None
+
+    def connetti(self):
+        if get_backend() == 'sqlite':
+            self.connection = create_connection(database=f"{self.database}.db")
+            if not self.connection:
+                sys.exit(f"Impossibile aprire il database '{self.database}.db'.")
+            return
+        server = create_connection(database=None)
+        if not server:
+            sys.exit("Impossibile connettersi al server MySQL.")
+        cursor = server.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{self.database}`")
+        cursor.close()
+        server.close()
+        self.connection = create_connection(database=self.database)
+        if not self.connection:
+            sys.exit(f"Impossibile connettersi al database '{self.database}'.")
+
+    def nuova_connessione(self):
+        """
+        Connessione aggiuntiva allo stesso database, per le operazioni su più connessioni.
+        """
+        if get_backend() == 'sqlite':
+            return create_connection(database=f"{self.database}.db")
+        return create_connection(database=self.database)
+
+    def svuota(self):
+        cursor = self.connection.cursor()
+        for tabella in ("venditori", "settori", TABELLA_MODIFICHE):
+            cursor.execute(f"DROP TABLE IF EXISTS `{tabella}`")
+        self.connection.commit()
+        cursor.close()
+        initialize_settori(self.connection)
+        initialize_venditori(self.connection)
+        initialize_modifiche(self.connection)
+        for settore in SETTORI:
+            add_settore(self.connection, settore)
+
+    def popola(self, righe, blocco=10000):
+        self.svuota()
+        for venditori in GeneratoreVenditori(self.seed).blocchi(righe, blocco):
+            add_venditori_bulk(self.connection, [per_inserimento(riga) for riga in venditori])
+
+    def scenario_search(self, righe):
+        self.popola(righe)
+        risultati = {}
+        for nome, filtri in FILTRI_RICERCA.items():
+            risultati[f"search/{nome}/{righe}"] = misura(
+                lambda: search_venditori(self.connection, **filtri), self.ripetizioni
+            )
+        return risultati
+
+    def scenario_bulk(self, dimensioni):
+        risultati = {}
+        singoli = min(dimensioni)
+        venditori = genera_venditori(singoli, self.seed)
+
+        def inserimenti_singoli():
+            for venditore in venditori:
+                add_venditore(self.connection, venditore)
+        statistiche_singoli = misura(inserimenti_singoli, self.ripetizioni, self.svuota)
+        statistiche_singoli["righe_al_secondo"] = singoli / statistiche_singoli["mediana_s"]
+        risultati[f"insert/add_venditore/{singoli}"] = statistiche_singoli
+
+        for dimensione in dimensioni:
+            venditori = genera_venditori(dimensione, self.seed)
+            statistiche_bulk = misura(
+                lambda: add_venditori_bulk(self.connection, venditori), self.ripetizioni, self.svuota
+            )
+            statistiche_bulk["righe_al_secondo"] = dimensione / statistiche_bulk["mediana_s"]
+            risultati[f"insert/add_venditori_bulk/{dimensione}"] = statistiche_bulk
+        return risultati
+
+    def scenario_emails(self, dimensioni):
+        self.popola(max(dimensioni))
+        risultati = {}
+        for dimensione in dimensioni:
+            # Metà delle email esiste, metà no (le righe oltre la dimensione della tabella)
+            emails = [venditore[1] for venditore in genera_venditori(dimensione * 2, self.seed)][::2]
+            risultati[f"get_existing_emails/{dimensione}"] = misura(
+                lambda: get_existing_emails(self.connection, emails), self.ripetizioni
+            )
+        return risultati
+
+    def scenario_backup(self, dimensioni, parallelismo=None):
+        """
+        Backup e ripristino su una sola connessione e, con il suffisso '_parallelo', con le
+        tabelle lette o caricate contemporaneamente su più connessioni.
+        """
+        risultati = {}
+        for dimensione in dimensioni:
+            self.popola(dimensione)
+            for variante, crea_connessione in (("", None), ("_parallelo", self.nuova_connessione)):
+                archivio = {}
+
+                def backup():
+                    successo, dati = backup_database_python(
+                        self.connection, crea_connessione=crea_connessione, parallelismo=parallelismo
+                    )
+                    if not successo:
+                        raise RuntimeError(dati)
+                    archivio["dati"] = dati
+                statistiche_backup = misura(backup, self.ripetizioni)
+                statistiche_backup["byte"] = len(archivio["dati"])
+                risultati[f"backup{variante}/{dimensione}"] = statistiche_backup
+
+                def restore():
+                    successo, messaggio = restore_database_python(
+                        self.connection, archivio["dati"], crea_connessione=crea_connessione, parallelismo=parallelismo
+                    )
+                    if not successo:
+                        raise RuntimeError(messaggio)
+                risultati[f"restore{variante}/{dimensione}"] = misura(restore, self.ripetizioni)
+        return risultati
+
+    def scenario_compressione(self, righe, codec, workers):
+        """
+        Confronta i codec di backup_database_python (durata, byte dell'archivio e durata del
+        ripristino) con un solo thread di compressione e con quelli indicati.
+        """
+        risultati = {}
+        self.popola(righe)
+        for nome in codec:
+            for n in sorted({1, workers}):
+                archivio = {}
+
+                def backup():
+                    successo, dati = backup_database_python(self.connection, codec=nome, workers=n)
+                    if not successo:
+                        raise RuntimeError(dati)
+                    archivio["dati"] = dati
+                statistiche_backup = misura(backup, self.ripetizioni)
+                statistiche_backup["byte"] = len(archivio["dati"])
+                risultati[f"compressione/{nome}/workers_{n}/{righe}"] = statistiche_backup
+            risultati[f"compressione/{nome}/restore/{righe}"] = misura(
+                lambda: restore_database_python(self.connection, archivio["dati"]), self.ripetizioni
+            )
+        return risultati
+
+def _versione_git():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def confronta(risultati, baseline, tolleranza):
+    """
+    Confronta le mediane con quelle della baseline.
+    :return: Lista di tuple (nome, mediana_baseline, mediana_attuale, variazione) delle regressioni.
+    """
+    regressioni = []
+    for nome, attuale in risultati.items():
+        precedente = baseline.get(nome)
+        if not precedente or not precedente.get("mediana_s"):
+            continue
+        variazione = attuale["mediana_s"] / precedente["mediana_s"] - 1
+        print(f"{nome:<45} {precedente['mediana_s']:>10.4f}s -> {attuale['mediana_s']:>10.4f}s ({variazione:+.1%})")
+        if variazione > tolleranza:
+            regressioni.append((nome, precedente["mediana_s"], attuale["mediana_s"], variazione))
+    return regressioni
+
+def _interi(testo):
+    return [int(valore) for valore in testo.split(",") if valore.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del livello di accesso ai dati su MySQL locale (o SQLite).")
+    parser.add_argument("--database", default=os.getenv("BENCH_DB_DATABASE", "venditori_bench"),
+                        help="Database dedicato al benchmark (verrà svuotato).")
+    parser.add_argument("--scenari", default="search,bulk,emails,backup",
+                        help="Scenari da eseguire, separati da virgola.")
+    parser.add_argument("--righe-ricerca", type=int, default=100000, help="Righe in tabella per lo scenario search.")
+    parser.add_argument("--dimensioni-bulk", default="100,1000,10000", help="Dimensioni dei lotti per add_venditori_bulk.")
+    parser.add_argument("--dimensioni-email", default="1000,10000,50000", help="Numero di email per get_existing_emails.")
+    parser.add_argument("--dimensioni-backup", default="10000,100000,1000000", help="Righe per backup e ripristino.")
+    parser.add_argument("--parallelismo", type=int, help="Tabelle elaborate contemporaneamente nello scenario backup (predefinito BACKUP_PARALLELISM).")
+    parser.add_argument("--righe-compressione", type=int, default=100000, help="Righe per il confronto dei codec di backup.")
+    parser.add_argument("--codec", default="deflate-1,deflate,deflate-9,store",
+                        help="Codec di backup confrontati dallo scenario compressione (anche zstd, lz4 se installati).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Thread di compressione confrontati con l'esecuzione a thread singolo.")
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json", help="File JSON dei risultati.")
+    parser.add_argument("--baseline", help="File JSON di una esecuzione precedente con cui confrontare.")
+    parser.add_argument("--tolleranza", type=float, default=0.2,
+                        help="Peggioramento massimo della mediana rispetto alla baseline (0.2 = 20%%).")
+    parser.add_argument("--salva-baseline", help="Salva i risultati anche come nuova baseline in questo file.")
+    args = parser.parse_args()
+
+    if args.database == os.getenv("DB_DATABASE", "railway"):
+        sys.exit("Il database del benchmark coincide con DB_DATABASE: scegline uno dedicato con --database.")
+
+    benchmark = Benchmark(args.database, args.ripetizioni, args.seed)
+    benchmark.connetti()
+
+    scenari = {
+        "search": lambda: benchmark.scenario_search(args.righe_ricerca),
+        "bulk": lambda: benchmark.scenario_bulk(_interi(args.dimensioni_bulk)),
+        "emails": lambda: benchmark.scenario_emails(_interi(args.dimensioni_email)),
+        "backup": lambda: benchmark.scenario_backup(_interi(args.dimensioni_backup), args.parallelismo),
+        "compressione": lambda: benchmark.scenario_compressione(
+            args.righe_compressione, [c.strip() for c in args.codec.split(",") if c.strip()], args.workers
+        ),
+    }
+    risultati = {}
+    for nome in [s.strip() for s in args.scenari.split(",") if s.strip()]:
+        if nome not in scenari:
+            sys.exit(f"Scenario sconosciuto: {nome}. Disponibili: {', '.join(scenari)}")
+        print(f"Esecuzione scenario '{nome}'...")
+        risultati.update(scenari[nome]())
+
+    cursor = benchmark.connection.cursor()
+    cursor.execute("SELECT VERSION()")
+    versione_database = cursor.fetchone()[0]
+    cursor.close()
+    benchmark.connection.close()
+
+    documento = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git": _versione_git(),
+            "python": platform.python_version(),
+            "backend": get_backend(),
+            "database": versione_database,
+            "host": platform.node(),
+            "ripetizioni": args.ripetizioni,
+            "seed": args.seed,
+        },
+        "risultati": risultati,
+    }
+    for percorso in filter(None, [args.output, args.salva_baseline]):
+        with open(percorso, "w") as f:
+            json.dump(documento, f, indent=2)
+        print(f"Risultati salvati in '{percorso}'.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["risultati"]
+        regressioni = confronta(risultati, baseline, args.tolleranza)
+        if regressioni:
+            print(f"\n{len(regressioni)} regressioni oltre il {args.tolleranza:.0%}:")
+            for nome, prima, dopo, variazione in regressioni:
+                print(f"  {nome}: {prima:.4f}s -> {dopo:.4f}s ({variazione:+.1%})")
+            sys.exit(1)
+        print("\nNessuna regressione rispetto alla baseline.")
+
+if __name__ == "__main__":
+    main()
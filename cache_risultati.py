@@ -0,0 +1,248 @@
+# cache_risultati.py
+#
+# Cache dei risultati di ricerca condivisa da tutte le sessioni Streamlit del processo.
+# Ogni voce è indicizzata dai filtri normalizzati e dalle colonne richieste, ed è valida per
+# una sola versione dei dati (il contatore delle scritture, vedi get_versione_dati): una scrittura
+# qualsiasi rende le voci superate senza bisogno di invalidarle a mano. Le sessioni conservano solo i filtri e la
+# posizione di scorrimento, non le righe.
+# Dopo la scrittura di un singolo venditore, aggiorna_dopo_scrittura porta le ricerche in cache alla
+# nuova versione modificandole in memoria, senza ripetere le query.
+
+import bisect
+import operator
+import os
+import threading
+from collections import OrderedDict
+from db_connection import search_venditori, get_facette, get_versione_dati, colonne_proiezione, COLONNE_VENDITORE
+from metrics import RICHIESTE_CACHE
+
+# Limiti della cache: numero di ricerche diverse e righe totali conservate
+MAX_VOCI = int(os.getenv('CACHE_RISULTATI_MAX_VOCI', 256))
+MAX_RIGHE = int(os.getenv('CACHE_RISULTATI_MAX_RIGHE', 200000))
+
+FILTRI_RICERCA = ('nome', 'citta', 'settore', 'partita_iva', 'agente_isenarco',
+                  'esperienza_min', 'esperienza_max', 'anno_nascita_min', 'anno_nascita_max',
+                  'data_creazione_da', 'data_creazione_a')
+
+# Filtri per intervallo: colonna e confronto (estremi inclusi, come in search_venditori)
+INTERVALLI = {
+    'esperienza_min': ('esperienza_vendita', operator.ge),
+    'esperienza_max': ('esperienza_vendita', operator.le),
+    'anno_nascita_min': ('anno_nascita', operator.ge),
+    'anno_nascita_max': ('anno_nascita', operator.le),
+    'data_creazione_da': ('data_creazione', operator.ge),
+    'data_creazione_a': ('data_creazione', operator.le),
+}
+
+def normalizza_filtri(**filtri):
+    """
+    Riduce i filtri di search_venditori a una chiave stabile: i valori vuoti equivalgono a
+    nessun filtro, il nome, cercato con LIKE senza distinzione di maiuscole, è in minuscolo
+    e le liste di valori (città, settori) sono ordinate.
+    :return: Tuple ordinata di coppie (filtro, valore) con i soli filtri attivi.
+    """
+    chiave = []
+    for nome in FILTRI_RICERCA:
+        valore = filtri.get(nome)
+        if valore is None or valore == '' or valore == [] or valore == ():
+            continue
+        if nome == 'nome':
+            valore = valore.lower()
+        elif isinstance(valore, (list, tuple, set)):
+            valore = tuple(sorted(set(valore)))
+        chiave.append((nome, valore))
+    return tuple(chiave)
+
+class CacheRisultati:
+    """
+    Cache LRU limitata per numero di voci e di righe. Le ricerche identiche in corso
+    contemporaneamente vengono calcolate una volta sola.
+    """
+
+    def __init__(self, max_voci=MAX_VOCI, max_righe=MAX_RIGHE):
+        self.max_voci = max_voci
+        self.max_righe = max_righe
+        self._voci = OrderedDict()
+        self._righe = 0
+        self._lock = threading.Lock()
+        self._in_calcolo = {}
+
+    def _rimuovi(self, chiave):
+        _, righe = self._voci.pop(chiave)
+        self._righe -= len(righe)
+
+    def _salva(self, chiave, versione, righe):
+        if chiave in self._voci:
+            if self._voci[chiave][0] > versione:
+                # Risultato calcolato su una replica in ritardo: si tiene quello più recente
+                return
+            self._rimuovi(chiave)
+        if len(righe) > self.max_righe:
+            return
+        self._voci[chiave] = (versione, righe)
+        self._righe += len(righe)
+        while len(self._voci) > self.max_voci or self._righe > self.max_righe:
+            self._rimuovi(next(iter(self._voci)))
+
+    def ottieni(self, chiave, versione, calcola):
+        """
+        Restituisce le righe in cache per chiave e versione, calcolandole con 'calcola' se mancano.
+        :return: Tuple di righe (da non modificare: sono condivise tra le sessioni).
+        """
+        while True:
+            with self._lock:
+                voce = self._voci.get(chiave)
+                if voce is not None and voce[0] == versione:
+                    self._voci.move_to_end(chiave)
+                    RICHIESTE_CACHE.inc("hit")
+                    return voce[1]
+                evento = self._in_calcolo.get((chiave, versione))
+                if evento is None:
+                    evento = self._in_calcolo[(chiave, versione)] = threading.Event()
+                    break
+            # Un'altra sessione sta calcolando la stessa ricerca: si attende il suo risultato
+            evento.wait()
+
+        RICHIESTE_CACHE.inc("miss")
+        try:
+            righe = tuple(calcola())
+            with self._lock:
+                self._salva(chiave, versione, righe)
+            return righe
+        finally:
+            with self._lock:
+                del self._in_calcolo[(chiave, versione)]
+            evento.set()
+
+    def aggiorna_voci(self, versione_precedente, versione, aggiorna):
+        """
+        Porta alla nuova versione le voci calcolate sulla versione precedente.
+        :param aggiorna: Funzione (chiave, righe) -> nuove righe, oppure None se la voce non si può
+                         aggiornare in memoria (viene scartata e ricalcolata alla prossima richiesta).
+        """
+        with self._lock:
+            for chiave, (voce_versione, righe) in list(self._voci.items()):
+                if voce_versione != versione_precedente:
+                    continue
+                nuove = aggiorna(chiave, righe)
+                if nuove is None:
+                    self._rimuovi(chiave)
+                    continue
+                # L'assegnazione a una chiave esistente ne conserva la posizione LRU
+                self._voci[chiave] = (versione, nuove)
+                self._righe += len(nuove) - len(righe)
+            while self._righe > self.max_righe:
+                self._rimuovi(next(iter(self._voci)))
+
+    def statistiche(self):
+        with self._lock:
+            return {'voci': len(self._voci), 'righe': self._righe}
+
+# Cache del processo, condivisa da tutte le sessioni
+cache = CacheRisultati()
+
+def cerca_venditori(connection, campi=None, ordina=None, limite=None, **filtri):
+    """
+    Come search_venditori, ma attraverso la cache condivisa.
+    :param connection: Connessione da usare sia per la versione dei dati sia per la ricerca.
+    :param campi: Colonne da restituire (es. COLONNE_RIEPILOGO per gli elenchi); None per tutte.
+    :param ordina: Colonne di ordinamento (vedi search_venditori).
+    :param limite: Numero massimo di venditori restituiti; None per tutti.
+    :param filtri: I filtri di FILTRI_RICERCA.
+    :return: Tuple di venditori.
+    """
+    filtri = normalizza_filtri(**filtri)
+    campi = colonne_proiezione(campi)
+    ordina = tuple(ordina or ())
+
+    def calcola():
+        return search_venditori(connection, campi=campi, ordina=ordina, limite=limite, **dict(filtri))
+
+    versione = get_versione_dati(connection)
+    if versione is None:
+        # Versione non disponibile: meglio non usare la cache che servire dati vecchi
+        return tuple(calcola())
+    return cache.ottieni((filtri, campi, ordina, limite), versione, calcola)
+
+def facette_venditori(connection, **filtri):
+    """
+    Come get_facette, ma attraverso la cache condivisa.
+    :return: Dizionario facetta -> lista di tuple (valore, conteggio).
+    """
+    filtri = normalizza_filtri(**filtri)
+
+    def calcola():
+        return tuple(get_facette(connection, **dict(filtri)).items())
+
+    versione = get_versione_dati(connection)
+    if versione is None:
+        return dict(calcola())
+    return dict(cache.ottieni(('facette', filtri), versione, calcola))
+
+def _corrisponde(venditore, filtri):
+    """
+    Verifica in memoria se un venditore soddisfa i filtri normalizzati, come le condizioni di search_venditori.
+    Solo gli intervalli numerici e di data sono verificabili così: il nome (LIKE) e i filtri per valore
+    (città, settore, partita_iva, agente_isenarco) il database li confronta con la collazione della
+    colonna, senza distinzione di maiuscole e accenti, che in Python non si riproduce fedelmente.
+    :param venditore: Dizionario colonna -> valore.
+    :return: Bool, oppure None se non verificabile senza il database.
+    """
+    for nome, valore in filtri:
+        if nome not in INTERVALLI:
+            return None
+        colonna, confronto = INTERVALLI[nome]
+        if venditore[colonna] is None or not confronto(venditore[colonna], valore):
+            return False
+    return True
+
+def _aggiorna_righe(chiave, righe, venditore_id, riga):
+    """
+    Applica a una ricerca in cache la scrittura di un venditore: lo toglie e, se soddisfa ancora i
+    filtri, lo rimette nella posizione data dall'ID. Solo per l'ordinamento per ID (quello predefinito)
+    e per i filtri che _corrisponde sa verificare: ordinamenti e confronti su testo dipendono dalla
+    collazione del database e la voce va ricalcolata.
+    :return: Nuove righe, oppure None se la voce va ricalcolata.
+    """
+    if chiave[0] == 'facette':
+        return None
+    filtri, campi, ordina, limite = chiave
+    if ordina not in ((), ('id',), ('-id',)) or 'id' not in campi:
+        return None
+    decrescente = ordina == ('-id',)
+    posizione_id = campi.index('id')
+    troncato = limite is not None and len(righe) >= limite
+    righe = [r for r in righe if r[posizione_id] != venditore_id]
+    if riga is not None:
+        venditore = dict(zip(COLONNE_VENDITORE, riga))
+        corrisponde = _corrisponde(venditore, filtri)
+        if corrisponde is None:
+            return None
+        if corrisponde:
+            chiavi = [-r[posizione_id] if decrescente else r[posizione_id] for r in righe]
+            indice = bisect.bisect_left(chiavi, -venditore_id if decrescente else venditore_id)
+            righe.insert(indice, tuple(venditore[colonna] for colonna in campi))
+    if troncato:
+        if len(righe) < limite:
+            # Il posto lasciato libero andrebbe occupato dal primo venditore oltre il limite
+            return None
+        righe = righe[:limite]
+    return tuple(righe)
+
+def aggiorna_dopo_scrittura(connection, versione_precedente, venditore_id, riga=None):
+    """
+    Aggiorna in memoria le ricerche in cache dopo l'inserimento, la modifica o l'eliminazione di
+    un solo venditore, così la scrittura non costringe a rileggere i risultati dal database.
+    Se nel frattempo ci sono state altre scritture le voci restano superate e vengono ricalcolate.
+    :param connection: Connessione usata per la scrittura.
+    :param versione_precedente: get_versione_dati letta prima della scrittura.
+    :param venditore_id: ID del venditore scritto.
+    :param riga: Riga salvata (restituita da add_venditore/update_venditore), None se eliminato.
+    """
+    versione = get_versione_dati(connection)
+    if versione_precedente is None or versione != versione_precedente + 1:
+        return
+    cache.aggiorna_voci(
+        versione_precedente, versione,
+        lambda chiave, righe: _aggiorna_righe(chiave, righe, venditore_id, riga)
+    )
@@ -0,0 +1,349 @@
+# coda_inserimenti.py
+#
+# Coda di inserimento "write-behind" per POST /inserisci_venditore in modalità asincrona
+# (header 'Prefer: respond-async'): la richiesta viene validata, scritta nel giornale su disco
+# e confermata subito con 202 e un ID di tracciamento; un thread in background raccoglie i
+# venditori in coda e li inserisce con INSERT multi-riga (add_venditori_bulk), al raggiungimento
+# di INSERT_QUEUE_BATCH_SIZE venditori o dopo INSERT_QUEUE_MAX_WAIT_MS millisecondi.
+# Il giornale (INSERT_QUEUE_JOURNAL, JSON Lines) viene riletto all'avvio: i venditori accodati
+# e non ancora inseriti non vanno persi con un riavvio. Le voci già scritte nel database vengono
+# tolte riscrivendo il giornale quando supera INSERT_QUEUE_JOURNAL_MAX_BYTES.
+# Coda, giornale ed esiti sono per processo: con più worker uvicorn ogni processo si riserva
+# (con un lock sul file '<giornale>.lock') il primo giornale libero tra INSERT_QUEUE_JOURNAL,
+# 'coda_inserimenti.1.jsonl', 'coda_inserimenti.2.jsonl', ... e al riavvio lo riprende.
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from db_connection import create_connection, add_venditori_bulk, add_settore, get_settori, ESITO_INSERITO
+from import_venditori import VALORI_SI_NO
+from metrics import INSERIMENTI_CODA, DIMENSIONE_BLOCCHI_CODA
+
+# Stati di un inserimento accodato
+IN_CODA = "in_coda"
+INSERITO = "inserito"
+DUPLICATO = "duplicato"
+ERRORE = "errore"
+
+# Esiti conservati in memoria per la consultazione (i più vecchi vengono dimenticati)
+MAX_ESITI = 100000
+
+# Giornali alternativi che un processo prova se quello configurato è in uso da un altro worker
+MAX_GIORNALI = 64
+
+try:
+    import fcntl
+except ImportError:
+    # Senza fcntl (Windows) il giornale non può essere riservato: un solo worker per giornale
+    fcntl = None
+
+def valida_venditore(venditore):
+    """
+    Controlli che il database farebbe fallire solo al momento dell'inserimento, quando il
+    client ha già ricevuto la conferma: vanno quindi eseguiti prima di accodare.
+    :param venditore: Tuple nell'ordine di add_venditore.
+    :return: Tuple (venditore normalizzato, None) oppure (None, messaggio di errore).
+    """
+    venditore = list(venditore)
+    for indice, campo in ((7, "partita_iva"), (8, "agente_isenarco")):
+        valore = VALORI_SI_NO.get(str(venditore[indice] or '').strip().lower())
+        if valore is None:
+            return None, f"Valore non valido per {campo}: ammessi Sì/No."
+        venditore[indice] = valore
+    if not str(venditore[6] or '').strip():
+        return None, "Il settore di esperienza è obbligatorio."
+    return tuple(venditore), None
+
+class CodaInserimenti:
+    """
+    Coda degli inserimenti con giornale su disco e thread di scrittura a blocchi.
+    """
+
+    def __init__(self, percorso_giornale=None, dimensione_blocco=None, attesa_massima=None, crea_connessione=create_connection,
+                 dimensione_giornale=None):
+        """
+        :param percorso_giornale: File del giornale (INSERT_QUEUE_JOURNAL); se è in uso da un altro
+                                  processo viene usato il primo giornale numerato libero.
+        :param dimensione_blocco: Venditori massimi per INSERT (INSERT_QUEUE_BATCH_SIZE).
+        :param attesa_massima: Secondi massimi di permanenza in coda prima della scrittura (INSERT_QUEUE_MAX_WAIT_MS).
+        :param crea_connessione: Funzione che apre una connessione al database.
+        :param dimensione_giornale: Byte oltre i quali il giornale viene compattato (INSERT_QUEUE_JOURNAL_MAX_BYTES).
+        """
+        self.percorso_giornale = percorso_giornale or os.getenv('INSERT_QUEUE_JOURNAL', 'coda_inserimenti.jsonl')
+        self.dimensione_giornale = dimensione_giornale or int(os.getenv('INSERT_QUEUE_JOURNAL_MAX_BYTES', 16 * 1024 * 1024))
+        self.dimensione_blocco = dimensione_blocco or int(os.getenv('INSERT_QUEUE_BATCH_SIZE', 500))
+        self.attesa_massima = attesa_massima if attesa_massima is not None else int(os.getenv('INSERT_QUEUE_MAX_WAIT_MS', 200)) / 1000
+        self.crea_connessione = crea_connessione
+        self._coda = []          # (id, venditore, istante di accodamento)
+        self._esiti = OrderedDict()
+        self._lock = threading.Lock()
+        self._condizione = threading.Condition(self._lock)
+        self._giornale = None
+        self._percorso = None        # giornale riservato da questo processo
+        self._lock_giornale = None
+        self._soglia_compattazione = self.dimensione_giornale
+        self._thread = None
+        self._ferma = False
+
+    # Giornale
+
+    def _scrivi_giornale(self, voci):
+        """
+        Aggiunge voci al giornale e le rende durevoli (fsync) prima di restituire il controllo.
+        Va chiamata con il lock acquisito.
+        """
+        for voce in voci:
+            self._giornale.write(json.dumps(voce, ensure_ascii=False) + "\n")
+        self._giornale.flush()
+        os.fsync(self._giornale.fileno())
+
+    def _rileggi_giornale(self):
+        """
+        Ricostruisce coda ed esiti dal giornale lasciato dall'esecuzione precedente.
+        Un'ultima riga troncata (scrittura interrotta) viene ignorata.
+        """
+        if not os.path.exists(self._percorso):
+            return
+        in_coda = OrderedDict()
+        with open(self._percorso, encoding='utf-8') as f:
+            for riga in f:
+                try:
+                    voce = json.loads(riga)
+                except ValueError:
+                    continue
+                if 'venditore' in voce:
+                    in_coda[voce['id']] = tuple(voce['venditore'])
+                    self._esiti[voce['id']] = {'stato': IN_CODA, 'messaggio': None}
+                else:
+                    in_coda.pop(voce['id'], None)
+                    self._esiti[voce['id']] = {'stato': voce['stato'], 'messaggio': voce.get('messaggio')}
+        adesso = time.monotonic()
+        self._coda = [(id_inserimento, venditore, adesso) for id_inserimento, venditore in in_coda.items()]
+        if self._coda:
+            print(f"{len(self._coda)} inserimenti in coda ripresi dal giornale {self._percorso}.")
+
+    def _riserva_giornale(self):
+        """
+        Riserva a questo processo il primo giornale non bloccato da un altro processo.
+        :return: Percorso del giornale riservato.
+        """
+        if fcntl is None:
+            return self.percorso_giornale
+        radice, estensione = os.path.splitext(self.percorso_giornale)
+        for numero in range(MAX_GIORNALI):
+            percorso = self.percorso_giornale if numero == 0 else f"{radice}.{numero}{estensione}"
+            file_lock = open(percorso + ".lock", 'a')
+            try:
+                fcntl.flock(file_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                file_lock.close()
+                continue
+            self._lock_giornale = file_lock
+            return percorso
+        raise RuntimeError(f"Nessun giornale libero per la coda inserimenti ({MAX_GIORNALI} in uso).")
+
+    def _compatta_giornale(self):
+        """
+        Toglie dal giornale le voci già scritte nel database: con la coda vuota lo svuota, altrimenti,
+        oltre la soglia, lo riscrive con i soli venditori in coda (file temporaneo e os.replace, così
+        un'interruzione lascia il giornale vecchio o quello nuovo). Va chiamata con il lock acquisito.
+        """
+        if not self._coda:
+            if self._giornale.tell() > 0:
+                self._giornale.truncate(0)
+                self._giornale.seek(0)
+                self._giornale.flush()
+                os.fsync(self._giornale.fileno())
+            self._soglia_compattazione = self.dimensione_giornale
+            return
+        if self._giornale.tell() <= self._soglia_compattazione:
+            return
+        temporaneo = self._percorso + ".tmp"
+        with open(temporaneo, 'w', encoding='utf-8') as f:
+            for id_inserimento, venditore, _ in self._coda:
+                f.write(json.dumps({'id': id_inserimento, 'venditore': list(venditore)}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaneo, self._percorso)
+        self._giornale.close()
+        self._giornale = open(self._percorso, 'a', encoding='utf-8')
+        # Una coda lunga non deve far riscrivere il giornale a ogni blocco
+        self._soglia_compattazione = max(self.dimensione_giornale, 2 * self._giornale.tell())
+
+    # Interfaccia
+
+    def avvia(self):
+        """
+        Riprende gli inserimenti rimasti nel giornale e avvia il thread di scrittura.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self._percorso is None:
+                self._percorso = self._riserva_giornale()
+            self._rileggi_giornale()
+            self._giornale = open(self._percorso, 'a', encoding='utf-8')
+            self._ferma = False
+            self._thread = threading.Thread(target=self._esegui, name="coda-inserimenti", daemon=True)
+            self._thread.start()
+
+    def ferma(self, timeout=30):
+        """
+        Scrive quanto resta in coda (se il database risponde) e ferma il thread.
+        Ciò che non è stato scritto resta nel giornale per il prossimo avvio.
+        """
+        with self._condizione:
+            if self._thread is None:
+                return
+            self._ferma = True
+            self._condizione.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print("Coda inserimenti: scrittura ancora in corso alla chiusura, il giornale resta aperto.")
+            return
+        with self._lock:
+            self._thread = None
+            self._giornale.close()
+            self._giornale = None
+            if self._lock_giornale is not None:
+                self._lock_giornale.close()
+                self._lock_giornale = None
+                self._percorso = None
+
+    def accoda(self, venditore):
+        """
+        Accoda un venditore da inserire, dopo averlo scritto nel giornale.
+        :param venditore: Tuple nell'ordine di add_venditore (già validata con valida_venditore).
+        :return: ID di tracciamento dell'inserimento.
+        """
+        id_inserimento = uuid.uuid4().hex
+        with self._condizione:
+            if self._giornale is None:
+                raise RuntimeError("Coda inserimenti non avviata.")
+            self._scrivi_giornale([{'id': id_inserimento, 'venditore': list(venditore)}])
+            self._coda.append((id_inserimento, tuple(venditore), time.monotonic()))
+            self._registra_esito(id_inserimento, IN_CODA)
+            # Il primo venditore fa partire il tempo di attesa, un blocco pieno la scrittura immediata
+            if len(self._coda) == 1 or len(self._coda) >= self.dimensione_blocco:
+                self._condizione.notify_all()
+        INSERIMENTI_CODA.inc(IN_CODA)
+        return id_inserimento
+
+    def stato(self, id_inserimento):
+        """
+        :return: Dizionario {'stato', 'messaggio'} dell'inserimento, o None se sconosciuto.
+        """
+        with self._lock:
+            esito = self._esiti.get(id_inserimento)
+            return dict(esito) if esito else None
+
+    def statistiche(self):
+        with self._lock:
+            return {'in_coda': len(self._coda), 'esiti': len(self._esiti)}
+
+    # Scrittura a blocchi
+
+    def _registra_esito(self, id_inserimento, stato, messaggio=None):
+        # Va chiamata con il lock acquisito
+        self._esiti[id_inserimento] = {'stato': stato, 'messaggio': messaggio}
+        self._esiti.move_to_end(id_inserimento)
+        while len(self._esiti) > MAX_ESITI:
+            self._esiti.popitem(last=False)
+
+    def _esegui(self):
+        attesa_errore = 1
+        while True:
+            with self._condizione:
+                while not self._ferma:
+                    if len(self._coda) >= self.dimensione_blocco:
+                        break
+                    if self._coda:
+                        residuo = self._coda[0][2] + self.attesa_massima - time.monotonic()
+                        if residuo <= 0:
+                            break
+                        self._condizione.wait(residuo)
+                    else:
+                        self._condizione.wait()
+                blocco = self._coda[:self.dimensione_blocco]
+                if not blocco:
+                    return
+            if self._scrivi_blocco(blocco):
+                attesa_errore = 1
+            elif self._ferma:
+                return
+            else:
+                # Database non raggiungibile: il blocco resta in coda e si riprova con backoff
+                with self._condizione:
+                    self._condizione.wait(attesa_errore)
+                attesa_errore = min(attesa_errore * 2, 30)
+
+    def _scrivi_blocco(self, blocco):
+        """
+        Inserisce un blocco con una sola INSERT multi-riga e registra l'esito di ogni venditore.
+        Se l'INSERT fallisce per i dati, i venditori vengono inseriti uno per volta per isolare
+        quelli non validi.
+        :return: False se il database non è raggiungibile (il blocco resta in coda).
+        """
+        connection = self.crea_connessione()
+        if not connection:
+            return False
+        try:
+            inizio = time.perf_counter()
+            esiti = self._inserisci(connection, [venditore for _, venditore, _ in blocco])
+        finally:
+            connection.close()
+        if esiti is None:
+            return False
+        DIMENSIONE_BLOCCHI_CODA.osserva(len(blocco))
+        voci = [
+            {'id': id_inserimento, 'stato': stato, 'messaggio': messaggio}
+            for (id_inserimento, _, _), (stato, messaggio) in zip(blocco, esiti)
+        ]
+        with self._lock:
+            self._scrivi_giornale(voci)
+            del self._coda[:len(blocco)]
+            for voce in voci:
+                self._registra_esito(voce['id'], voce['stato'], voce['messaggio'])
+            self._compatta_giornale()
+        for stato, _ in esiti:
+            INSERIMENTI_CODA.inc(stato)
+        print(f"Coda inserimenti: {len(blocco)} venditori scritti in {time.perf_counter() - inizio:.3f}s.")
+        return True
+
+    def _inserisci(self, connection, venditori):
+        """
+        :return: Lista di tuple (stato, messaggio) nell'ordine dei venditori, oppure None se il
+                 database non è raggiungibile.
+        """
+        settori = set(get_settori(connection))
+        for settore in {venditore[6] for venditore in venditori} - settori:
+            add_settore(connection, settore)
+
+        # Esiti stabiliti nella transazione dell'INSERT: un'email inserita nel frattempo da altri
+        # risulta duplicata, non inserita
+        successo, esiti = add_venditori_bulk(connection, venditori, overwrite=False, esiti=True)
+        if successo:
+            return [self._esito(esito) for esito in esiti]
+        if not connection.is_connected():
+            return None
+        # Blocco rifiutato per i dati di qualche venditore: si isolano inserendoli uno per volta
+        esiti_singoli = []
+        for venditore in venditori:
+            successo, esiti = add_venditori_bulk(connection, [venditore], overwrite=False, esiti=True)
+            if successo:
+                esiti_singoli.append(self._esito(esiti[0]))
+            elif not connection.is_connected():
+                return None
+            else:
+                esiti_singoli.append((ERRORE, "Inserimento rifiutato dal database."))
+        return esiti_singoli
+
+    @staticmethod
+    def _esito(esito):
+        return (INSERITO, None) if esito == ESITO_INSERITO else (DUPLICATO, "Email già presente.")
+
+# Coda del processo, avviata dall'API (vedi lifespan in api.py)
+coda = CodaInserimenti()
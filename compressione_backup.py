@@ -0,0 +1,237 @@
+# compressione_backup.py
+#
+# Compressione degli archivi di backup (vedi backup_database_python). L'archivio resta uno ZIP
+# con un CSV per tabella; il codec si sceglie con il parametro codec o con BACKUP_CODEC:
+# - 'deflate' / 'deflate-1' ... 'deflate-9': ZIP standard, leggibile da qualunque strumento
+#   (predefinito: livello 6, come zipfile.ZIP_DEFLATED);
+# - 'store': nessuna compressione;
+# - 'zstd' / 'zstd-1' ... 'zstd-22' e 'lz4': richiedono i pacchetti opzionali zstandard e lz4.
+#   Il CSV compresso viene salvato nello ZIP senza ulteriore compressione, come
+#   'tabella.csv.zst' o 'tabella.csv.lz4'.
+# La compressione avviene su BACKUP_WORKERS thread (predefinito: numero di CPU), in parallelo
+# con la lettura delle tabelle successive: zlib, zstd e lz4 rilasciano il GIL. Le tabelle grandi
+# sono divise in blocchi compressi in parallelo anche con deflate, come fa pigz: ogni blocco
+# riparte dagli ultimi 32 KiB del precedente e termina con un flush di sincronizzazione, così
+# la concatenazione dei blocchi è un unico flusso deflate valido.
+# Il ripristino riconosce il codec di ogni tabella dall'estensione del file (apri_membro).
+# Ogni archivio contiene per primo il file manifest.json, con righe, colonne e SHA-256 del CSV
+# di ogni tabella: verifica_backup.py controlla l'archivio senza toccare il database.
+
+import hashlib
+import json
+import os
+import re
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+CODEC_PREDEFINITO = "deflate"
+LIVELLO_DEFLATE_PREDEFINITO = 6
+LIVELLO_ZSTD_PREDEFINITO = 3
+
+# Blocchi in cui vengono divisi i CSV da comprimere in parallelo con deflate
+DIMENSIONE_BLOCCO = 1024 * 1024
+# Finestra di deflate: ogni blocco può fare riferimento a questi byte del precedente
+FINESTRA_DEFLATE = 32 * 1024
+
+# Metodi di compressione dello standard ZIP
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+ESTENSIONI = {"zstd": ".csv.zst", "lz4": ".csv.lz4"}
+
+NOME_MANIFEST = "manifest.json"
+# Versione del formato del manifest
+FORMATO_MANIFEST = 1
+
+def _importa(codec):
+    # Pacchetti opzionali: importati solo se il codec viene usato
+    try:
+        if codec == "zstd":
+            import zstandard
+            return zstandard
+        import lz4.frame
+        return lz4.frame
+    except ImportError:
+        pacchetto = "zstandard" if codec == "zstd" else "lz4"
+        raise ValueError(f"Il codec '{codec}' richiede il pacchetto '{pacchetto}' (pip install {pacchetto}).")
+
+def risolvi_codec(codec=None):
+    """
+    Interpreta il nome di un codec.
+    :param codec: Nome del codec ('deflate-9', 'zstd', ...); se None si usa BACKUP_CODEC.
+    :return: Tuple (codec, livello).
+    :raises ValueError: Se il codec è sconosciuto o il pacchetto richiesto non è installato.
+    """
+    nome = (codec or os.getenv('BACKUP_CODEC', CODEC_PREDEFINITO)).strip().lower()
+    corrispondenza = re.fullmatch(r"(deflate|zstd|lz4|store)(?:-(\d+))?", nome)
+    if not corrispondenza:
+        raise ValueError(f"Codec di backup sconosciuto: '{nome}'. Disponibili: {', '.join(codec_disponibili())}")
+    tipo, livello = corrispondenza.group(1), corrispondenza.group(2)
+    if tipo == "deflate":
+        livello = int(livello or LIVELLO_DEFLATE_PREDEFINITO)
+        if not 1 <= livello <= 9:
+            raise ValueError("Il livello di deflate va da 1 a 9.")
+    elif tipo == "zstd":
+        livello = int(livello or LIVELLO_ZSTD_PREDEFINITO)
+        if not 1 <= livello <= 22:
+            raise ValueError("Il livello di zstd va da 1 a 22.")
+    elif livello is not None:
+        raise ValueError(f"Il codec '{tipo}' non ha livelli.")
+    if tipo in ESTENSIONI:
+        _importa(tipo)
+    return tipo, livello
+
+def codec_disponibili():
+    """
+    :return: Nomi dei codec utilizzabili con i pacchetti installati.
+    """
+    disponibili = ["deflate-1", "deflate", "deflate-9", "store"]
+    for tipo in ESTENSIONI:
+        try:
+            _importa(tipo)
+            disponibili.append(tipo)
+        except ValueError:
+            pass
+    return disponibili
+
+def _workers():
+    return int(os.getenv('BACKUP_WORKERS', 0)) or os.cpu_count() or 1
+
+def _comprimi_blocco_deflate(dati, inizio, fine, livello):
+    dizionario = bytes(dati[max(0, inizio - FINESTRA_DEFLATE):inizio])
+    compressore = zlib.compressobj(livello, zlib.DEFLATED, -15, zdict=dizionario) if dizionario \
+        else zlib.compressobj(livello, zlib.DEFLATED, -15)
+    compresso = compressore.compress(dati[inizio:fine])
+    # Solo l'ultimo blocco chiude il flusso
+    return compresso + compressore.flush(zlib.Z_FINISH if fine >= len(dati) else zlib.Z_SYNC_FLUSH)
+
+class ArchivioBackup:
+    """
+    Scrittore di archivi di backup: i CSV aggiunti vengono compressi in background e
+    l'archivio ZIP viene composto alla chiusura, nell'ordine di aggiunta.
+    """
+
+    def __init__(self, codec=None, workers=None):
+        """
+        :param codec: Nome del codec (vedi risolvi_codec).
+        :param workers: Thread di compressione (BACKUP_WORKERS).
+        """
+        self.tipo, self.livello = risolvi_codec(codec)
+        self.workers = workers or _workers()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backup")
+        self._membri = []
+        self._tabelle = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def aggiungi(self, tabella, dati, righe=None, colonne=None):
+        """
+        Accoda la compressione del CSV di una tabella.
+        :param dati: Contenuto del CSV in bytes.
+        :param righe: Numero di righe (esclusa l'intestazione), riportato nel manifest.
+        :param colonne: Colonne del CSV, riportate nel manifest.
+        """
+        impronta = self._executor.submit(lambda: hashlib.sha256(dati).hexdigest())
+        # Il CRC dello ZIP riguarda il contenuto non compresso dal metodo ZIP: per zstd e lz4
+        # è quello del file .zst/.lz4 e viene calcolato alla chiusura
+        crc = self._executor.submit(zlib.crc32, dati) if self.tipo in ("deflate", "store") else None
+        if self.tipo == "deflate":
+            nome, metodo = f"{tabella}.csv", ZIP_DEFLATED
+            blocchi = [
+                self._executor.submit(_comprimi_blocco_deflate, dati, inizio, inizio + DIMENSIONE_BLOCCO, self.livello)
+                for inizio in range(0, max(len(dati), 1), DIMENSIONE_BLOCCO)
+            ]
+        elif self.tipo == "store":
+            nome, metodo, blocchi = f"{tabella}.csv", ZIP_STORED, None
+        else:
+            nome, metodo = f"{tabella}{ESTENSIONI[self.tipo]}", ZIP_STORED
+            blocchi = [self._executor.submit(self._comprimi_esterno, dati)]
+        self._membri.append((nome, metodo, len(dati), dati, crc, blocchi))
+        self._tabelle[tabella] = {
+            "file": nome, "righe": righe, "colonne": list(colonne or []), "byte": len(dati), "sha256": impronta
+        }
+
+    def _comprimi_esterno(self, dati):
+        modulo = _importa(self.tipo)
+        if self.tipo == "zstd":
+            # zstd divide il lavoro tra più thread da sé
+            return modulo.ZstdCompressor(level=self.livello, threads=self.workers if self.workers > 1 else 0).compress(dati)
+        return modulo.compress(dati)
+
+    @property
+    def codec(self):
+        return self.tipo if self.livello is None else f"{self.tipo}-{self.livello}"
+
+    def chiudi(self, metadati=None):
+        """
+        Attende la compressione di tutte le tabelle e compone l'archivio, con il manifest in testa.
+        :param metadati: Dizionario di informazioni aggiuntive per il manifest (versione dello schema...).
+        :return: Contenuto dello ZIP in bytes.
+        """
+        tabelle = {
+            tabella: {**voce, "sha256": voce["sha256"].result()} for tabella, voce in self._tabelle.items()
+        }
+        manifest = {"formato": FORMATO_MANIFEST, **(metadati or {}), "codec": self.codec, "tabelle": tabelle}
+        manifest = json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8")
+        membri = [(NOME_MANIFEST, ZIP_STORED, len(manifest), manifest, None, None)] + self._membri
+
+        archivio = BytesIO()
+        directory = []
+        data, ora = _data_ora_dos(datetime.now())
+        for nome, metodo, dimensione, dati, crc, blocchi in membri:
+            contenuto = b"".join(blocco.result() for blocco in blocchi) if blocchi is not None else dati
+            if metodo == ZIP_STORED:
+                dimensione = len(contenuto)
+            nome_bytes = nome.encode("utf-8")
+            posizione = archivio.tell()
+            if max(dimensione, len(contenuto), posizione) >= 0xFFFFFFFF:
+                raise ValueError("Archivio di backup oltre i 4 GiB: non supportato.")
+            # Intestazioni ZIP (APPNOTE 4.3.7 e 4.3.12); flag 0x800: nomi in UTF-8
+            campi = (metodo, ora, data, crc.result() if crc else zlib.crc32(contenuto), len(contenuto), dimensione, len(nome_bytes))
+            archivio.write(struct.pack("<4s5H3L2H", b"PK\x03\x04", 20, 0x800, *campi, 0))
+            archivio.write(nome_bytes)
+            archivio.write(contenuto)
+            directory.append(struct.pack("<4s6H3L5H2L", b"PK\x01\x02", 20, 20, 0x800, *campi, 0, 0, 0, 0, 0, posizione) + nome_bytes)
+        inizio_directory = archivio.tell()
+        for voce in directory:
+            archivio.write(voce)
+        archivio.write(struct.pack(
+            "<4s4H2LH", b"PK\x05\x06", 0, 0, len(directory), len(directory),
+            archivio.tell() - inizio_directory, inizio_directory, 0
+        ))
+        return archivio.getvalue()
+
+def _data_ora_dos(istante):
+    data = (istante.year - 1980) << 9 | istante.month << 5 | istante.day
+    ora = istante.hour << 11 | istante.minute << 5 | istante.second // 2
+    return data, ora
+
+def tabella_membro(nome):
+    """
+    :return: Nome della tabella salvata nel file dell'archivio, o None se il file non è un CSV di tabella.
+    """
+    for estensione in (".csv", *ESTENSIONI.values()):
+        if nome.endswith(estensione):
+            return nome[:-len(estensione)]
+    return None
+
+def apri_membro(zipf, nome):
+    """
+    Apre in lettura il CSV di una tabella, decomprimendolo secondo l'estensione.
+    :param zipf: zipfile.ZipFile aperto in lettura.
+    :return: Oggetto file con il contenuto del CSV.
+    """
+    for tipo, estensione in ESTENSIONI.items():
+        if nome.endswith(estensione):
+            modulo = _importa(tipo)
+            if tipo == "zstd":
+                return modulo.ZstdDecompressor().stream_reader(zipf.open(nome))
+            return modulo.LZ4FrameFile(zipf.open(nome))
+    return zipf.open(nome)
@@ -0,0 +1,253 @@
+# dump_sql.py
+#
+# Lettura a flusso dei dump SQL di mysqldump (es. backup_manual_*.sql, anche compressi con gzip):
+# il file viene letto a blocchi e diviso in istruzioni senza mai caricarlo tutto in memoria.
+# In memoria resta una sola istruzione alla volta: mysqldump limita gli INSERT multi-riga a
+# net_buffer_length (1 MiB di default).
+# Il tokenizzatore riconosce stringhe tra apici (con gli escape con backslash di MySQL),
+# identificatori tra backtick, commenti '-- ', '#' e '/* */', commenti condizionali
+# '/*!40101 ... */' (mantenuti: il server MySQL li esegue) e il comando DELIMITER del client mysql.
+# Il ripristino vero e proprio è restore_dump_sql in db_connection.py.
+#
+# Esempi:
+#   python dump_sql.py backup_manual_20241228_124925.sql --analizza
+#   python dump_sql.py dump_grande.sql.gz
+
+import argparse
+import gzip
+import io
+import re
+import sys
+import time
+
+DIMENSIONE_LETTURA = 1 << 20
+
+# Stringhe tra apici: escape con backslash e apici raddoppiati (quantificatori possessivi:
+# nessun backtracking anche su stringhe di megabyte)
+STRINGA = {
+    "'": re.compile(r"'(?:[^'\\]++|\\.|'')*+'", re.S),
+    '"': re.compile(r'"(?:[^"\\]++|\\.|"")*+"', re.S),
+    "`": re.compile(r"`(?:[^`]++|``)*+`"),
+}
+
+_ESCAPE_MYSQL = {"0": "\x00", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+_LETTERALE = re.compile(r"(`(?:[^`]++|``)*+`)|'((?:[^'\\]++|\\.|'')*+)'", re.S)
+
+class _Contatore(io.RawIOBase):
+    """
+    Flusso in lettura che conta i byte letti dal file (compresso, se lo è).
+    """
+
+    def __init__(self, flusso):
+        self.flusso = flusso
+        self.byte_letti = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        dati = self.flusso.read(len(buffer))
+        buffer[:len(dati)] = dati
+        self.byte_letti += len(dati)
+        return len(dati)
+
+class LettoreDump:
+    """
+    Divide un dump SQL in istruzioni, leggendolo a blocchi.
+    """
+
+    def __init__(self, flusso, dimensione_lettura=DIMENSIONE_LETTURA):
+        """
+        :param flusso: File binario aperto in lettura; i file gzip vengono riconosciuti e decompressi.
+        :param dimensione_lettura: Caratteri letti per volta.
+        """
+        self._contatore = _Contatore(flusso)
+        binario = io.BufferedReader(self._contatore, 1 << 16)
+        if binario.peek(2)[:2] == b"\x1f\x8b":
+            binario = gzip.GzipFile(fileobj=binario)
+        self._testo_file = io.TextIOWrapper(binario, encoding="utf-8", newline="")
+        self.dimensione_lettura = dimensione_lettura
+        self._testo = ""
+        self._fine_file = False
+
+    @property
+    def byte_letti(self):
+        return self._contatore.byte_letti
+
+    def _leggi(self):
+        """
+        Aggiunge un blocco al testo letto. :return: False a fine file.
+        """
+        if self._fine_file:
+            return False
+        blocco = self._testo_file.read(self.dimensione_lettura)
+        if not blocco:
+            self._fine_file = True
+            return False
+        self._testo += blocco
+        return True
+
+    def _assicura(self, posizione):
+        """
+        Legge finché il testo contiene il carattere in posizione. :return: False se il file finisce prima.
+        """
+        while len(self._testo) <= posizione:
+            if not self._leggi():
+                return False
+        return True
+
+    def _cerca(self, testo_cercato, da):
+        """
+        Posizione di testo_cercato a partire da 'da', leggendo quanto serve. :return: -1 se manca.
+        """
+        while True:
+            posizione = self._testo.find(testo_cercato, da)
+            if posizione >= 0:
+                return posizione
+            da = max(da, len(self._testo) - len(testo_cercato) + 1)
+            if not self._leggi():
+                return -1
+
+    def _fine_stringa(self, apice, da):
+        """
+        Posizione successiva all'apice di chiusura della stringa che inizia in 'da'.
+        """
+        espressione = STRINGA[apice]
+        while True:
+            corrispondenza = espressione.match(self._testo, da)
+            # Un apice in fondo al testo letto potrebbe essere il primo di una coppia ('')
+            if corrispondenza and (corrispondenza.end() < len(self._testo) or self._fine_file):
+                return corrispondenza.end()
+            if not self._leggi():
+                if corrispondenza:
+                    return corrispondenza.end()
+                raise ValueError("Dump SQL troncato: stringa non chiusa a fine file.")
+
+    def istruzioni(self):
+        """
+        Genera le istruzioni del dump, senza delimitatore finale e senza i commenti (tranne quelli
+        condizionali '/*!...*/').
+        """
+        delimitatore = ";"
+        speciali = re.compile(r"['\"`#]|--|/\*|" + re.escape(delimitatore))
+        parti = []          # pezzi già ripuliti dell'istruzione corrente
+        inizio = 0          # primo carattere dell'istruzione non ancora copiato in parti
+        posizione = 0
+        in_testa = True     # nessun testo significativo dall'inizio dell'istruzione
+        while True:
+            # Il testo già consumato viene scartato: in memoria resta l'istruzione corrente
+            if inizio > self.dimensione_lettura:
+                self._testo = self._testo[inizio:]
+                posizione -= inizio
+                inizio = 0
+
+            if in_testa:
+                # Comando DELIMITER del client mysql (dump con trigger e procedure)
+                spazi = re.compile(r"\s*").match(self._testo, posizione).end()
+                if spazi == len(self._testo) and self._leggi():
+                    continue
+                self._assicura(spazi + 10)
+                if re.match(r"DELIMITER\s", self._testo[spazi:spazi + 10], re.I):
+                    fine_riga = self._cerca("\n", spazi)
+                    fine_riga = len(self._testo) if fine_riga < 0 else fine_riga
+                    delimitatore = self._testo[spazi + 10:fine_riga].strip() or ";"
+                    speciali = re.compile(r"['\"`#]|--|/\*|" + re.escape(delimitatore))
+                    inizio = posizione = fine_riga + 1
+                    continue
+                in_testa = False
+
+            corrispondenza = speciali.search(self._testo, posizione)
+            if corrispondenza is None:
+                # Le ultime posizioni possono contenere l'inizio di un delimitatore o commento
+                posizione = max(posizione, len(self._testo) - len(delimitatore) - 1)
+                if not self._leggi():
+                    break
+                continue
+            token, trovato = corrispondenza.group(), corrispondenza.start()
+
+            if token == delimitatore:
+                parti.append(self._testo[inizio:trovato])
+                istruzione = "".join(parti).strip()
+                if istruzione:
+                    yield istruzione
+                parti = []
+                inizio = posizione = corrispondenza.end()
+                in_testa = True
+            elif token in STRINGA:
+                posizione = self._fine_stringa(token, trovato)
+            elif token in ("#", "--"):
+                # '--' apre un commento solo se seguito da spazio o fine riga (come in MySQL)
+                if token == "--" and self._assicura(trovato + 2) and not self._testo[trovato + 2].isspace():
+                    posizione = trovato + 2
+                    continue
+                parti.append(self._testo[inizio:trovato])
+                fine_riga = self._cerca("\n", trovato)
+                inizio = posizione = len(self._testo) if fine_riga < 0 else fine_riga
+                in_testa = in_testa or not "".join(parti).strip()
+            else:
+                fine_commento = self._cerca("*/", trovato + 2)
+                if fine_commento < 0:
+                    raise ValueError("Dump SQL troncato: commento non chiuso a fine file.")
+                if self._testo[trovato + 2] == "!":
+                    # Commento condizionale: è codice per MySQL, resta nell'istruzione
+                    posizione = fine_commento + 2
+                else:
+                    parti.append(self._testo[inizio:trovato] + " ")
+                    inizio = posizione = fine_commento + 2
+                    in_testa = not "".join(parti).strip()
+
+        parti.append(self._testo[inizio:])
+        istruzione = "".join(parti).strip()
+        if istruzione:
+            yield istruzione
+
+def letterali_standard(istruzione):
+    """
+    Riscrive le stringhe in stile MySQL (escape con backslash) in SQL standard (solo apici
+    raddoppiati), per eseguire gli INSERT di un dump su SQLite.
+    """
+    def sostituisci(corrispondenza):
+        if corrispondenza.group(1) or "\\" not in corrispondenza.group(2):
+            # Identificatori e stringhe senza escape sono già validi
+            return corrispondenza.group(0)
+        valore = re.sub(
+            r"\\(.)|''",
+            lambda escape: _ESCAPE_MYSQL.get(escape.group(1), escape.group(1)) if escape.group(1) is not None else "'",
+            corrispondenza.group(2),
+            flags=re.S
+        )
+        return "'" + valore.replace("'", "''") + "'"
+    return _LETTERALE.sub(sostituisci, istruzione)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ripristina (o analizza) un dump SQL di mysqldump, leggendolo a flusso.")
+    parser.add_argument("dump", help="File .sql (anche .sql.gz).")
+    parser.add_argument("--analizza", action="store_true", help="Conta le istruzioni senza accedere al database.")
+    args = parser.parse_args()
+
+    with open(args.dump, "rb") as flusso:
+        if args.analizza:
+            lettore = LettoreDump(flusso)
+            conteggi = {}
+            for istruzione in lettore.istruzioni():
+                tipo = " ".join(istruzione.split(None, 2)[:2]).upper()
+                conteggi[tipo] = conteggi.get(tipo, 0) + 1
+            for tipo, numero in sorted(conteggi.items()):
+                print(f"{numero:>10}  {tipo}")
+            return
+
+        from db_connection import create_connection, restore_dump_sql
+        connection = create_connection()
+        if not connection:
+            sys.exit("Impossibile connettersi al database.")
+        inizio = time.perf_counter()
+
+        def progresso(byte_letti, istruzioni):
+            print(f"{byte_letti / 2 ** 20:,.1f} MiB letti, {istruzioni} istruzioni eseguite ({time.perf_counter() - inizio:.1f}s)")
+        successo, messaggio = restore_dump_sql(connection, flusso, progresso=progresso)
+        connection.close()
+    print(messaggio)
+    sys.exit(0 if successo else 1)
+
+if __name__ == "__main__":
+    main()
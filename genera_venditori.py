@@ -0,0 +1,269 @@
+# genera_venditori.py
+#
+# Generatore di venditori sintetici per test di carico e di scala.
+# A parità di seed produce sempre gli stessi dati.
+#
+# Esempi:
+#   python genera_venditori.py --righe 1000000 --output zip --file venditori_1M.zip
+#   python genera_venditori.py --righe 50000 --output csv --file venditori.csv
+#   python genera_venditori.py --righe 200000 --output mysql --cv-dir cv_files_test --percentuale-cv 0.1
+
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+import unicodedata
+import zipfile
+from datetime import datetime, timedelta
+
+# Righe generate con lo stesso stato casuale: il risultato dipende solo dal seed e non
+# dalla dimensione dei lotti scelta da chi consuma i dati
+BLOCCO_GENERAZIONE = 10000
+
+# Colonne nell'ordine di 'SELECT * FROM venditori', cioè quello dei CSV dei backup
+COLONNE_BACKUP = [
+    'id', 'nome_cognome', 'email', 'telefono', 'citta', 'esperienza_vendita', 'anno_nascita',
+    'settore_esperienza', 'partita_iva', 'data_creazione', 'cv', 'note', 'agente_isenarco'
+]
+# Colonne dell'esportazione/importazione CSV della scheda "Esporta/Importa Venditori"
+COLONNE_EXPORT = [
+    'id', 'nome_cognome', 'email', 'telefono', 'citta', 'esperienza_vendita', 'anno_nascita',
+    'settore_esperienza', 'partita_iva', 'agente_isenarco', 'cv', 'note', 'data_creazione'
+]
+
+SETTORI = [
+    "Agricoltura e Alimentare", "Automotive", "Beni di Consumo", "Edilizia", "Energia",
+    "Farmaceutico", "Informatica", "Moda e Abbigliamento", "Servizi Finanziari", "Turismo"
+]
+NOMI = [
+    "Alessandro", "Andrea", "Antonio", "Davide", "Federico", "Francesco", "Gabriele", "Giovanni",
+    "Giuseppe", "Lorenzo", "Luca", "Marco", "Matteo", "Mattia", "Paolo", "Pietro", "Riccardo",
+    "Roberto", "Simone", "Stefano", "Tommaso", "Alessandra", "Alice", "Anna", "Aurora", "Beatrice",
+    "Chiara", "Elena", "Elisa", "Francesca", "Giorgia", "Giulia", "Ilaria", "Laura", "Martina",
+    "Federica", "Sara", "Silvia", "Sofia", "Valentina", "Nicolò", "Noemi", "Greta"
+]
+COGNOMI = [
+    "Rossi", "Russo", "Ferrari", "Esposito", "Bianchi", "Romano", "Colombo", "Ricci", "Marino",
+    "Greco", "Bruno", "Gallo", "Conti", "De Luca", "Mancini", "Costa", "Giordano", "Rizzo",
+    "Lombardi", "Moretti", "Barbieri", "Fontana", "Santoro", "Mariani", "Rinaldi", "Caruso",
+    "Ferrara", "Galli", "Martini", "Leone", "Longo", "Gentile", "Martinelli", "Vitale", "Lombardo",
+    "Serra", "Coppola", "De Santis", "D'Angelo", "Marchetti", "Parisi", "Villa", "Conte", "Ferraro"
+]
+DOMINI = ["gmail.com", "libero.it", "hotmail.it", "outlook.it", "yahoo.it", "tiscali.it", "alice.it", "virgilio.it"]
+NOTE = [
+    "Disponibile da subito.", "Preferisce zona di residenza.", "Richiamare la prossima settimana.",
+    "Ottime referenze dal precedente mandante.", "Interessato solo a contratto da agente.",
+    "Portafoglio clienti consolidato.", "Colloquio conoscitivo svolto, profilo interessante.",
+    "Cerca integrazione al reddito.", "Automunito, disponibile a trasferte."
+]
+# Un PDF minimo valido, usato per i CV fittizi
+PDF_FITTIZIO = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+def carica_citta(percorso=None):
+    """
+    Carica le città da 'italian_cities.csv' (colonna 'denominazione_ita').
+    """
+    percorso = percorso or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'italian_cities.csv')
+    with open(percorso, encoding='utf-8-sig', newline='') as f:
+        lettore = csv.DictReader(f, delimiter=';')
+        citta = {riga['denominazione_ita'].strip() for riga in lettore if riga.get('denominazione_ita')}
+    return sorted(citta)
+
+def _ascii(testo):
+    """
+    Riduce un testo a caratteri ASCII minuscoli adatti a un indirizzo email.
+    """
+    testo = unicodedata.normalize('NFKD', testo).encode('ascii', 'ignore').decode('ascii')
+    return ''.join(c for c in testo.lower() if c.isalnum())
+
+class GeneratoreVenditori:
+    """
+    Genera venditori realistici in modo deterministico a partire da un seed.
+    """
+
+    def __init__(self, seed=42, citta=None, settori=None, cv_dir=None, percentuale_cv=0.0):
+        self.seed = seed
+        self.citta = citta or carica_citta()
+        self.settori = settori or SETTORI
+        self.cv_dir = cv_dir
+        self.percentuale_cv = percentuale_cv if cv_dir else 0.0
+        self.adesso = datetime(2025, 1, 1)
+        if self.cv_dir:
+            os.makedirs(self.cv_dir, exist_ok=True)
+
+    def _telefono(self, rng):
+        formato = rng.random()
+        if formato < 0.6:
+            return f"3{rng.randint(20, 93)}{rng.randint(1000000, 9999999)}"
+        if formato < 0.85:
+            return f"+39 3{rng.randint(20, 93)} {rng.randint(100, 999)} {rng.randint(1000, 9999)}"
+        return f"0{rng.randint(2, 99)} {rng.randint(100000, 9999999)}"
+
+    def _blocco_generazione(self, indice_blocco):
+        rng = random.Random(f"{self.seed}-{indice_blocco}")
+        inizio = indice_blocco * BLOCCO_GENERAZIONE
+        righe = []
+        for i in range(BLOCCO_GENERAZIONE):
+            venditore_id = inizio + i + 1
+            nome, cognome = rng.choice(NOMI), rng.choice(COGNOMI)
+            # Età attorno ai 42 anni; l'esperienza non supera gli anni lavorativi
+            eta = min(70, max(20, int(rng.gauss(42, 10))))
+            esperienza = min(eta - 18, int(rng.expovariate(1 / 8)))
+            cv = None
+            if self.percentuale_cv and rng.random() < self.percentuale_cv:
+                cv = os.path.join(self.cv_dir, f"CV_{venditore_id}_{_ascii(cognome)}.pdf")
+            righe.append((
+                venditore_id,
+                f"{nome} {cognome}",
+                # L'id rende l'email unica anche con nomi ripetuti
+                f"{_ascii(nome)}.{_ascii(cognome)}{venditore_id}@{rng.choice(DOMINI)}",
+                self._telefono(rng),
+                rng.choice(self.citta),
+                esperienza,
+                self.adesso.year - eta,
+                rng.choice(self.settori),
+                "Sì" if rng.random() < 0.45 else "No",
+                (self.adesso - timedelta(seconds=rng.randint(0, 3 * 365 * 86400))).strftime("%Y-%m-%d %H:%M:%S"),
+                cv,
+                rng.choice(NOTE) if rng.random() < 0.4 else None,
+                "Sì" if rng.random() < 0.3 else "No",
+            ))
+        return righe
+
+    def righe(self, totale):
+        """
+        Genera 'totale' venditori come tuple nell'ordine di COLONNE_BACKUP (id da 1 a totale).
+        """
+        for indice_blocco in range((totale + BLOCCO_GENERAZIONE - 1) // BLOCCO_GENERAZIONE):
+            blocco = self._blocco_generazione(indice_blocco)
+            blocco = blocco[:totale - indice_blocco * BLOCCO_GENERAZIONE]
+            if self.percentuale_cv:
+                for riga in blocco:
+                    if riga[10] and not os.path.exists(riga[10]):
+                        with open(riga[10], 'wb') as f:
+                            f.write(PDF_FITTIZIO)
+            yield from blocco
+
+    def blocchi(self, totale, dimensione=BLOCCO_GENERAZIONE):
+        """
+        Raggruppa le righe generate in liste di al più 'dimensione' elementi.
+        """
+        blocco = []
+        for riga in self.righe(totale):
+            blocco.append(riga)
+            if len(blocco) >= dimensione:
+                yield blocco
+                blocco = []
+        if blocco:
+            yield blocco
+
+def per_inserimento(riga):
+    """
+    Converte una riga in formato backup nella tupla attesa da add_venditore/add_venditori_bulk.
+    """
+    (_, nome_cognome, email, telefono, citta, esperienza, anno, settore,
+     partita_iva, _, cv, note, agente) = riga
+    return (nome_cognome, email, telefono, citta, esperienza, anno, settore, partita_iva, agente, cv, note)
+
+def _valore_csv(valore):
+    return "" if valore is None else valore
+
+def scrivi_zip(percorso, generatore, totale):
+    """
+    Scrive un archivio ZIP nello stesso formato di backup_database_python
+    (venditori.csv e settori.csv), ripristinabile con restore_database_python.
+    """
+    with zipfile.ZipFile(percorso, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with zipf.open('settori.csv', 'w') as membro:
+            testo = io.TextIOWrapper(membro, encoding='utf-8', newline='')
+            writer = csv.writer(testo)
+            writer.writerow(['id', 'nome'])
+            writer.writerows(enumerate(generatore.settori, start=1))
+            testo.flush()
+            testo.detach()
+        with zipf.open('venditori.csv', 'w', force_zip64=True) as membro:
+            testo = io.TextIOWrapper(membro, encoding='utf-8', newline='')
+            writer = csv.writer(testo)
+            writer.writerow(COLONNE_BACKUP)
+            for blocco in generatore.blocchi(totale):
+                writer.writerows([[_valore_csv(v) for v in riga] for riga in blocco])
+            testo.flush()
+            testo.detach()
+
+def scrivi_csv(percorso, generatore, totale):
+    """
+    Scrive un CSV con separatore ';' nel formato dell'esportazione, importabile dalla scheda
+    "Esporta/Importa Venditori".
+    """
+    indici = [COLONNE_BACKUP.index(colonna) for colonna in COLONNE_EXPORT]
+    with open(percorso, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(COLONNE_EXPORT)
+        for blocco in generatore.blocchi(totale):
+            writer.writerows([[_valore_csv(riga[i]) for i in indici] for riga in blocco])
+
+def scrivi_mysql(connection, generatore, totale, dimensione_blocco=BLOCCO_GENERAZIONE, overwrite=False):
+    """
+    Inserisce i venditori generati nel database con add_venditori_bulk, creando i settori mancanti.
+    """
+    from db_connection import add_settore, add_venditori_bulk, get_settori
+
+    esistenti = set(get_settori(connection))
+    for settore in generatore.settori:
+        if settore not in esistenti:
+            add_settore(connection, settore)
+    inseriti = 0
+    for blocco in generatore.blocchi(totale, dimensione_blocco):
+        successo, messaggio = add_venditori_bulk(connection, [per_inserimento(r) for r in blocco], overwrite=overwrite)
+        if not successo:
+            return False, messaggio
+        inseriti += len(blocco)
+        print(f"{inseriti}/{totale} venditori scritti...", end="\r")
+    print()
+    return True, f"{inseriti} venditori generati."
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera venditori sintetici per test di carico e di scala.")
+    parser.add_argument('--righe', type=int, required=True, help="Numero di venditori da generare.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed per dati riproducibili.")
+    parser.add_argument('--output', choices=['mysql', 'csv', 'zip'], default='zip')
+    parser.add_argument('--file', help="File di destinazione per l'output csv o zip.")
+    parser.add_argument('--blocco', type=int, default=BLOCCO_GENERAZIONE, help="Righe per inserimento (output mysql).")
+    parser.add_argument('--overwrite', action='store_true', help="Aggiorna i venditori già presenti (output mysql).")
+    parser.add_argument('--cv-dir', help="Cartella in cui creare CV PDF fittizi.")
+    parser.add_argument('--percentuale-cv', type=float, default=0.0, help="Quota di venditori con CV (0-1).")
+    args = parser.parse_args()
+
+    generatore = GeneratoreVenditori(args.seed, cv_dir=args.cv_dir, percentuale_cv=args.percentuale_cv)
+    inizio = time.perf_counter()
+    if args.output == 'mysql':
+        from db_connection import create_connection, initialize_settori, initialize_venditori, initialize_modifiche
+
+        connection = create_connection()
+        if not connection:
+            sys.exit("Connessione al database fallita.")
+        initialize_settori(connection)
+        initialize_venditori(connection)
+        initialize_modifiche(connection)
+        successo, messaggio = scrivi_mysql(connection, generatore, args.righe, args.blocco, args.overwrite)
+        connection.close()
+        if not successo:
+            sys.exit(messaggio)
+        print(messaggio)
+    else:
+        percorso = args.file or f"venditori_sintetici_{args.righe}.{args.output}"
+        scrittore = scrivi_zip if args.output == 'zip' else scrivi_csv
+        scrittore(percorso, generatore, args.righe)
+        print(f"{args.righe} venditori scritti in '{percorso}'.")
+    print(f"Tempo impiegato: {time.perf_counter() - inizio:.1f}s")
+
+if __name__ == "__main__":
+    main()
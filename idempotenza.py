@@ -0,0 +1,179 @@
+# idempotenza.py
+#
+# Supporto dell'header Idempotency-Key sulle scritture dell'API: la prima richiesta con una
+# chiave viene eseguita e la sua risposta memorizzata nella tabella richieste_idempotenti;
+# le ripetizioni con la stessa chiave (es. dopo un timeout) ricevono la stessa risposta senza
+# toccare di nuovo i venditori. Le chiavi sono distinte per token e valgono
+# IDEMPOTENCY_TTL_SECONDS secondi (predefinito 24 ore).
+# - stessa chiave con un'altra richiesta (metodo, percorso o corpo diversi): 422;
+# - stessa chiave mentre la prima richiesta è ancora in corso: 409;
+# - le risposte con errore del server (5xx) non vengono memorizzate: la richiesta si può ripetere.
+# Della risposta si memorizzano stato, corpo, tipo di contenuto e gli header INTESTAZIONI_MEMORIZZATE.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from db_connection import (
+    create_connection,
+    initialize_idempotenza,
+    riserva_chiave_idempotenza,
+    completa_chiave_idempotenza,
+    rilascia_chiave_idempotenza,
+    pulisci_chiavi_idempotenza,
+    Error
+)
+from pool_connessioni import PoolConnessioni
+
+logger = logging.getLogger(__name__)
+
+METODI_SCRITTURA = {"POST", "PUT", "PATCH", "DELETE"}
+# Rotte POST escluse: il backup restituisce l'archivio, da non memorizzare, e la verifica non ha
+# effetti; i ripristini ricevono file anche di più GB, che l'impronta della richiesta leggerebbe
+# per intero in memoria (ripeterli carica di nuovo gli stessi dati)
+PERCORSI_ESCLUSI = {"/backup", "/backup/verify", "/restore", "/restore/sql"}
+
+LUNGHEZZA_MASSIMA_CHIAVE = 255
+
+# Header della risposta restituiti anche alle ripetizioni (es. Location della risorsa creata)
+INTESTAZIONI_MEMORIZZATE = ("location", "content-location", "etag", "last-modified")
+
+def _secondi_validita():
+    return int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 86400))
+
+def _secondi_abbandono():
+    # Una richiesta "in corso" da più tempo appartiene a un processo interrotto
+    return int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 300))
+
+_pool = None
+_ultima_pulizia = 0.0
+
+def _crea_connessione():
+    connection = create_connection()
+    if connection:
+        initialize_idempotenza(connection)
+    return connection
+
+def get_pool():
+    """
+    Pool di connessioni dedicato alla tabella delle chiavi, creato al primo uso.
+    """
+    global _pool
+    if _pool is None:
+        _pool = PoolConnessioni(_crea_connessione)
+    return _pool
+
+def _esegui(operazione, *args):
+    """
+    Esegue una funzione di db_connection su una connessione del pool.
+    """
+    with get_pool().connessione() as connection:
+        if connection is None:
+            raise ConnectionError("Database non disponibile.")
+        return operazione(connection, *args)
+
+def _pulisci_scadute():
+    # Al massimo una volta al minuto per processo
+    global _ultima_pulizia
+    adesso = time.monotonic()
+    if adesso - _ultima_pulizia < 60:
+        return
+    _ultima_pulizia = adesso
+    eliminate = _esegui(pulisci_chiavi_idempotenza, _secondi_validita())
+    if eliminate:
+        logger.info(f"{eliminate} chiavi di idempotenza scadute eliminate.")
+
+def impronta_richiesta(request, corpo):
+    """
+    Hash che identifica la richiesta associata a una chiave. Nei corpi multipart (upload) il
+    delimitatore, scelto a caso dal client a ogni invio, viene ignorato.
+    """
+    tipo = request.headers.get("content-type", "")
+    delimitatore = re.search(r"boundary=\"?([^\";]+)", tipo)
+    if tipo.startswith("multipart/") and delimitatore:
+        corpo = corpo.replace(delimitatore.group(1).encode(), b"")
+    impronta = hashlib.sha256()
+    impronta.update(f"{request.method} {request.url.path}?{request.url.query}\n".encode())
+    impronta.update(corpo)
+    return impronta.hexdigest()
+
+def _intestazioni_da_memorizzare(response):
+    intestazioni = [[nome, valore] for nome, valore in response.headers.items() if nome.lower() in INTESTAZIONI_MEMORIZZATE]
+    return json.dumps(intestazioni) if intestazioni else None
+
+def _risposta_memorizzata(stato_http, tipo_contenuto, corpo, intestazioni):
+    response = Response(content=bytes(corpo or b""), status_code=stato_http, media_type=tipo_contenuto)
+    for nome, valore in json.loads(intestazioni) if intestazioni else []:
+        response.headers.append(nome, valore)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+async def idempotenza(request: Request, call_next):
+    """
+    Middleware HTTP: applica l'header Idempotency-Key alle scritture. Va registrato dopo
+    l'autenticazione (usa request.state.token).
+    """
+    chiave = request.headers.get("idempotency-key")
+    if not chiave or request.method not in METODI_SCRITTURA or request.url.path in PERCORSI_ESCLUSI:
+        return await call_next(request)
+    if len(chiave) > LUNGHEZZA_MASSIMA_CHIAVE:
+        return JSONResponse(status_code=400, content={"detail": f"Idempotency-Key troppo lunga (massimo {LUNGHEZZA_MASSIMA_CHIAVE} caratteri)."})
+
+    token = getattr(request.state, "token", "default")
+    impronta = impronta_richiesta(request, await request.body())
+    try:
+        await run_in_threadpool(_pulisci_scadute)
+        esistente = await run_in_threadpool(
+            _esegui, riserva_chiave_idempotenza, token, chiave, impronta, _secondi_validita(), _secondi_abbandono()
+        )
+    except (Error, ConnectionError) as e:
+        logger.error(f"Archivio delle chiavi di idempotenza non disponibile: {e}")
+        return JSONResponse(status_code=503, content={"detail": "Impossibile verificare la Idempotency-Key, riprova."})
+
+    if esistente is not None:
+        impronta_esistente, stato_http, tipo_contenuto, corpo, intestazioni = esistente
+        if impronta_esistente != impronta:
+            return JSONResponse(status_code=422, content={"detail": "Idempotency-Key già usata per una richiesta diversa."})
+        if stato_http is None:
+            return JSONResponse(
+                status_code=409,
+                content={"detail": "Una richiesta con questa Idempotency-Key è ancora in corso."},
+                headers={"Retry-After": "1"}
+            )
+        logger.info(f"Richiesta ripetuta con Idempotency-Key '{chiave}' (token '{token}'): risposta memorizzata.")
+        return _risposta_memorizzata(stato_http, tipo_contenuto, corpo, intestazioni)
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        await run_in_threadpool(_esegui, rilascia_chiave_idempotenza, token, chiave)
+        raise
+
+    if response.status_code >= 500:
+        try:
+            await run_in_threadpool(_esegui, rilascia_chiave_idempotenza, token, chiave)
+        except (Error, ConnectionError) as e:
+            logger.error(f"Impossibile liberare la Idempotency-Key '{chiave}': {e}")
+        return response
+
+    corpo = b"".join([parte async for parte in response.body_iterator])
+    try:
+        await run_in_threadpool(
+            _esegui, completa_chiave_idempotenza, token, chiave,
+            response.status_code, response.headers.get("content-type"), corpo,
+            _intestazioni_da_memorizzare(response)
+        )
+    except (Error, ConnectionError) as e:
+        # La scrittura è avvenuta: meglio restituire la risposta che un errore, anche se
+        # una ripetizione verrà eseguita di nuovo dopo IDEMPOTENCY_LOCK_SECONDS
+        logger.error(f"Impossibile memorizzare la risposta per la Idempotency-Key '{chiave}': {e}")
+    return Response(
+        content=corpo,
+        status_code=response.status_code,
+        headers={k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    )
@@ -0,0 +1,244 @@
+# import_venditori.py
+
+from datetime import datetime
+import os
+import pandas as pd
+from db_connection import add_venditori_bulk, get_settori, ESITO_INSERITO
+
+# Colonne accettate nel file di importazione, nell'ordine atteso da add_venditori_bulk
+COLONNE_IMPORT = [
+    'nome_cognome', 'email', 'telefono', 'citta', 'esperienza_vendita',
+    'anno_nascita', 'settore_esperienza', 'partita_iva', 'agente_isenarco', 'cv', 'note'
+]
+COLONNE_OBBLIGATORIE = [
+    'nome_cognome', 'email', 'citta', 'settore_esperienza', 'partita_iva', 'agente_isenarco'
+]
+COLONNE_SI_NO = ['partita_iva', 'agente_isenarco']
+
+# Stesse regole del form "Inserisci Venditore"
+ESPERIENZA_MIN, ESPERIENZA_MAX = 0, 100
+ANNO_NASCITA_MIN = 1900
+EMAIL_REGEX = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+VALORI_SI_NO = {'sì': 'Sì', 'si': 'Sì', 'no': 'No'}
+
+DIMENSIONE_BLOCCO = 5000
+
+def _rileva_separatore(file):
+    """
+    Rileva il separatore del CSV (';' come nell'esportazione, oppure ',') dalla prima riga.
+    """
+    posizione = file.tell()
+    intestazione = file.readline()
+    file.seek(posizione)
+    if isinstance(intestazione, bytes):
+        intestazione = intestazione.decode('utf-8', errors='ignore')
+    return ';' if intestazione.count(';') >= intestazione.count(',') else ','
+
+def leggi_blocchi_csv(file, dimensione_blocco=DIMENSIONE_BLOCCO):
+    """
+    Legge un CSV a blocchi, senza caricarlo interamente in memoria.
+    :param file: Percorso o file-like del CSV.
+    :param dimensione_blocco: Numero di righe per blocco.
+    :return: Generatore di DataFrame con tutte le colonne come stringhe.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            yield from leggi_blocchi_csv(f, dimensione_blocco)
+        return
+    separatore = _rileva_separatore(file)
+    lettore = pd.read_csv(
+        file,
+        sep=separatore,
+        dtype=str,
+        keep_default_na=False,
+        encoding='utf-8-sig',
+        chunksize=dimensione_blocco
+    )
+    for blocco in lettore:
+        yield blocco
+
+def leggi_blocchi_excel(file, dimensione_blocco=DIMENSIONE_BLOCCO):
+    """
+    Legge il primo foglio di un file XLSX a blocchi, in modalità read-only (streaming).
+    :param file: Percorso o file-like del file Excel.
+    :param dimensione_blocco: Numero di righe per blocco.
+    :return: Generatore di DataFrame con tutte le colonne come stringhe.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        righe = workbook.worksheets[0].iter_rows(values_only=True)
+        intestazione = next(righe, None)
+        if intestazione is None:
+            return
+        colonne = [str(c).strip() if c is not None else '' for c in intestazione]
+        inizio = 0
+        buffer = []
+        for riga in righe:
+            buffer.append(['' if v is None else str(v) for v in riga])
+            if len(buffer) >= dimensione_blocco:
+                yield pd.DataFrame(buffer, columns=colonne, index=range(inizio, inizio + len(buffer)))
+                inizio += len(buffer)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=colonne, index=range(inizio, inizio + len(buffer)))
+    finally:
+        workbook.close()
+
+def valida_blocco(df, settori_validi, citta_valide=None, email_viste=None):
+    """
+    Valida un blocco di righe con operazioni vettoriali pandas.
+    :param df: DataFrame del blocco (colonne come stringhe, indice = posizione della riga nel file).
+    :param settori_validi: Insieme dei settori esistenti.
+    :param citta_valide: Insieme delle città ammesse (None per non verificarle).
+    :param email_viste: Set delle email già incontrate nei blocchi precedenti; viene aggiornato.
+    :return: Tuple (DataFrame delle righe valide normalizzate, DataFrame degli errori)
+    """
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+    df = df.reindex(columns=COLONNE_IMPORT, fill_value='')
+    df = df.apply(lambda colonna: colonna.fillna('').astype(str).str.strip())
+
+    regole = []
+
+    for colonna in COLONNE_OBBLIGATORIE:
+        regole.append((colonna, df[colonna] == '', "Campo obbligatorio mancante"))
+
+    df['email'] = df['email'].str.lower()
+    regole.append(('email', (df['email'] != '') & ~df['email'].str.match(EMAIL_REGEX), "Email non valida"))
+
+    esperienza = pd.to_numeric(df['esperienza_vendita'], errors='coerce')
+    regole.append((
+        'esperienza_vendita',
+        (df['esperienza_vendita'] != '') & ~esperienza.between(ESPERIENZA_MIN, ESPERIENZA_MAX),
+        f"Esperienza non valida (intero tra {ESPERIENZA_MIN} e {ESPERIENZA_MAX})"
+    ))
+    regole.append(('esperienza_vendita', esperienza.notna() & (esperienza % 1 != 0), "Esperienza non intera"))
+
+    anno_max = datetime.now().year
+    anno = pd.to_numeric(df['anno_nascita'], errors='coerce')
+    regole.append((
+        'anno_nascita',
+        (df['anno_nascita'] != '') & ~anno.between(ANNO_NASCITA_MIN, anno_max),
+        f"Anno di nascita non valido (tra {ANNO_NASCITA_MIN} e {anno_max})"
+    ))
+    regole.append(('anno_nascita', anno.notna() & (anno % 1 != 0), "Anno di nascita non intero"))
+
+    for colonna in COLONNE_SI_NO:
+        normalizzata = df[colonna].str.lower().map(VALORI_SI_NO)
+        regole.append((colonna, (df[colonna] != '') & normalizzata.isna(), "Valore ammesso: Sì/No"))
+        df[colonna] = normalizzata.fillna(df[colonna])
+
+    regole.append((
+        'settore_esperienza',
+        (df['settore_esperienza'] != '') & ~df['settore_esperienza'].isin(settori_validi),
+        "Settore inesistente"
+    ))
+    if citta_valide:
+        citta_normalizzate = {c.casefold() for c in citta_valide}
+        regole.append((
+            'citta',
+            (df['citta'] != '') & ~df['citta'].str.casefold().isin(citta_normalizzate),
+            "Città non riconosciuta"
+        ))
+
+    # Duplicati solo tra le righe altrimenti valide: una prima occorrenza scartata non esclude le successive
+    scartate = pd.Series(False, index=df.index)
+    for _, maschera, _ in regole:
+        scartate |= maschera
+    email_candidate = df['email'].where(~scartate)
+    duplicate = email_candidate.notna() & email_candidate.duplicated(keep='first')
+    if email_viste is not None:
+        duplicate |= email_candidate.notna() & email_candidate.isin(email_viste)
+    regole.append(('email', duplicate, "Email duplicata nel file"))
+
+    errori = pd.concat(
+        [
+            pd.DataFrame({
+                'riga': df.index[maschera],
+                'colonna': colonna,
+                'valore': df.loc[maschera, colonna].values,
+                'errore': messaggio
+            })
+            for colonna, maschera, messaggio in regole if maschera.any()
+        ] or [pd.DataFrame(columns=['riga', 'colonna', 'valore', 'errore'])],
+        ignore_index=True
+    )
+    # Numero di riga come nel foglio di calcolo (la riga 1 è l'intestazione)
+    errori['riga'] = errori['riga'].astype(int) + 2
+
+    valide = df[~df.index.isin(errori['riga'] - 2)].copy()
+    valide['esperienza_vendita'] = esperienza[valide.index].astype('Int64')
+    valide['anno_nascita'] = anno[valide.index].astype('Int64')
+    if email_viste is not None:
+        email_viste.update(valide['email'])
+    return valide, errori
+
+def _righe_per_inserimento(df):
+    """
+    Converte il DataFrame validato nelle tuple attese da add_venditori_bulk (None al posto dei vuoti).
+    """
+    colonne = []
+    for nome in COLONNE_IMPORT:
+        valori = df[nome].astype(object).tolist()
+        colonne.append([None if (v is pd.NA or v == '') else v for v in valori])
+    return list(zip(*colonne))
+
+def importa_venditori(connection, file, formato="CSV", overwrite=False, citta_valide=None,
+                      dimensione_blocco=DIMENSIONE_BLOCCO, progresso=None):
+    """
+    Importa venditori da un file CSV o Excel a blocchi, validando ogni riga e inserendo
+    quelle valide con add_venditori_bulk. Non tocca i venditori non presenti nel file.
+    :param connection: Connessione al database.
+    :param file: Percorso o file-like del file da importare.
+    :param formato: "CSV" o "Excel".
+    :param overwrite: Bool. Se True, aggiorna i venditori con la stessa email. Se False, li ignora.
+    :param citta_valide: Insieme delle città ammesse (None per non verificarle).
+    :param dimensione_blocco: Numero di righe lette e inserite per volta.
+    :param progresso: Callback opzionale chiamata con il numero di righe elaborate.
+    :return: Tuple (successo: bool, riepilogo: dict o messaggio di errore). Ogni blocco è una
+             transazione a sé: il messaggio di errore riporta le righe già importate.
+    """
+    lettore = leggi_blocchi_excel if formato == "Excel" else leggi_blocchi_csv
+    settori_validi = set(get_settori(connection))
+    email_viste = set()
+    riepilogo = {'righe_lette': 0, 'righe_valide': 0, 'inserite': 0, 'esistenti': 0}
+    errori = []
+
+    try:
+        for blocco in lettore(file, dimensione_blocco):
+            mancanti = [c for c in COLONNE_OBBLIGATORIE if c not in {str(col).strip().lower() for col in blocco.columns}]
+            if mancanti:
+                return False, f"Colonne obbligatorie mancanti nel file: {', '.join(mancanti)}"
+
+            valide, errori_blocco = valida_blocco(blocco, settori_validi, citta_valide, email_viste)
+            riepilogo['righe_lette'] += len(blocco)
+            riepilogo['righe_valide'] += len(valide)
+            if not errori_blocco.empty:
+                errori.append(errori_blocco)
+
+            if not valide.empty:
+                righe = _righe_per_inserimento(valide)
+                successo, esiti = add_venditori_bulk(connection, righe, overwrite=overwrite, esiti=True)
+                if not successo:
+                    # I blocchi precedenti sono già stati confermati: lo si dice all'utente
+                    return False, (
+                        f"Importazione interrotta al blocco che inizia alla riga {int(blocco.index[0]) + 2}: {esiti} "
+                        f"Righe già importate dai blocchi precedenti: {riepilogo['inserite']} inserite, "
+                        f"{riepilogo['esistenti']} già presenti."
+                    )
+                inserite = esiti.count(ESITO_INSERITO)
+                riepilogo['inserite'] += inserite
+                riepilogo['esistenti'] += len(esiti) - inserite
+
+            if progresso:
+                progresso(riepilogo['righe_lette'])
+    except (ValueError, pd.errors.ParserError, KeyError) as e:
+        return False, f"Errore nella lettura del file: {e}"
+
+    riepilogo['errori'] = (
+        pd.concat(errori, ignore_index=True)
+        if errori else pd.DataFrame(columns=['riga', 'colonna', 'valore', 'errore'])
+    )
+    riepilogo['righe_scartate'] = riepilogo['righe_lette'] - riepilogo['righe_valide']
+    return True, riepilogo
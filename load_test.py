@@ -0,0 +1,245 @@
+# load_test.py
+#
+# Generatore di carico HTTP per l'API (api.py): esegue un mix configurabile di richieste
+# con N client concorrenti e riporta throughput, percentili di latenza ed errori per rotta.
+#
+# Esempi:
+#   python load_test.py --avvia-server --workers 2 --concorrenza 50 --durata 60
+#   python load_test.py --url http://127.0.0.1:8000 --mix venditori=80,settori=20 --richieste 5000
+#   python load_test.py --avvia-server --output risultati_carico.json
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+import httpx
+from genera_venditori import GeneratoreVenditori
+
+MIX_PREDEFINITO = "venditori=70,inserisci=10,settori=15,backup=5"
+SETTORI_RICERCA = ["Automotive", "Beni di Consumo", "Informatica", "Edilizia"]
+CITTA_RICERCA = ["Milano", "Roma", "Torino", "Napoli", "Bologna"]
+
+def percentile(valori_ordinati, p):
+    """
+    Percentile con il metodo nearest-rank su una lista già ordinata.
+    """
+    if not valori_ordinati:
+        return None
+    indice = max(0, min(len(valori_ordinati) - 1, math.ceil(p * len(valori_ordinati) / 100) - 1))
+    return valori_ordinati[indice]
+
+def leggi_mix(testo):
+    """
+    Converte 'rotta=peso,...' in un dizionario di pesi.
+    """
+    mix = {}
+    for parte in testo.split(','):
+        if not parte.strip():
+            continue
+        rotta, _, peso = parte.partition('=')
+        if rotta.strip() not in ROTTE:
+            sys.exit(f"Rotta sconosciuta nel mix: {rotta}. Disponibili: {', '.join(ROTTE)}")
+        mix[rotta.strip()] = float(peso or 1)
+    return mix
+
+class Carico:
+    def __init__(self, client, token, seed):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.rng = random.Random(seed)
+        # Email uniche anche tra esecuzioni diverse sullo stesso database
+        self.prefisso_email = f"loadtest{int(time.time())}"
+        self.generatore = GeneratoreVenditori(seed)
+        self.venditori = self.generatore.righe(10 ** 9)
+        self.latenze = defaultdict(list)
+        self.stati = defaultdict(lambda: defaultdict(int))
+
+    async def venditori_get(self):
+        parametri = {}
+        if self.rng.random() < 0.5:
+            parametri["settore"] = self.rng.choice(SETTORI_RICERCA)
+        if self.rng.random() < 0.3:
+            parametri["citta"] = self.rng.choice(CITTA_RICERCA)
+        if self.rng.random() < 0.2:
+            parametri["nome"] = self.rng.choice(["Rossi", "Bianchi", "Marco", "Giulia"])
+        return await self.client.get("/venditori", params=parametri, headers=self.headers)
+
+    async def inserisci(self):
+        riga = next(self.venditori)
+        venditore = {
+            "nome_cognome": riga[1],
+            "email": f"{self.prefisso_email}.{riga[0]}@loadtest.example.com",
+            "telefono": riga[3],
+            "citta": riga[4],
+            "esperienza_vendita": riga[5],
+            "anno_nascita": riga[6],
+            "settore_esperienza": riga[7],
+            "partita_iva": riga[8],
+            "agente_isenarco": riga[12],
+            "note": riga[11],
+        }
+        return await self.client.post("/inserisci_venditore", json=venditore, headers=self.headers)
+
+    async def settori(self):
+        return await self.client.get("/settori", headers=self.headers)
+
+    async def backup(self):
+        return await self.client.post("/backup", headers=self.headers)
+
+    async def esegui(self, rotta):
+        inizio = time.perf_counter()
+        try:
+            risposta = await getattr(self, ROTTE[rotta])()
+            await risposta.aread()
+            stato = str(risposta.status_code)
+        except httpx.HTTPError as e:
+            stato = type(e).__name__
+        self.latenze[rotta].append(time.perf_counter() - inizio)
+        self.stati[rotta][stato] += 1
+
+ROTTE = {
+    "venditori": "venditori_get",
+    "inserisci": "inserisci",
+    "settori": "settori",
+    "backup": "backup",
+}
+
+async def esegui_carico(url, token, mix, concorrenza, durata, richieste, timeout, seed):
+    limiti = httpx.Limits(max_connections=concorrenza, max_keepalive_connections=concorrenza)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limiti) as client:
+        carico = Carico(client, token, seed)
+        rotte, pesi = list(mix), list(mix.values())
+        fine = time.perf_counter() + durata if durata else None
+        inviate = 0
+
+        async def client_virtuale():
+            nonlocal inviate
+            while True:
+                if fine is not None and time.perf_counter() >= fine:
+                    return
+                if richieste is not None:
+                    if inviate >= richieste:
+                        return
+                    inviate += 1
+                await carico.esegui(carico.rng.choices(rotte, pesi)[0])
+
+        inizio = time.perf_counter()
+        await asyncio.gather(*(client_virtuale() for _ in range(concorrenza)))
+        return carico, time.perf_counter() - inizio
+
+def riepilogo(carico, tempo_totale):
+    """
+    Calcola per ogni rotta richieste, throughput, errori e percentili di latenza (ms).
+    """
+    risultati = {}
+    for rotta, latenze in sorted(carico.latenze.items()):
+        ordinate = sorted(latenze)
+        stati = dict(carico.stati[rotta])
+        errori = sum(n for stato, n in stati.items() if not stato.startswith('2'))
+        risultati[rotta] = {
+            "richieste": len(ordinate),
+            "throughput_rps": len(ordinate) / tempo_totale,
+            "errori": errori,
+            "tasso_errori": errori / len(ordinate),
+            "p50_ms": percentile(ordinate, 50) * 1000,
+            "p95_ms": percentile(ordinate, 95) * 1000,
+            "p99_ms": percentile(ordinate, 99) * 1000,
+            "max_ms": ordinate[-1] * 1000,
+            "stati": stati,
+        }
+    return risultati
+
+def stampa(risultati, tempo_totale):
+    print(f"\nDurata: {tempo_totale:.1f}s")
+    print(f"{'rotta':<12}{'richieste':>10}{'req/s':>10}{'errori %':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for rotta, r in risultati.items():
+        print(
+            f"{rotta:<12}{r['richieste']:>10}{r['throughput_rps']:>10.1f}{r['tasso_errori'] * 100:>10.2f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['max_ms']:>10.1f}"
+        )
+        errori = {stato: n for stato, n in r['stati'].items() if not stato.startswith('2')}
+        if errori:
+            print(f"{'':<12}errori per stato: {errori}")
+    totale = sum(r['richieste'] for r in risultati.values())
+    print(f"{'totale':<12}{totale:>10}{totale / tempo_totale:>10.1f}")
+
+def avvia_server(porta, workers):
+    """
+    Avvia uvicorn in locale sull'API e attende che risponda su /test.
+    """
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(porta),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    url = f"http://127.0.0.1:{porta}"
+    scadenza = time.time() + 30
+    while time.time() < scadenza:
+        if processo.poll() is not None:
+            sys.exit("Il server uvicorn si è arrestato durante l'avvio.")
+        try:
+            if httpx.get(f"{url}/test", timeout=1).status_code == 200:
+                return processo, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    processo.terminate()
+    sys.exit("Il server uvicorn non ha risposto entro 30 secondi.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico HTTP dell'API venditori.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="URL dell'API (ignorato con --avvia-server).")
+    parser.add_argument("--avvia-server", action="store_true", help="Avvia uvicorn in locale per la durata del test.")
+    parser.add_argument("--porta", type=int, default=8765, help="Porta del server avviato con --avvia-server.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker uvicorn del server avviato.")
+    parser.add_argument("--token", default=os.getenv("API_TOKEN"), help="Token API (default: API_TOKEN).")
+    parser.add_argument("--mix", default=MIX_PREDEFINITO, help="Pesi delle rotte, es. venditori=70,settori=30.")
+    parser.add_argument("--concorrenza", type=int, default=20, help="Client virtuali concorrenti.")
+    parser.add_argument("--durata", type=float, default=30, help="Durata del test in secondi.")
+    parser.add_argument("--richieste", type=int, help="Numero totale di richieste (sostituisce --durata).")
+    parser.add_argument("--timeout", type=float, default=30, help="Timeout per richiesta in secondi.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Salva i risultati in questo file JSON.")
+    args = parser.parse_args()
+
+    mix = leggi_mix(args.mix)
+    processo = None
+    url = args.url
+    if args.avvia_server:
+        processo, url = avvia_server(args.porta, args.workers)
+    try:
+        print(f"Test di carico su {url}: mix {mix}, concorrenza {args.concorrenza}...")
+        carico, tempo_totale = asyncio.run(esegui_carico(
+            url, args.token, mix, args.concorrenza,
+            None if args.richieste else args.durata, args.richieste, args.timeout, args.seed
+        ))
+    finally:
+        if processo:
+            processo.terminate()
+            processo.wait()
+
+    risultati = riepilogo(carico, tempo_totale)
+    stampa(risultati, tempo_totale)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.now().isoformat(timespec="seconds"),
+                    "url": url,
+                    "workers": args.workers if args.avvia_server else None,
+                    "concorrenza": args.concorrenza,
+                    "mix": mix,
+                    "durata_s": tempo_totale,
+                },
+                "risultati": risultati,
+            }, f, indent=2)
+        print(f"Risultati salvati in '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# metrics.py
+
+import bisect
+import functools
+import threading
+import time
+
+# Bucket (in secondi) per le latenze di richieste HTTP e query
+BUCKET_LATENZA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bucket (in secondi) per backup e ripristini, molto più lenti
+BUCKET_BACKUP = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+def _escape(valore):
+    return str(valore).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _formatta_etichette(nomi, valori, extra=None):
+    coppie = list(zip(nomi, valori))
+    if extra:
+        coppie.append(extra)
+    if not coppie:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escape(valore)}"' for nome, valore in coppie) + "}"
+
+def _formatta_numero(valore):
+    if valore == float('inf'):
+        return "+Inf"
+    return repr(float(valore)) if isinstance(valore, float) else str(valore)
+
+class Contatore:
+    """
+    Contatore monotono con etichette, nel formato Prometheus 'counter'.
+    """
+    tipo = "counter"
+
+    def __init__(self, nome, descrizione, etichette=()):
+        self.nome = nome
+        self.descrizione = descrizione
+        self.etichette = tuple(etichette)
+        self._valori = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valori_etichette, valore=1):
+        with self._lock:
+            self._valori[valori_etichette] = self._valori.get(valori_etichette, 0) + valore
+
+    def campioni(self):
+        with self._lock:
+            valori = dict(self._valori)
+        for chiave, valore in sorted(valori.items()):
+            yield f"{self.nome}{_formatta_etichette(self.etichette, chiave)} {_formatta_numero(valore)}"
+
+class Istogramma:
+    """
+    Istogramma a bucket cumulativi, nel formato Prometheus 'histogram'.
+    """
+    tipo = "histogram"
+
+    def __init__(self, nome, descrizione, etichette=(), bucket=BUCKET_LATENZA):
+        self.nome = nome
+        self.descrizione = descrizione
+        self.etichette = tuple(etichette)
+        self.bucket = tuple(sorted(bucket))
+        self._serie = {}
+        self._lock = threading.Lock()
+
+    def osserva(self, valore, *valori_etichette):
+        # Solo un incremento per osservazione; i bucket vengono resi cumulativi in esportazione
+        indice = bisect.bisect_left(self.bucket, valore)
+        with self._lock:
+            serie = self._serie.get(valori_etichette)
+            if serie is None:
+                serie = self._serie[valori_etichette] = [[0] * (len(self.bucket) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valore
+            serie[2] += 1
+
+    def campioni(self):
+        with self._lock:
+            serie = {chiave: (list(conteggi), somma, totale) for chiave, (conteggi, somma, totale) in self._serie.items()}
+        for chiave, (conteggi, somma, totale) in sorted(serie.items()):
+            cumulato = 0
+            for limite, conteggio in zip(self.bucket + (float('inf'),), conteggi):
+                cumulato += conteggio
+                etichette = _formatta_etichette(self.etichette, chiave, ("le", _formatta_numero(limite)))
+                yield f"{self.nome}_bucket{etichette} {cumulato}"
+            etichette = _formatta_etichette(self.etichette, chiave)
+            yield f"{self.nome}_sum{etichette} {_formatta_numero(somma)}"
+            yield f"{self.nome}_count{etichette} {totale}"
+
+class Registro:
+    """
+    Raccolta delle metriche del processo, esportabili nel formato testuale di Prometheus.
+    """
+
+    def __init__(self):
+        self._metriche = {}
+        self._lock = threading.Lock()
+
+    def _registra(self, metrica):
+        with self._lock:
+            return self._metriche.setdefault(metrica.nome, metrica)
+
+    def contatore(self, nome, descrizione, etichette=()):
+        return self._registra(Contatore(nome, descrizione, etichette))
+
+    def istogramma(self, nome, descrizione, etichette=(), bucket=BUCKET_LATENZA):
+        return self._registra(Istogramma(nome, descrizione, etichette, bucket))
+
+    def esporta(self):
+        """
+        Restituisce tutte le metriche nel formato testuale di Prometheus (text/plain; version=0.0.4).
+        """
+        righe = []
+        with self._lock:
+            metriche = list(self._metriche.values())
+        for metrica in metriche:
+            righe.append(f"# HELP {metrica.nome} {metrica.descrizione}")
+            righe.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            righe.extend(metrica.campioni())
+        return "\n".join(righe) + "\n"
+
+registro = Registro()
+
+# Metriche HTTP (api.py)
+RICHIESTE_HTTP = registro.contatore(
+    "http_requests_total", "Richieste HTTP ricevute.", ("method", "route", "status")
+)
+DURATA_HTTP = registro.istogramma(
+    "http_request_duration_seconds", "Durata delle richieste HTTP.", ("method", "route")
+)
+RICHIESTE_RIFIUTATE = registro.contatore(
+    "http_requests_rejected_total", "Richieste rifiutate da autenticazione e limiti per token.", ("token", "motivo")
+)
+
+# Metriche database (db_connection.py)
+DURATA_QUERY = registro.istogramma(
+    "db_query_duration_seconds", "Durata delle funzioni di accesso ai dati.", ("funzione",)
+)
+RIGHE_QUERY = registro.contatore(
+    "db_query_rows_total", "Righe restituite dalle funzioni di accesso ai dati.", ("funzione",)
+)
+CONNESSIONI = registro.contatore(
+    "db_connections_total", "Connessioni al database aperte o fallite.", ("ruolo", "esito")
+)
+DURATA_BACKUP = registro.istogramma(
+    "db_backup_duration_seconds", "Durata di backup e ripristini.", ("operazione", "esito"), BUCKET_BACKUP
+)
+BYTE_BACKUP = registro.contatore(
+    "db_backup_bytes_total", "Byte prodotti dai backup o letti dai ripristini.", ("operazione",)
+)
+
+# Cache dei risultati di ricerca (cache_risultati.py)
+RICHIESTE_CACHE = registro.contatore(
+    "result_cache_requests_total", "Ricerche servite dalla cache dei risultati o ricalcolate.", ("esito",)
+)
+
+# Coda di inserimento asincrona (coda_inserimenti.py)
+INSERIMENTI_CODA = registro.contatore(
+    "insert_queue_records_total", "Venditori accodati e loro esito (inserito, duplicato, errore).", ("stato",)
+)
+DIMENSIONE_BLOCCHI_CODA = registro.istogramma(
+    "insert_queue_batch_size", "Venditori scritti da ogni INSERT multi-riga della coda.", (),
+    (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+
+def misura_query(funzione):
+    """
+    Decoratore per le funzioni di db_connection: registra durata e righe restituite.
+    """
+    nome = funzione.__name__
+
+    @functools.wraps(funzione)
+    def wrapper(*args, **kwargs):
+        inizio = time.perf_counter()
+        try:
+            risultato = funzione(*args, **kwargs)
+        finally:
+            DURATA_QUERY.osserva(time.perf_counter() - inizio, nome)
+        if isinstance(risultato, (list, set)):
+            RIGHE_QUERY.inc(nome, valore=len(risultato))
+        return risultato
+    return wrapper
+
+def misura_backup(operazione):
+    """
+    Decoratore per backup e ripristino, che restituiscono (successo, risultato):
+    registra la durata, l'esito e i byte dell'archivio prodotto o letto.
+    """
+    def decoratore(funzione):
+        @functools.wraps(funzione)
+        def wrapper(*args, **kwargs):
+            inizio = time.perf_counter()
+            successo, risultato = funzione(*args, **kwargs)
+            esito = "ok" if successo else "errore"
+            DURATA_BACKUP.osserva(time.perf_counter() - inizio, operazione, esito)
+            archivio = risultato if operazione == "backup" else (args[1] if len(args) > 1 else None)
+            if successo and isinstance(archivio, (bytes, bytearray)):
+                BYTE_BACKUP.inc(operazione, valore=len(archivio))
+            return successo, risultato
+        return wrapper
+    return decoratore
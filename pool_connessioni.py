@@ -0,0 +1,139 @@
+# pool_connessioni.py
+#
+# Pool di connessioni thread-safe per l'app Streamlit: ogni rerun preleva una connessione
+# e la restituisce alla fine, così sessioni diverse non condividono mai la stessa connessione
+# e le loro query girano in parallelo. Le connessioni inattive da un po' vengono verificate
+# con un ping prima dell'uso e, se cadute (es. dopo il wait_timeout di MySQL), sostituite
+# con una nuova creata con backoff esponenziale.
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class PoolConnessioni:
+    """
+    Pool di dimensione massima fissa sopra una funzione che crea connessioni
+    (es. create_connection), che restituisce una connessione o None.
+    """
+
+    def __init__(self, crea, dimensione=None, timeout=None, secondi_ping=None, tentativi=None, attesa_iniziale=0.5, attesa_massima=8):
+        """
+        :param crea: Funzione senza argomenti che apre una connessione (o restituisce None).
+        :param dimensione: Connessioni massime aperte contemporaneamente (DB_POOL_SIZE).
+        :param timeout: Secondi di attesa massima di una connessione libera (DB_POOL_TIMEOUT).
+        :param secondi_ping: Inattività oltre la quale la connessione viene verificata prima dell'uso (DB_POOL_PING_SECONDS).
+        :param tentativi: Tentativi di connessione prima di rinunciare (DB_POOL_RETRIES).
+        """
+        self.crea = crea
+        self.dimensione = dimensione or int(os.getenv('DB_POOL_SIZE', 5))
+        self.timeout = timeout if timeout is not None else float(os.getenv('DB_POOL_TIMEOUT', 30))
+        self.secondi_ping = secondi_ping if secondi_ping is not None else float(os.getenv('DB_POOL_PING_SECONDS', 5))
+        self.tentativi = tentativi or int(os.getenv('DB_POOL_RETRIES', 3))
+        self.attesa_iniziale = attesa_iniziale
+        self.attesa_massima = attesa_massima
+        # Connessioni libere con l'istante dell'ultimo uso; LIFO per riusare quelle più "calde"
+        self._libere = deque()
+        self._lock = threading.Lock()
+        self._posti = threading.BoundedSemaphore(self.dimensione)
+        self._in_uso = set()
+
+    def _viva(self, connection):
+        try:
+            connection.ping()
+            return True
+        except Exception:
+            return False
+
+    def _chiudi(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _nuova(self):
+        """
+        Apre una nuova connessione, riprovando con backoff esponenziale (con jitter).
+        """
+        for tentativo in range(self.tentativi):
+            connection = self.crea()
+            if connection:
+                return connection
+            if tentativo < self.tentativi - 1:
+                attesa = min(self.attesa_massima, self.attesa_iniziale * 2 ** tentativo)
+                time.sleep(attesa / 2 + random.uniform(0, attesa / 2))
+        print(f"Impossibile aprire una connessione dopo {self.tentativi} tentativi.")
+        return None
+
+    def preleva(self):
+        """
+        Preleva una connessione funzionante dal pool, aprendone una nuova se necessario.
+        :return: Connessione al database, o None se non disponibile entro il timeout.
+        """
+        if not self._posti.acquire(timeout=self.timeout):
+            print(f"Nessuna connessione libera nel pool entro {self.timeout} secondi.")
+            return None
+        try:
+            connection = None
+            while connection is None:
+                with self._lock:
+                    if not self._libere:
+                        break
+                    candidata, ultimo_uso = self._libere.pop()
+                if time.monotonic() - ultimo_uso < self.secondi_ping or self._viva(candidata):
+                    connection = candidata
+                else:
+                    self._chiudi(candidata)
+            if connection is None:
+                connection = self._nuova()
+            if connection is None:
+                self._posti.release()
+                return None
+            with self._lock:
+                self._in_uso.add(id(connection))
+            return connection
+        except BaseException:
+            self._posti.release()
+            raise
+
+    def restituisci(self, connection):
+        """
+        Restituisce la connessione al pool. La transazione eventualmente aperta viene annullata,
+        così il prossimo utilizzatore non eredita lock né una vista dei dati ormai vecchia.
+        """
+        with self._lock:
+            if id(connection) not in self._in_uso:
+                return
+            self._in_uso.discard(id(connection))
+        try:
+            connection.rollback()
+            with self._lock:
+                self._libere.append((connection, time.monotonic()))
+        except Exception:
+            # Connessione caduta durante l'uso: verrà sostituita al prossimo prelievo
+            self._chiudi(connection)
+        finally:
+            self._posti.release()
+
+    @contextmanager
+    def connessione(self):
+        """
+        Preleva una connessione per la durata del blocco 'with' (None se non disponibile).
+        """
+        connection = self.preleva()
+        try:
+            yield connection
+        finally:
+            if connection is not None:
+                self.restituisci(connection)
+
+    def chiudi(self):
+        """
+        Chiude tutte le connessioni libere.
+        """
+        with self._lock:
+            libere, self._libere = list(self._libere), deque()
+        for connection, _ in libere:
+            self._chiudi(connection)
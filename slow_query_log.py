@@ -0,0 +1,283 @@
+# slow_query_log.py
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# Soglia in millisecondi oltre la quale una query viene registrata (negativa per disattivare)
+SOGLIA_MS = float(os.getenv('DB_SLOW_QUERY_MS', 500))
+FILE_LOG = os.getenv('DB_SLOW_QUERY_LOG', 'slow_queries.log')
+DIMENSIONE_MAX_LOG = 5 * 1024 * 1024
+NUMERO_FILE_LOG = 5
+
+# Istruzioni per cui MySQL sa produrre un piano di esecuzione
+ISTRUZIONI_EXPLAIN = ('select', 'update', 'delete')
+
+_logger = None
+_lock_logger = threading.Lock()
+_explain_registrati = set()
+_lock_explain = threading.Lock()
+
+def _get_logger():
+    """
+    Restituisce il logger su file rotante, creato alla prima query lenta.
+    """
+    global _logger
+    with _lock_logger:
+        if _logger is None:
+            logger = logging.getLogger('slow_query_log')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(FILE_LOG, maxBytes=DIMENSIONE_MAX_LOG, backupCount=NUMERO_FILE_LOG, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            _logger = logger
+        return _logger
+
+def normalizza_sql(sql):
+    """
+    Normalizza una query sostituendo valori letterali e parametri con '?', così che query
+    con la stessa forma abbiano la stessa impronta.
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', errors='replace')
+    sql = re.sub(r"/\*.*?\*/|--[^\n]*", " ", sql, flags=re.S)
+    sql = re.sub(r"'(?:[^'\\]|\\.|'')*'", "?", sql)
+    sql = re.sub(r"%s|%\(\w+\)s", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(...)", sql)
+    # Le righe di un INSERT multi-riga collassano in una sola
+    sql = re.sub(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+", "(...)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+def impronta(sql_normalizzato):
+    """
+    Impronta breve e stabile di una query normalizzata.
+    """
+    return hashlib.sha1(sql_normalizzato.encode('utf-8')).hexdigest()[:16]
+
+def forma_parametri(params, molte_righe=False):
+    """
+    Descrive la forma dei parametri (numero e tipi) senza registrarne i valori.
+    """
+    if params is None:
+        return "nessuno"
+    if molte_righe:
+        righe = list(params) if not isinstance(params, (list, tuple)) else params
+        prima = forma_parametri(righe[0]) if righe else "vuota"
+        return f"{len(righe)} righe x {prima}"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    return f"{len(params)} x (" + ", ".join(type(p).__name__ for p in params) + ")"
+
+def registra_query_lenta(sql, forma, durata_ms, connection=None, params=None):
+    """
+    Registra una query lenta nel log rotante e, la prima volta che si incontra la sua
+    impronta, ne cattura il piano di esecuzione con EXPLAIN.
+    :param connection: Connessione (non strumentata) su cui eseguire l'EXPLAIN.
+    """
+    sql_normalizzato = normalizza_sql(sql)
+    chiave = impronta(sql_normalizzato)
+    voce = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'impronta': chiave,
+        'durata_ms': round(durata_ms, 2),
+        'sql': sql_normalizzato,
+        'parametri': forma
+    }
+
+    with _lock_explain:
+        nuova = chiave not in _explain_registrati
+        _explain_registrati.add(chiave)
+    if nuova and connection is not None and sql_normalizzato.lower().startswith(ISTRUZIONI_EXPLAIN):
+        voce['explain'] = _explain(connection, sql, params)
+
+    _get_logger().info(json.dumps(voce, default=str, ensure_ascii=False))
+
+def _explain(connection, sql, params):
+    """
+    Esegue EXPLAIN della query con gli stessi parametri; restituisce le righe del piano.
+    """
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"EXPLAIN {sql}", params)
+        colonne = [d[0] for d in cursor.description]
+        piano = [dict(zip(colonne, riga)) for riga in cursor.fetchall()]
+        cursor.close()
+        return piano
+    except Exception as e:
+        return f"EXPLAIN non disponibile: {e}"
+
+class CursoreStrumentato:
+    """
+    Cursore che misura il tempo di ogni query (esecuzione più lettura dei risultati) e
+    registra quelle oltre la soglia. La registrazione avviene quando il risultato è stato
+    consumato, così l'EXPLAIN non interferisce con righe ancora da leggere.
+    """
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+        self._in_corso = None
+
+    def _misura(self, metodo, *args):
+        inizio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            if self._in_corso is not None:
+                self._in_corso[3] += time.perf_counter() - inizio
+
+    def _chiudi_misura(self):
+        in_corso, self._in_corso = self._in_corso, None
+        if in_corso is None:
+            return
+        sql, params, molte_righe, durata = in_corso
+        durata_ms = durata * 1000
+        if durata_ms >= SOGLIA_MS:
+            registra_query_lenta(
+                sql,
+                forma_parametri(params, molte_righe),
+                durata_ms,
+                None if molte_righe else self._connection,
+                None if molte_righe else params
+            )
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._chiudi_misura()
+        self._in_corso = [operation, params, False, 0.0]
+        return self._misura(lambda: self._cursor.execute(operation, params, *args, **kwargs))
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._chiudi_misura()
+        seq_params = list(seq_params)
+        self._in_corso = [operation, seq_params, True, 0.0]
+        risultato = self._misura(lambda: self._cursor.executemany(operation, seq_params, *args, **kwargs))
+        self._chiudi_misura()
+        return risultato
+
+    def fetchone(self):
+        return self._misura(self._cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._misura(lambda: self._cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        risultato = self._misura(self._cursor.fetchall)
+        self._chiudi_misura()
+        return risultato
+
+    def close(self):
+        risultato = self._cursor.close()
+        self._chiudi_misura()
+        return risultato
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+class ConnessioneStrumentata:
+    """
+    Connessione che restituisce cursori strumentati; tutto il resto è delegato alla connessione reale.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return CursoreStrumentato(self._connection.cursor(*args, **kwargs), self._connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._connection.close()
+
+    def __getattr__(self, nome):
+        return getattr(self._connection, nome)
+
+def strumenta(connection):
+    """
+    Avvolge la connessione per registrare le query lente, se la soglia è attiva.
+    """
+    if connection is None or SOGLIA_MS < 0:
+        return connection
+    return ConnessioneStrumentata(connection)
+
+def _leggi_voci(file_log):
+    for percorso in sorted(glob.glob(f"{glob.escape(file_log)}*")):
+        with open(percorso, encoding='utf-8') as f:
+            for riga in f:
+                try:
+                    yield json.loads(riga)
+                except json.JSONDecodeError:
+                    continue
+
+def report(file_log=FILE_LOG, top=20):
+    """
+    Raggruppa le query lente per impronta e le ordina per tempo totale.
+    :return: Lista di dict con impronta, esecuzioni, tempi totale/medio/massimo, sql e piano.
+    """
+    gruppi = {}
+    for voce in _leggi_voci(file_log):
+        gruppo = gruppi.setdefault(voce['impronta'], {
+            'impronta': voce['impronta'],
+            'esecuzioni': 0,
+            'totale_ms': 0.0,
+            'max_ms': 0.0,
+            'sql': voce['sql'],
+            'parametri': voce.get('parametri'),
+            'explain': None
+        })
+        gruppo['esecuzioni'] += 1
+        gruppo['totale_ms'] += voce['durata_ms']
+        gruppo['max_ms'] = max(gruppo['max_ms'], voce['durata_ms'])
+        if voce.get('explain') is not None:
+            gruppo['explain'] = voce['explain']
+    classifica = sorted(gruppi.values(), key=lambda g: g['totale_ms'], reverse=True)[:top]
+    for gruppo in classifica:
+        gruppo['medio_ms'] = gruppo['totale_ms'] / gruppo['esecuzioni']
+    return classifica
+
+def main():
+    parser = argparse.ArgumentParser(description="Classifica delle query lente per tempo totale.")
+    parser.add_argument('--file', default=FILE_LOG, help="File di log delle query lente.")
+    parser.add_argument('--top', type=int, default=20, help="Numero di impronte da mostrare.")
+    parser.add_argument('--explain', action='store_true', help="Mostra anche il piano di esecuzione.")
+    args = parser.parse_args()
+
+    classifica = report(args.file, args.top)
+    if not classifica:
+        print(f"Nessuna query lenta registrata in '{args.file}'.")
+        return
+    for posizione, gruppo in enumerate(classifica, start=1):
+        print(
+            f"{posizione:>3}. [{gruppo['impronta']}] totale {gruppo['totale_ms']:.0f} ms, "
+            f"{gruppo['esecuzioni']} esecuzioni, medio {gruppo['medio_ms']:.0f} ms, max {gruppo['max_ms']:.0f} ms"
+        )
+        print(f"     {gruppo['sql']}")
+        print(f"     parametri: {gruppo['parametri']}")
+        if args.explain and gruppo['explain'] is not None:
+            piano = gruppo['explain']
+            righe = piano if isinstance(piano, list) else [piano]
+            for riga in righe:
+                print(f"     explain: {riga}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+# sqlite_backend.py
+#
+# Backend SQLite embedded per installazioni monoutente e per test/benchmark senza server MySQL.
+# Si attiva con DB_BACKEND=sqlite (file in DB_SQLITE_PATH, default 'venditori.db').
+# Le funzioni di db_connection.py restano identiche: le query in dialetto MySQL vengono
+# tradotte qui, con poche regole esplicite, al momento dell'esecuzione.
+
+import re
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+dialetto = "sqlite"
+
+FORMATO_TIMESTAMP = "%Y-%m-%d %H:%M:%S"
+
+# Schema equivalente a quello MySQL, per tabella (stesso ordine di colonne dei backup)
+SCHEMA = {
+    "settori": [
+        """
+        CREATE TABLE IF NOT EXISTS settori (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome VARCHAR(255) UNIQUE NOT NULL
+        )
+        """,
+    ],
+    "venditori": [
+        """
+        CREATE TABLE IF NOT EXISTS venditori (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_cognome VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL UNIQUE COLLATE NOCASE,
+            telefono VARCHAR(20) DEFAULT NULL,
+            citta VARCHAR(100) DEFAULT NULL,
+            esperienza_vendita INT DEFAULT NULL,
+            anno_nascita INT DEFAULT NULL,
+            settore_esperienza VARCHAR(100) DEFAULT NULL,
+            partita_iva TEXT NOT NULL CHECK (partita_iva IN ('Sì', 'No')),
+            data_creazione TIMESTAMP NULL DEFAULT (datetime('now', 'localtime')),
+            cv VARCHAR(255) DEFAULT NULL,
+            note TEXT,
+            agente_isenarco TEXT
+        )
+        """,
+        # Indice full-text a trigrammi sul nome: rende indicizzabile 'LIKE %testo%'
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS venditori_fts USING fts5(
+            nome_cognome, content='venditori', content_rowid='id', tokenize='trigram'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS venditori_fts_ai AFTER INSERT ON venditori BEGIN
+            INSERT INTO venditori_fts (rowid, nome_cognome) VALUES (new.id, new.nome_cognome);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS venditori_fts_ad AFTER DELETE ON venditori BEGIN
+            INSERT INTO venditori_fts (venditori_fts, rowid, nome_cognome) VALUES ('delete', old.id, old.nome_cognome);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS venditori_fts_au AFTER UPDATE OF nome_cognome ON venditori BEGIN
+            INSERT INTO venditori_fts (venditori_fts, rowid, nome_cognome) VALUES ('delete', old.id, old.nome_cognome);
+            INSERT INTO venditori_fts (rowid, nome_cognome) VALUES (new.id, new.nome_cognome);
+        END
+        """,
+    ],
+    "modifiche_venditori": [
+        """
+        CREATE TABLE IF NOT EXISTS modifiche_venditori (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            venditore_id INT NULL,
+            operazione TEXT NOT NULL CHECK (operazione IN ('insert', 'update', 'delete', 'reset')),
+            email VARCHAR(255) NULL,
+            data_modifica TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )
+        """,
+    ],
+    "versione_dati": [
+        """
+        CREATE TABLE IF NOT EXISTS versione_dati (
+            id TINYINT PRIMARY KEY,
+            valore BIGINT NOT NULL
+        )
+        """,
+    ],
+    "richieste_idempotenti": [
+        """
+        CREATE TABLE IF NOT EXISTS richieste_idempotenti (
+            token VARCHAR(100) NOT NULL,
+            chiave VARCHAR(255) NOT NULL,
+            impronta CHAR(64) NOT NULL,
+            stato_http SMALLINT NULL,
+            tipo_contenuto VARCHAR(255) NULL,
+            corpo BLOB NULL,
+            intestazioni TEXT NULL,
+            data_creazione TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+            PRIMARY KEY (token, chiave)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_richieste_idempotenti_data ON richieste_idempotenti (data_creazione)",
+    ],
+}
+
+# Regole di traduzione dal dialetto MySQL usato in db_connection.py (applicate in ordine)
+REGOLE = [
+    # Segnaposto dei parametri
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"^\s*SHOW\s+TABLES\s*$", re.I),
+     "SELECT name FROM pragma_table_list WHERE schema = 'main' AND type = 'table' "
+     "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY name"),
+    (re.compile(r"^\s*TRUNCATE\s+TABLE\s+", re.I), "DELETE FROM "),
+    (re.compile(r"^\s*EXPLAIN\s+(?!QUERY\s+PLAN\b)", re.I), "EXPLAIN QUERY PLAN "),
+    (re.compile(r"\bINSERT\s+IGNORE\s+INTO\b", re.I), "INSERT OR IGNORE INTO"),
+    # Nessun blocco di riga: SQLite serializza già le transazioni di scrittura
+    (re.compile(r"\s+FOR\s+UPDATE\s*$", re.I), ""),
+    # Upsert: ON DUPLICATE KEY UPDATE col = VALUES(col) -> ON CONFLICT DO UPDATE SET col = excluded.col
+    (re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)", re.I), r"excluded.\1"),
+    (re.compile(r"\bNOW\(\)\s*-\s*INTERVAL\s+\?\s+SECOND\b", re.I),
+     "datetime('now', 'localtime', '-' || ? || ' seconds')"),
+    # Ricerca per nome tramite l'indice FTS5 invece della scansione della tabella
+    (re.compile(r"\bnome_cognome\s+LIKE\s+\?", re.I),
+     "id IN (SELECT rowid FROM venditori_fts WHERE nome_cognome LIKE ?)"),
+]
+
+# Le query più lunghe (INSERT multi-riga) non vengono conservate nella cache delle traduzioni
+LUNGHEZZA_MASSIMA_CACHE = 4096
+
+def _traduci(sql):
+    for regola, sostituzione in REGOLE:
+        sql = regola.sub(sostituzione, sql)
+    return sql
+
+_traduci_in_cache = lru_cache(maxsize=512)(_traduci)
+
+def traduci_sql(sql):
+    """
+    Traduce una query dal dialetto MySQL a quello SQLite.
+    """
+    if len(sql) > LUNGHEZZA_MASSIMA_CACHE:
+        return _traduci(sql)
+    return _traduci_in_cache(sql)
+
+def _converti_parametri(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return params
+    return tuple(params)
+
+# Conversioni di tipo: datetime come testo, come in MySQL; i tipi numpy (da pandas) come interi/float
+sqlite3.register_adapter(datetime, lambda valore: valore.strftime(FORMATO_TIMESTAMP))
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(np.bool_, bool)
+
+def _converti_timestamp(valore):
+    testo = valore.decode()
+    try:
+        return datetime.strptime(testo[:19], FORMATO_TIMESTAMP)
+    except ValueError:
+        return testo
+
+sqlite3.register_converter("TIMESTAMP", _converti_timestamp)
+
+class CursoreSQLite:
+    """
+    Cursore con l'interfaccia usata da db_connection.py (come mysql.connector).
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None):
+        return self._cursor.execute(traduci_sql(operation), _converti_parametri(params))
+
+    def executemany(self, operation, seq_params):
+        return self._cursor.executemany(traduci_sql(operation), (_converti_parametri(p) for p in seq_params))
+
+    def execute_sqlite(self, operation):
+        """
+        Esegue un'istruzione già in dialetto SQLite, senza traduzione né parametri (es. gli
+        INSERT di un dump: le regole di traduzione modificherebbero anche il testo delle stringhe).
+        """
+        return self._cursor.execute(operation)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+class ConnessioneSQLite:
+    """
+    Connessione SQLite con l'interfaccia usata da db_connection.py (come mysql.connector).
+    """
+    dialetto = dialetto
+
+    def __init__(self, percorso, istruzioni_in_cache=128):
+        """
+        :param istruzioni_in_cache: Istruzioni preparate conservate da sqlite3 (0 per nessuna).
+        """
+        self.percorso = percorso
+        self._connection = sqlite3.connect(
+            percorso,
+            cached_statements=istruzioni_in_cache,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.create_function("NOW", 0, lambda: datetime.now().strftime(FORMATO_TIMESTAMP))
+        self._connection.create_function("VERSION", 0, lambda: f"SQLite {sqlite3.sqlite_version}")
+        self._aperta = True
+        for tabella in SCHEMA:
+            self.inizializza_tabella(tabella)
+
+    def inizializza_tabella(self, tabella, indici=None):
+        """
+        Crea la tabella indicata (e gli eventuali indici e trigger associati) se non esiste.
+        :param indici: Indici secondari aggiuntivi, dizionario nome -> colonne (come in MySQL).
+        """
+        esistenti = {riga[0] for riga in self._connection.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('venditori', 'venditori_fts')"
+        )}
+        self._crea_oggetti(tabella, indici)
+        if tabella == "venditori" and len(esistenti) < 2:
+            # Allinea l'indice full-text alla tabella (appena creata o ricreata dopo un DROP)
+            self._connection.execute("INSERT INTO venditori_fts (venditori_fts) VALUES ('rebuild')")
+        self._connection.commit()
+
+    def _crea_oggetti(self, tabella, indici=None):
+        for istruzione in SCHEMA[tabella]:
+            self._connection.execute(istruzione)
+        for nome, colonne in (indici or {}).items():
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS {nome} ON {tabella} ({colonne})")
+
+    def crea_tabella_vuota_come(self, tabella, copia):
+        """
+        Crea la tabella copia (eliminandola se esiste) con le colonne e i vincoli di tabella,
+        senza dati, indici secondari né trigger: equivale a CREATE TABLE ... LIKE di MySQL.
+        """
+        record = self._connection.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabella,)
+        ).fetchone()
+        if not record:
+            raise sqlite3.OperationalError(f"no such table: {tabella}")
+        self._connection.execute(f'DROP TABLE IF EXISTS "{copia}"')
+        self._connection.execute(re.sub(
+            r'^CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?("?)\w+\2', f'CREATE TABLE "{copia}"', record[0], count=1, flags=re.I
+        ))
+        self._connection.commit()
+
+    def rinomina_tabelle(self, rinomine, indici=None):
+        """
+        Esegue in un'unica transazione le rinomine indicate, come RENAME TABLE di MySQL: chi
+        legge vede le tabelle prima o dopo, mai a metà. Indici e trigger seguono in SQLite la
+        tabella rinominata: vengono quindi tolti alle tabelle spostate e ricreati su quelle che
+        prendono un nome dello SCHEMA (e l'indice full-text viene ricostruito).
+        :param rinomine: Lista di tuple (nome attuale, nuovo nome), eseguite in ordine.
+        :param indici: Indici secondari per tabella, dizionario tabella -> {nome: colonne}.
+        """
+        self._connection.commit()
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            for tabella in {da for da, _ in rinomine}:
+                oggetti = self._connection.execute(
+                    "SELECT type, name FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+                    (tabella,)
+                ).fetchall()
+                for tipo, nome in oggetti:
+                    self._connection.execute(f'DROP {tipo.upper()} "{nome}"')
+            for da, a in rinomine:
+                self._connection.execute(f'ALTER TABLE "{da}" RENAME TO "{a}"')
+            for tabella in {a for _, a in rinomine} & SCHEMA.keys():
+                self._crea_oggetti(tabella, (indici or {}).get(tabella))
+                if tabella == "venditori":
+                    self._connection.execute("INSERT INTO venditori_fts (venditori_fts) VALUES ('rebuild')")
+            self._connection.commit()
+        except sqlite3.Error:
+            self._connection.rollback()
+            raise
+
+    def cursor(self, *args, **kwargs):
+        # Gli argomenti di mysql.connector (buffered, dictionary...) non servono con SQLite
+        return CursoreSQLite(self._connection.cursor())
+
+    def is_connected(self):
+        return self._aperta
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if not self._aperta:
+            raise sqlite3.ProgrammingError("Connessione SQLite chiusa.")
+
+    def close(self):
+        self._aperta = False
+        self._connection.close()
+
+    def connessione_senza_cache(self):
+        """
+        Nuova connessione allo stesso file che non conserva le istruzioni preparate: per gli
+        INSERT di un dump, che sqlite3 terrebbe in memoria (testo e piano compilato) senza riusarli.
+        """
+        return ConnessioneSQLite(self.percorso, istruzioni_in_cache=0)
+
+    def __getattr__(self, nome):
+        return getattr(self._connection, nome)
+
+def connect(percorso):
+    """
+    Apre (creandolo se serve) il database SQLite nel file indicato, in modalità WAL.
+    """
+    return ConnessioneSQLite(percorso)
@@ -0,0 +1,129 @@
+# verifica_backup.py
+#
+# Verifica di un archivio di backup senza toccare il database: confronta il CSV di ogni tabella
+# con il manifest (righe, colonne, SHA-256) leggendolo a flusso, con memoria costante anche per
+# archivi molto grandi. Usata da restore_database_python prima di svuotare le tabelle e
+# dall'endpoint POST /backup/verify.
+#
+# Esempio:
+#   python verifica_backup.py backup_manual_20250101_120000.zip
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import sys
+import zipfile
+from compressione_backup import NOME_MANIFEST, FORMATO_MANIFEST, tabella_membro, apri_membro
+
+class _LettoreConImpronta(io.RawIOBase):
+    """
+    Flusso in lettura che calcola lo SHA-256 dei byte letti.
+    """
+
+    def __init__(self, flusso):
+        self.flusso = flusso
+        self.impronta = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        dati = self.flusso.read(len(buffer))
+        buffer[:len(dati)] = dati
+        self.impronta.update(dati)
+        return len(dati)
+
+def _leggi_membro(zipf, nome):
+    """
+    Legge a flusso il CSV di una tabella.
+    :return: Tuple (colonne, righe, sha256).
+    """
+    lettore = _LettoreConImpronta(apri_membro(zipf, nome))
+    testo = io.TextIOWrapper(io.BufferedReader(lettore, 1 << 16), encoding="utf-8", newline="")
+    righe_csv = csv.reader(testo)
+    colonne = next(righe_csv, [])
+    righe = sum(1 for _ in righe_csv)
+    # Eventuali byte dopo l'ultima riga contano comunque per l'impronta
+    while lettore.read(1 << 16):
+        pass
+    return colonne, righe, lettore.impronta.hexdigest()
+
+def verifica_archivio(archivio, richiedi_manifest=True, versione_schema=None):
+    """
+    Verifica un archivio di backup rispetto al suo manifest.
+    :param archivio: Contenuto dello ZIP in bytes, percorso del file o file binario aperto.
+    :param richiedi_manifest: Se False, un archivio senza manifest (creato prima della sua
+                              introduzione) è considerato valido ma non verificato.
+    :param versione_schema: Versione dello schema del database corrente: gli archivi di una
+                            versione successiva vengono rifiutati.
+    :return: Tuple (valido: bool, rapporto: dict con 'manifest', 'tabelle' ed 'errori')
+    """
+    if isinstance(archivio, (bytes, bytearray)):
+        archivio = io.BytesIO(archivio)
+    rapporto = {"manifest": None, "tabelle": {}, "errori": []}
+    errori = rapporto["errori"]
+    try:
+        with zipfile.ZipFile(archivio, "r") as zipf:
+            nomi = zipf.namelist()
+            if NOME_MANIFEST not in nomi:
+                if richiedi_manifest:
+                    errori.append("Manifest assente: l'archivio non può essere verificato.")
+                return not errori, rapporto
+            manifest = json.load(zipf.open(NOME_MANIFEST))
+            rapporto["manifest"] = {chiave: valore for chiave, valore in manifest.items() if chiave != "tabelle"}
+            if manifest.get("formato", 0) > FORMATO_MANIFEST:
+                errori.append(f"Formato del manifest {manifest.get('formato')} non supportato da questa versione.")
+                return False, rapporto
+            if versione_schema is not None and manifest.get("versione_schema", 0) > versione_schema:
+                errori.append(
+                    f"Archivio creato con lo schema versione {manifest['versione_schema']}, "
+                    f"più recente di quello del database ({versione_schema})."
+                )
+
+            tabelle = manifest.get("tabelle", {})
+            elencati = {voce["file"] for voce in tabelle.values()}
+            for nome in nomi:
+                if tabella_membro(nome) and nome not in elencati:
+                    errori.append(f"File '{nome}' non elencato nel manifest.")
+            for tabella, voce in tabelle.items():
+                if voce["file"] not in nomi:
+                    errori.append(f"Tabella '{tabella}': file '{voce['file']}' mancante.")
+                    continue
+                colonne, righe, impronta = _leggi_membro(zipf, voce["file"])
+                esito = {"righe": righe, "sha256": impronta, "valida": True}
+                if impronta != voce["sha256"]:
+                    errori.append(f"Tabella '{tabella}': SHA-256 diverso da quello del manifest.")
+                    esito["valida"] = False
+                if voce.get("righe") is not None and righe != voce["righe"]:
+                    errori.append(f"Tabella '{tabella}': {righe} righe invece di {voce['righe']}.")
+                    esito["valida"] = False
+                if voce.get("colonne") and colonne != voce["colonne"]:
+                    errori.append(f"Tabella '{tabella}': colonne diverse da quelle del manifest.")
+                    esito["valida"] = False
+                rapporto["tabelle"][tabella] = esito
+    except Exception as e:
+        errori.append(f"Archivio illeggibile: {e}")
+    return not errori, rapporto
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica archivi di backup senza accedere al database.")
+    parser.add_argument("archivi", nargs="+", help="File ZIP da verificare.")
+    args = parser.parse_args()
+
+    from db_connection import VERSIONE_SCHEMA
+    tutti_validi = True
+    for percorso in args.archivi:
+        valido, rapporto = verifica_archivio(percorso, versione_schema=VERSIONE_SCHEMA)
+        tutti_validi = tutti_validi and valido
+        manifest = rapporto["manifest"] or {}
+        print(f"{percorso}: {'valido' if valido else 'NON VALIDO'} (creato {manifest.get('creato', 'n/d')}, codec {manifest.get('codec', 'n/d')})")
+        for tabella, esito in rapporto["tabelle"].items():
+            print(f"  {tabella:<30} {esito['righe']:>10} righe  {'ok' if esito['valida'] else 'ERRATA'}")
+        for errore in rapporto["errori"]:
+            print(f"  - {errore}")
+    sys.exit(0 if tutti_validi else 1)
+
+if __name__ == "__main__":
+    main()